@@ -2,7 +2,34 @@ import cv2
 import os
 import easyocr
 import re
+import json
+import argparse
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime
+from frame_sampler import FrameSampler
+from writers import ImageWriter
+from timestamps import TimestampResolver, parse_timestamp, format_timestamp
+from ocr_cache import OcrCache, crop_key, MISS
+from metrics import registry, timed_iter, stage_breakdown
+from video_source import open_video
+
+TIMESTAMP_BOUNDING_BOXES = [(70, 1160, 545, 120)]  #  video-1:  80, 1120, 505, 160
+DATETIME_PATTERN = r'\d{2}-\d{2}-\d{4}\s+\d{2}:\d{2}:\d{2}'
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv')  # Add more extensions if needed
+MANIFEST_NAME = 'ocr_manifest.json'
+OCR_ALLOWLIST = '0123456789-: '
+# Recognition-only OCR of the fixed timestamp crop, full readtext only if it fails
+FAST_OCR = True
+FAST_OCR_HEIGHT = 64  # easyocr's recognizer input height
+# OCR a few anchor frames and interpolate the timestamps of the others
+INTERPOLATE_TIMESTAMPS = True
+# Reuse timestamps already read from identical crops (here or by ESW-codes/crop.py)
+USE_OCR_CACHE = True
+OCR_CACHE_VERSION = f"{getattr(easyocr, '__version__', 'unknown')}|{OCR_ALLOWLIST}"
+# Other engines' cache versions whose timestamps are trusted, e.g. {'tesseract': '5.3.0|--psm 12'}
+OCR_CACHE_ALSO_READ = {}
+_ocr_cache = None  # Opened on first use, one per process
 
 def crop_image(frame, bounding_box):
     x, y, w, h = bounding_box
@@ -14,18 +41,139 @@ def crop_image(frame, bounding_box):
     
     return frame[y:y+h, x:x+w]
 
-def extract_timestamp_frames(video_file):
-    cap = cv2.VideoCapture(video_file)
+def preprocess_timestamp(timestamp_region, height=FAST_OCR_HEIGHT):
+    # Grayscale, scale to the recognizer's input height and binarize (Otsu)
+    gray = cv2.cvtColor(timestamp_region, cv2.COLOR_BGR2GRAY) if timestamp_region.ndim == 3 else timestamp_region
+    scale = height / gray.shape[0]
+    gray = cv2.resize(gray, (max(1, int(gray.shape[1] * scale)), height),
+                      interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_CUBIC)
+    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    return binary
+
+def match_timestamp(texts):
+    # Join the recognized pieces and look for text matching the datetime format
+    full_text = ''
+    for text in texts:
+        full_text = full_text + ' ' + text.strip()
+        match = re.search(DATETIME_PATTERN, full_text)
+        if match:
+            return match.group()
+    return None
+
+def get_ocr_cache():
+    global _ocr_cache
+    if _ocr_cache is None and USE_OCR_CACHE:
+        _ocr_cache = OcrCache('easyocr', OCR_CACHE_VERSION, also_read=OCR_CACHE_ALSO_READ)
+    return _ocr_cache
+
+def read_timestamp(reader, timestamp_region, fast=FAST_OCR):
+    cache = get_ocr_cache()
+    mode = 'fast' if fast else 'full'  # A failed read is only reused by the same mode
+    if cache is not None:
+        key = crop_key(timestamp_region)
+        cached = cache.get(key, mode=mode)
+        if cached is not MISS:
+            registry.inc("esw_ocr_total", result="cache_hit")
+            return cached
+
+    timestamp = None
+    if fast:
+        # The crop holds only the timestamp line: skip text detection and
+        # run the recognizer on the whole (preprocessed) crop
+        with registry.time("ocr_recognize"):
+            results = reader.recognize(preprocess_timestamp(timestamp_region), allowlist=OCR_ALLOWLIST)
+        timestamp = match_timestamp(text for (bbox, text, prob) in results)
+        if timestamp is None:
+            print(f"Fast OCR failed ({results}), falling back to readtext")
+        else:
+            registry.inc("esw_ocr_total", result="fast")
+
+    if timestamp is None:
+        # Read text from the timestamp region
+        with registry.time("ocr_readtext"):
+            results = reader.readtext(timestamp_region, allowlist=OCR_ALLOWLIST)
+        print(f"results {results}")
+        timestamp = match_timestamp(text for (bbox, text, prob) in results)
+        registry.inc("esw_ocr_total", result="readtext" if timestamp else "failed")
+
+    if timestamp:
+        print(f"timestamp {timestamp}")
+    if cache is not None:
+        cache.put(key, timestamp, mode=mode)
+    return timestamp
+
+def ocr_frame(reader, frame, fast=FAST_OCR):
+    # OCR the timestamp boxes of one frame, returns the first timestamp found
+    for timestamp_bounding_box in TIMESTAMP_BOUNDING_BOXES:
+        # Crop the region where timestamp is located
+        try:
+            timestamp_region = crop_image(frame, timestamp_bounding_box)
+        except ValueError as e:
+            print(f"Skipping bounding box {timestamp_bounding_box}: {e}")
+            continue
+        # cv2.imshow('timestamp', timestamp_region)
+
+        timestamp = read_timestamp(reader, timestamp_region, fast=fast)
+        if timestamp:
+            return timestamp
+    return None
+
+def timestamp_resolver(video_file, reader, start_frame=0, end_frame=None, fast=FAST_OCR, growing=False,
+                       min_span=None):
+    """
+    TimestampResolver for `video_file` that decodes its anchor frames from
+    a capture of its own, so the caller's sequential reads aren't disturbed.
+    For a file that is still `growing` the end is left open. `min_span`
+    should be the caller's sampling interval: clock jumps are only narrowed
+    down to the frames that will actually be asked for. Returns
+    (resolver, sampler); release sampler.cap when done.
+    """
+    cap = open_video(video_file)
+    sampler = FrameSampler(cap, 1)
+
+    def read_at(frame_index):
+        with registry.time("ocr_decode"):
+            frame = sampler.read(frame_index)
+            if frame is None and growing:
+                # The frame may have arrived since the file was opened
+                sampler.cap.release()
+                sampler.cap = open_video(video_file)
+                sampler.position = 0
+                frame = sampler.read(frame_index)
+        return parse_timestamp(ocr_frame(reader, frame, fast=fast)) if frame is not None else None
+
+    if end_frame is None and sampler.total_frames and not growing:
+        end_frame = sampler.total_frames - 1
+    resolver = TimestampResolver(read_at, sampler.fps, start_frame=start_frame, end_frame=end_frame,
+                                 min_span=min_span)
+    return resolver, sampler
+
+def extract_timestamp_frames(video_file, reader=None, start_frame=0, end_frame=None, fast=FAST_OCR,
+                             interpolate=INTERPOLATE_TIMESTAMPS):
+    """
+    OCR the timestamp of one frame per minute of `video_file` (optionally
+    only of frames start_frame..end_frame) and save the frames by timestamp.
+    Pass a `reader` to reuse an already loaded easyocr.Reader; `fast` skips
+    text detection on the fixed timestamp crop (see read_timestamp).
+    With `interpolate` only a few anchor frames are OCRed and the other
+    timestamps are interpolated (see timestamps.TimestampResolver).
+    Returns one record per processed frame.
+    """
+    records = []
+    cap = open_video(video_file)
     if not cap.isOpened():
         print(f"Error: Could not open video {video_file}.")
-        return
+        return records
 
-    timestamp_bounding_boxes = [(70, 1160, 545, 120)]  #  video-1:  80, 1120, 505, 160
-    reader = easyocr.Reader(['en'])
+    timestamp_bounding_boxes = TIMESTAMP_BOUNDING_BOXES
+    if reader is None:
+        reader = easyocr.Reader(['en'])
     
     frame_rate = cap.get(cv2.CAP_PROP_FPS)  # Get the frame rate of the video
-    frames_per_minute = int(frame_rate * 60)  # Calculate frames per minute
-    frame_count = 0
+    frames_per_minute = max(1, int(frame_rate * 60))  # Calculate frames per minute
+    # Only decode the last frame of every minute (same frames as the old read-every-frame loop)
+    sampler = FrameSampler(cap, frames_per_minute, start_frame=start_frame + frames_per_minute - 1,
+                           end_frame=end_frame)
     
     # Create output directories
     video_name = os.path.splitext(os.path.basename(video_file))[0]
@@ -35,99 +183,182 @@ def extract_timestamp_frames(video_file):
     # Create both directories
     os.makedirs(timestamp_directory, exist_ok=True)
     os.makedirs(no_timestamp_directory, exist_ok=True)
+
+    resolver = anchor_frames = None
+    if interpolate:
+        # Anchors within this shard's sampled frames
+        last_frame = sampler.end_frame - 1 if sampler.end_frame is not None else None
+        resolver, anchor_frames = timestamp_resolver(video_file, reader, start_frame=sampler.start_frame,
+                                                     end_frame=last_frame, fast=fast, min_span=frames_per_minute)
+
+    # Saved frames are encoded and written in the background while we decode and OCR the next one
+    image_writer = ImageWriter()
     
     try:
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                print("Error: Could not read frame.")
-                break
-            
-            frame_count += 1
-            
+        for frame_index, frame in timed_iter(sampler, "decode"):
+            frame_count = frame_index + 1
+
             # Extract frame at desired frame rate (1 frame per minute)
-            if frame_count % frames_per_minute == 0:
-                try:
-                    for timestamp_bounding_box in timestamp_bounding_boxes:
-                        # Crop the region where timestamp is located
-                        try:
-                            timestamp_region = crop_image(frame, timestamp_bounding_box)
-                        except ValueError as e:
-                            print(f"Skipping bounding box {timestamp_bounding_box}: {e}")
-                            continue
-
-                        # Draw a red bounding box on the timestamp region
-                        x, y, w, h = timestamp_bounding_box
-                        cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 0, 255), 2)
-                        # cv2.imshow('timestamp', timestamp_region)
-
-                        # Read text from the timestamp region
-                        results = reader.readtext(timestamp_region, allowlist= '0123456789-: ')
-                        print(f"results {results}")
-                        
-                        timestamp = None
-                        full_text = ''
-                        # Look for text matching datetime format
-                        for (bbox, text, prob) in results:
-                            # Clean the text and look for datetime pattern
-                            text = text.strip()
-                            full_text = full_text + ' ' + text
-                            datetime_pattern = r'\d{2}-\d{2}-\d{4}\s+\d{2}:\d{2}:\d{2}'
-                            match = re.search(datetime_pattern, full_text)
-                            
-                            if match:
-                                timestamp = match.group()
-                                print(f"timestamp {timestamp}")
-                                break
-                        else:
-                            continue
-                        break
-                        
-                    #Show the frame
-                    # cv2.namedWindow("frame", cv2.WINDOW_NORMAL)
-                    # cv2.resizeWindow("frame", 800, 600)
-                    # cv2.imshow("frame", frame)
-                    
-                    if timestamp:
-                        # Save frame with timestamp in timestamp directory
-                        clean_timestamp = timestamp.replace(':', '-').replace(' ', '_')
-                        output_file = f"{timestamp_directory}/{clean_timestamp}.jpg"
-                        cv2.imwrite(output_file, frame)
-                        print(f"Timestamp detected! Frame saved as {output_file}")
-                    else:
-                        # Save frame without timestamp in no_timestamp directory
-                        output_file = f"{no_timestamp_directory}/frame_{frame_count}.jpg"
-                        cv2.imwrite(output_file, frame)
-                        print(f"No timestamp detected. Frame saved as {output_file}")
-                    
-                    # Wait for a key press and exit if 'q' is pressed
-                    if cv2.waitKey(1) & 0xFF == ord('q'):
-                        break
-                except ValueError as e:
-                    print(f"Error: {e}")
-                    continue
+            try:
+                timestamp = None
+                source = "ocr"
+                if resolver is not None:
+                    timestamp = format_timestamp(resolver.timestamp_at(frame_index))
+                    if not resolver.is_anchor(frame_index):
+                        source = "interpolated"
+                if timestamp is None:
+                    # No anchors could be read, OCR this frame itself
+                    source = "ocr"
+                    timestamp = ocr_frame(reader, frame, fast=fast)
+                for x, y, w, h in timestamp_bounding_boxes:
+                    # Draw a red bounding box on the timestamp region
+                    cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 0, 255), 2)
+
+                #Show the frame
+                # cv2.namedWindow("frame", cv2.WINDOW_NORMAL)
+                # cv2.resizeWindow("frame", 800, 600)
+                # cv2.imshow("frame", frame)
+                
+                if timestamp:
+                    # Save frame with timestamp in timestamp directory
+                    clean_timestamp = timestamp.replace(':', '-').replace(' ', '_')
+                    output_file = f"{timestamp_directory}/{clean_timestamp}.jpg"
+                    image_writer.write(output_file, frame)
+                    print(f"Timestamp detected! Frame saved as {output_file}")
+                else:
+                    # Save frame without timestamp in no_timestamp directory
+                    output_file = f"{no_timestamp_directory}/frame_{frame_count}.jpg"
+                    image_writer.write(output_file, frame)
+                    print(f"No timestamp detected. Frame saved as {output_file}")
+
+                records.append({"video": video_file, "frame": frame_count, "timestamp": timestamp,
+                                "source": source, "output_file": output_file})
+
+            except ValueError as e:
+                print(f"Error: {e}")
+                continue
     except KeyboardInterrupt:
         print("Process interrupted by user.")
     finally:
+        image_writer.close()
+
         # Print summary
-        timestamp_count = len(os.listdir(timestamp_directory))
-        no_timestamp_count = len(os.listdir(no_timestamp_directory))
-        print("\nProcessing Complete!")
+        timestamp_count = sum(1 for record in records if record["timestamp"])
+        no_timestamp_count = len(records) - timestamp_count
+        print(f"\nProcessing Complete! ({video_file}, frames {start_frame}-{end_frame or 'end'})")
         print(f"Frames with timestamps: {timestamp_count}")
         print(f"Frames without timestamps: {no_timestamp_count}")
         print(f"Total frames processed: {timestamp_count + no_timestamp_count}")
+        if resolver is not None:
+            print(f"OCR runs: {resolver.ocr_calls}, clock jumps: {resolver.jumps}")
+            anchor_frames.cap.release()
         
         cap.release()
-        cv2.destroyAllWindows()
+    return records
+
+# One resident Reader per pool worker, loaded once by the initializer
+_worker_reader = None
+
+def _init_ocr_worker(threads_per_worker, use_cache=USE_OCR_CACHE):
+    global _worker_reader, USE_OCR_CACHE
+    USE_OCR_CACHE = use_cache
+    if threads_per_worker:
+        import torch
+        torch.set_num_threads(threads_per_worker)
+    _worker_reader = easyocr.Reader(['en'])
 
-def process_videos_in_folder(folder_path):
-    video_extensions = ('.mp4', '.avi', '.mov', '.mkv')  # Add more extensions if needed
-    for filename in os.listdir(folder_path):
-        if filename.lower().endswith(video_extensions):
-            video_file = os.path.join(folder_path, filename)
+def _run_shard(video_file, start_frame, end_frame, fast=FAST_OCR, interpolate=INTERPOLATE_TIMESTAMPS):
+    # (records, this shard's metrics) -- the pool worker's timings go back with its results
+    records = extract_timestamp_frames(video_file, reader=_worker_reader, start_frame=start_frame,
+                                       end_frame=end_frame, fast=fast, interpolate=interpolate)
+    if _ocr_cache is not None:
+        _ocr_cache.flush()  # Pool processes exit without running atexit handlers
+    return records, registry.delta()
+
+def plan_shards(video_file, shard_minutes=None):
+    # Split a video into (video, start_frame, end_frame) ranges of whole minutes
+    if not shard_minutes:
+        return [(video_file, 0, None)]
+    cap = open_video(video_file)
+    frames_per_minute = max(1, int(cap.get(cv2.CAP_PROP_FPS) * 60))
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+    cap.release()
+    if total_frames <= 0:
+        return [(video_file, 0, None)]
+
+    shard_frames = frames_per_minute * shard_minutes
+    return [(video_file, start, min(start + shard_frames, total_frames))
+            for start in range(0, total_frames, shard_frames)]
+
+def write_manifest(records, manifest_path, metrics=None):
+    # Merge the records of all shards into one JSON manifest, ordered by video and frame
+    records = sorted(records, key=lambda record: (record["video"], record["frame"]))
+    videos = {}
+    for record in records:
+        summary = videos.setdefault(record["video"], {"frames": 0, "with_timestamp": 0})
+        summary["frames"] += 1
+        summary["with_timestamp"] += 1 if record["timestamp"] else 0
+    with open(manifest_path, 'w') as f:
+        json.dump({"created_at": datetime.now().isoformat(), "videos": videos, "metrics": metrics,
+                   "frames": records}, f, indent=2)
+    print(f"Manifest written to {manifest_path} ({len(records)} frames from {len(videos)} videos)")
+
+def process_videos_in_folder(folder_path, workers=None, shard_minutes=None, threads_per_worker=2,
+                             manifest_path=MANIFEST_NAME, fast=FAST_OCR, interpolate=INTERPOLATE_TIMESTAMPS):
+    """
+    OCR every video in `folder_path` on a pool of worker processes, each with
+    its own resident easyocr.Reader. With `shard_minutes` long videos are
+    split into time ranges so one video can use several workers.
+    """
+    video_files = [os.path.join(folder_path, filename) for filename in sorted(os.listdir(folder_path))
+                   if filename.lower().endswith(VIDEO_EXTENSIONS)]
+    shards = [shard for video_file in video_files for shard in plan_shards(video_file, shard_minutes)]
+    if workers is None:
+        workers = max(1, (os.cpu_count() or 1) // max(1, threads_per_worker))
+    workers = min(workers, max(1, len(shards)))
+
+    records = []
+    if workers == 1:
+        reader = easyocr.Reader(['en'])
+        for video_file, start_frame, end_frame in shards:
             print(f"Processing video: {video_file}")
-            extract_timestamp_frames(video_file)
+            records += extract_timestamp_frames(video_file, reader=reader, start_frame=start_frame,
+                                                end_frame=end_frame, fast=fast, interpolate=interpolate)
+    else:
+        # spawn: don't fork a process that already has torch loaded
+        with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context('spawn'),
+                                 initializer=_init_ocr_worker, initargs=(threads_per_worker, USE_OCR_CACHE)) as pool:
+            futures = {pool.submit(_run_shard, *shard, fast, interpolate): shard for shard in shards}
+            for future in as_completed(futures):
+                video_file, start_frame, end_frame = futures[future]
+                try:
+                    shard_records, shard_metrics = future.result()
+                    records += shard_records
+                    registry.merge(shard_metrics)
+                except Exception as e:
+                    print(f"Error processing {video_file} frames {start_frame}-{end_frame}: {e}")
+
+    # Where the time went, over all workers
+    breakdown = stage_breakdown(registry.snapshot())
+    for stage, values in sorted(breakdown["stages"].items()):
+        print(f"{stage:14s} {values['count']:6d} calls  {values['total_s']:8.2f} s  {values['mean_ms']:8.2f} ms/call")
+    write_manifest(records, manifest_path, metrics=breakdown)
+    if _ocr_cache is not None:
+        print(f"OCR cache: {_ocr_cache.hits} hits, {_ocr_cache.misses} misses in this process")
+    return records
 
 if __name__ == "__main__":
-    folder_path = "GVP-Video"  # Replace with your folder path
-    process_videos_in_folder(folder_path)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Extract timestamped frames from CCTV videos")
+    parser.add_argument("folder", nargs="?", default="GVP-Video")  # Replace with your folder path
+    parser.add_argument("--workers", type=int, default=None, help="OCR worker processes (default: by CPU count)")
+    parser.add_argument("--shard-minutes", type=int, default=None, help="Split videos into ranges of this many minutes")
+    parser.add_argument("--threads-per-worker", type=int, default=2)
+    parser.add_argument("--full-ocr", action="store_true", help="Always run text detection (readtext)")
+    parser.add_argument("--ocr-every-frame", action="store_true", help="OCR every sampled frame, no interpolation")
+    parser.add_argument("--no-cache", action="store_true", help="Don't read or write the OCR cache")
+    args = parser.parse_args()
+    if args.no_cache:
+        USE_OCR_CACHE = False
+    process_videos_in_folder(args.folder, workers=args.workers, shard_minutes=args.shard_minutes,
+                             threads_per_worker=args.threads_per_worker, fast=not args.full_ocr,
+                             interpolate=not args.ocr_every_frame)
@@ -1,13 +1,24 @@
 import os
 import cv2
-from ultralytics import YOLO
+import numpy as np
 from datetime import datetime
 import requests  # To send data to app.py
 import time
+from frame_sampler import FrameSampler, upload_in_progress
+from pipeline import FramePipeline
+from change_gate import ChangeGate, MIN_OBJECT_AREA, REFRESH_EVERY
+from writers import LabelWriter, ImageWriter
+from regions import load_layout, DEFAULT_CAMERA
+from timestamps import format_timestamp
+from tracker import Tracker
+from metrics import registry, stage_breakdown
+from video_source import open_video, DECODE_BACKEND, DECODE_SCALE
+from frame_ring import SharedMemoryFrames
 
 VIDEO_PATH_CONFIG = '/home/chaitu/Downloads/video_path.txt'
-# Load the YOLOv8 model
-model = YOLO('/home/chaitu/Downloads/best1.pt')  # Path to your YOLOv8 model
+MODEL_PATH = '/home/chaitu/Downloads/best1.pt'  # Path to your YOLOv8 model
+RESULT_URL = 'http://localhost:5000/receive_dirty_data'
+result_session = requests.Session()  # Reuse one connection for all result posts
 
 # Paths
 # video_path = '/home/chaitu/Downloads/hello.mp4'  # Path to the input video
@@ -18,157 +29,258 @@ def get_video_path():
     except FileNotFoundError:
         # Fallback to a default path if config file doesn't exist
         return '/home/chaitu/Downloads/hiv0064.mp4'
-    
-video_path = get_video_path()
-output_folder = '/home/chaitu/Desktop/App/result'  # Path to intermediate result folder
-final_output_folder = '/home/chaitu/Desktop/App/final'  # Path for final processed images
-
-# Create the output folders if they don't exist
-os.makedirs(output_folder, exist_ok=True)
-os.makedirs(final_output_folder, exist_ok=True)
-
-# Open the video file
-cap = cv2.VideoCapture(video_path)
-
-# Get the video frame rate (frames per second)
-fps = cap.get(cv2.CAP_PROP_FPS)
-frame_interval = int(fps * 30)  # Skip 30 seconds of video between frames
-
-frame_count = 0
-
-def load_bounding_boxes(file_path):
-    bounding_boxes = []
-    with open(file_path, 'r') as f:
-        for line in f:
-            data = line.strip().split()
-            if len(data) >= 5:
-                _, x_center, y_center, width, height = map(float, data[:5])
-                bounding_boxes.append((x_center, y_center, width, height))
-    return bounding_boxes
-
-def convert_to_absolute_coords(bounding_boxes, img_width, img_height):
-    absolute_boxes = []
-    for x_center, y_center, width, height in bounding_boxes:
-        x1 = int((x_center - width / 2) * img_width)
-        y1 = int((y_center - height / 2) * img_height)
-        x2 = int((x_center + width / 2) * img_width)
-        y2 = int((y_center + height / 2) * img_height)
-        absolute_boxes.append((x1, y1, x2, y2))
-    return absolute_boxes
-
-def process_image(image, bounding_boxes, output_path, overlap_threshold=0.4):
+
+OUTPUT_FOLDER = '/home/chaitu/Desktop/App/result'  # Path to intermediate result folder
+FINAL_OUTPUT_FOLDER = '/home/chaitu/Desktop/App/final'  # Path for final processed images
+
+SAMPLE_SECONDS = 30  # Skip 30 seconds of video between frames
+
+# Grid, monitored cells and overlap threshold of every camera are in cameras/<camera>.json
+
+# Image output settings
+SAVE_RAW_FRAMES = True  # Also keep the unannotated frame in OUTPUT_FOLDER
+IMAGE_FORMAT = '.jpg'
+JPEG_QUALITY = 95
+WRITER_THREADS = 2
+
+# Tag every result with the camera clock read off the overlay (needs easyocr, see OCR.py)
+RESOLVE_TIMESTAMPS = True
+_ocr_reader = None  # Loaded on first use, then kept for every video
+
+# Inference pipeline settings
+BATCH_SIZE = 8     # Sampled frames per model.predict call
+QUEUE_DEPTH = 32   # Max frames buffered between decode, inference and post-processing
+# Skip inference when the scene hasn't changed since the last inferred frame
+SKIP_UNCHANGED = True
+# Run the model on just the camera's ROI crop at native resolution
+CROP_TO_ROI = True
+MAX_IMGSZ = 1920  # Upper bound on the inference size of a crop
+# Follow detections across frames so each piece of waste is counted once
+TRACK_OBJECTS = True
+# Decode in a separate process into a shared-memory frame ring (frame_ring.py), so decoding
+# gets its own core and frames aren't copied between processes
+DECODE_IN_PROCESS = False
+
+def load_model(model_path=MODEL_PATH):
+    # Load the YOLOv8 model (imported here so process_video also runs with other model objects)
+    from ultralytics import YOLO
+    return YOLO(model_path)
+
+def process_image(image, boxes, output_path, overlap_threshold=None, writer=None, layout=None, on_written=None):
+    # boxes: (N, 4) array of absolute x1, y1, x2, y2 straight from the detector
     img_height, img_width, _ = image.shape
-    absolute_boxes = convert_to_absolute_coords(bounding_boxes, img_width, img_height)
-
-    dirty_count = 0  # Counter for dirty segments
-    rows, cols = 24, 12
-    segment_width = img_width // cols
-    segment_height = img_height // rows
-    
-    for i in range(5,7):
-        for j in range(2,3):
-            x1 = j * segment_width
-            y1 = i * segment_height
-            x2 = x1 + segment_width
-            y2 = y1 + segment_height
-            segment_area = segment_width * segment_height
-
-            intersection_area = 0
-            for bx1, by1, bx2, by2 in absolute_boxes:
-                intersect_x1 = max(x1, bx1)
-                intersect_y1 = max(y1, by1)
-                intersect_x2 = min(x2, bx2)
-                intersect_y2 = min(y2, by2)
-                if intersect_x1 < intersect_x2 and intersect_y1 < intersect_y2:
-                    intersection_area += (intersect_x2 - intersect_x1) * (intersect_y2 - intersect_y1)
-            
-            if intersection_area > overlap_threshold * segment_area:
-                dirty_count += 1
-                color = (0,0,255)    
-            else:
-                color = (0, 255, 0)
-            cv2.rectangle(image, (x1, y1), (x2, y2), color, 2)
-
-    for i in range(4,7):
-        for j in range(3,10):
-            x1 = j * segment_width
-            y1 = i * segment_height
-            x2 = x1 + segment_width
-            y2 = y1 + segment_height
-            segment_area = segment_width * segment_height
-
-            intersection_area = 0
-            for bx1, by1, bx2, by2 in absolute_boxes:
-                intersect_x1 = max(x1, bx1)
-                intersect_y1 = max(y1, by1)
-                intersect_x2 = min(x2, bx2)
-                intersect_y2 = min(y2, by2)
-                if intersect_x1 < intersect_x2 and intersect_y1 < intersect_y2:
-                    intersection_area += (intersect_x2 - intersect_x1) * (intersect_y2 - intersect_y1)
-            
-            if intersection_area > overlap_threshold * segment_area:
-                dirty_count += 1
-                color = (0,0,255)    
-            else:
-                color = (0, 255, 0)
-            cv2.rectangle(image, (x1, y1), (x2, y2), color, 2)
-            
-    cv2.imwrite(output_path, image)
-    return dirty_count
-
-dirty_segments_data = []
-
-
-while cap.isOpened():
-    ret, frame = cap.read()
-    if not ret:
-        break
-
-    if frame_count % frame_interval == 0:
-        frame_name = f"frame_{frame_count}.jpg"
-        frame_path = os.path.join(output_folder, frame_name)
-        cv2.imwrite(frame_path, frame)
-
-        results = model.predict(source=frame, save=False)
-        bounding_boxes = [box.xyxy[0].tolist() for result in results for box in result.boxes]
-
-        txt_filename = os.path.splitext(frame_name)[0] + '.txt'
-        txt_path = os.path.join(output_folder, txt_filename)
-        with open(txt_path, 'w') as f:
-            for box in bounding_boxes:
-                x1, y1, x2, y2 = box
-                x_center = (x1 + x2) / 2 / frame.shape[1]
-                y_center = (y1 + y2) / 2 / frame.shape[0]
-                width = (x2 - x1) / frame.shape[1]
-                height = (y2 - y1) / frame.shape[0]
-                f.write(f"0 {x_center:.6f} {y_center:.6f} {width:.6f} {height:.6f}\n")
-
-        final_image_path = os.path.join(final_output_folder, frame_name)
-        dirty_count = process_image(frame, load_bounding_boxes(txt_path), final_image_path, overlap_threshold=0.4)
-        print(f"Frame {frame_count}: {dirty_count} dirty segments")
-        
-        # Send data in real-time for each processed frame
-        try:
-            response = requests.post(
-                'http://localhost:5000/receive_dirty_data',
-                json={"dirty_segments_data": [{"frame": frame_name, "dirty_segments": dirty_count}]}
-            )
-            print(f"Data sent successfully: {response.status_code} - {response.text}")
-        except Exception as e:
-            print(f"Error sending data: {str(e)}")
-        
-        # Small delay to prevent overwhelming the server
-        time.sleep(0.5)
-
-    frame_count += 1
-
-cap.release()
-
-# try:
-#     response = requests.post(
-#         'http://localhost:5000/receive_dirty_data',
-#         json={"dirty_segments_data": dirty_segments_data}
-#     )
-#     print(f"Data sent successfully: {response.status_code} - {response.text}")
-# except Exception as e:
-#     print(f"Error sending data: {str(e)}")
+    if layout is None:
+        layout = load_layout()
+
+    # Score all monitored cells against all boxes in one go (cells are precomputed per frame size)
+    with registry.time("overlap"):
+        cells, dirty = layout.dirty(boxes, img_width, img_height, overlap_threshold)
+    dirty_count = int(dirty.sum())  # Counter for dirty segments
+
+    for (x1, y1, x2, y2), is_dirty in zip(cells.tolist(), dirty):
+        color = (0, 0, 255) if is_dirty else (0, 255, 0)
+        cv2.rectangle(image, (x1, y1), (x2, y2), color, 2)
+
+    # on_written() runs once the image is saved (frames from a shared ring give back their slot)
+    if writer is not None:
+        writer.write(output_path, image, on_done=on_written)
+    else:
+        with registry.time("image_write"):
+            cv2.imwrite(output_path, image)
+        if on_written is not None:
+            on_written()
+    return dirty_count, dirty
+
+def camera_timestamps(video_path, frame_interval, growing=False):
+    # (resolver, anchor sampler) for the video's overlay clock, None if easyocr isn't installed
+    global _ocr_reader
+    try:
+        import OCR
+    except ImportError as e:
+        print(f"Camera timestamps disabled: {e}")
+        return None
+    if _ocr_reader is None:
+        _ocr_reader = OCR.easyocr.Reader(['en'])
+    return OCR.timestamp_resolver(video_path, _ocr_reader, growing=growing, min_span=frame_interval)
+
+def post_result(result):
+    # Send data in real-time for each processed frame
+    try:
+        response = result_session.post(RESULT_URL, json={"dirty_segments_data": [result]})
+        print(f"Data sent successfully: {response.status_code} - {response.text}")
+    except Exception as e:
+        print(f"Error sending data: {str(e)}")
+
+def process_video(video_path, model, output_folder=OUTPUT_FOLDER, final_output_folder=FINAL_OUTPUT_FOLDER,
+                  sample_seconds=SAMPLE_SECONDS, batch_size=BATCH_SIZE, queue_depth=QUEUE_DEPTH,
+                  overlap_threshold=None, export_labels=False, save_raw_frames=SAVE_RAW_FRAMES,
+                  image_format=IMAGE_FORMAT, jpeg_quality=JPEG_QUALITY, writer_threads=WRITER_THREADS,
+                  resolve_timestamps=RESOLVE_TIMESTAMPS, skip_unchanged=SKIP_UNCHANGED,
+                  min_object_area=MIN_OBJECT_AREA, refresh_every=REFRESH_EVERY,
+                  camera=DEFAULT_CAMERA, crop_to_roi=CROP_TO_ROI, track_objects=TRACK_OBJECTS,
+                  decode_backend=DECODE_BACKEND, decode_scale=DECODE_SCALE, decode_process=DECODE_IN_PROCESS,
+                  on_result=post_result, should_stop=None):
+    # Returns a summary of the run: frames processed and, when tracking, objects seen
+    # Create the output folders if they don't exist
+    os.makedirs(output_folder, exist_ok=True)
+    os.makedirs(final_output_folder, exist_ok=True)
+
+    # Open the video file. An upload still in progress may not have a readable header yet.
+    # decode_backend: 'ffmpeg' (threaded / hardware decode), 'pyav' or 'opencv'; decode_scale < 1
+    # processes smaller frames (the layout is relative, boxes come back at that size), see video_source.py
+    def open_source():
+        return open_video(video_path, backend=decode_backend, scale=decode_scale)
+
+    cap = open_source()
+    while not cap.isOpened() and upload_in_progress(video_path):
+        with registry.time("upload_wait"):
+            time.sleep(2)
+            cap = open_source()
+    if not cap.isOpened():
+        raise IOError(f"Could not open video {video_path}")
+
+    # Get the video frame rate (frames per second)
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    frame_interval = max(1, int(fps * sample_seconds))
+    frame_width, frame_height = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+    # Only the sampled frames are decoded, everything in between is seeked/grabbed past.
+    # Decoding and batched inference run in background threads, results come back in frame order.
+    shared_frames = None
+    if decode_process:
+        # A decoder process fills a shared-memory ring, only slot numbers come back over a queue
+        cap.release()
+        frames = shared_frames = SharedMemoryFrames(video_path, frame_interval, (frame_height, frame_width, 3),
+                                                    backend=decode_backend, scale=decode_scale,
+                                                    growing=upload_in_progress(video_path))
+    elif upload_in_progress(video_path):
+        # Start on the part already uploaded and pick up the rest as it arrives
+        frames = FrameSampler(cap, frame_interval, is_growing=lambda: upload_in_progress(video_path),
+                              reopen=open_source)
+    else:
+        frames = FrameSampler(cap, frame_interval)
+    # Camera layout, compiled once; overlap_threshold=None uses the camera's own threshold
+    layout = load_layout(camera)
+
+    # Only the monitored area goes through the model, at its native resolution
+    crop, predict_kwargs = None, None
+    if crop_to_roi:
+        crop = layout.crop(frame_width, frame_height)
+    if crop is not None:
+        longest_side = max(crop[2] - crop[0], crop[3] - crop[1])
+        predict_kwargs = {"imgsz": min(MAX_IMGSZ, -(-longest_side // 32) * 32)}
+        print(f"Running inference on crop {crop} of camera {camera}")
+
+    # Unchanged scenes reuse the previous frame's detections (and so its dirty count)
+    gate = ChangeGate(min_object_area=min_object_area, refresh_every=refresh_every) if skip_unchanged else None
+    pipeline = FramePipeline(frames, model, batch_size=batch_size, queue_size=queue_depth,
+                             predict_kwargs=predict_kwargs, gate=gate, crop=crop)
+    # Only a few anchor frames are OCRed, all other timestamps are interpolated
+    timestamps = None
+    if resolve_timestamps:
+        timestamps = camera_timestamps(video_path, frame_interval, growing=upload_in_progress(video_path))
+    label_writer = LabelWriter() if export_labels else None
+    # JPEG encoding and disk writes run on a background pool
+    image_writer = ImageWriter(num_threads=writer_threads, image_format=image_format, jpeg_quality=jpeg_quality)
+    tracker = Tracker() if track_objects else None
+    frames_processed, last_frame = 0, None
+    frame = annotated = None
+    # Each result is delivered once the next frame is in, so the last one can carry the
+    # "cleared" events of the objects still tracked when the video ends
+    held_result = None
+
+    def deliver(result):
+        with registry.time("delivery"):
+            on_result(result)
+
+    try:
+        for frame_count, frame, bounding_boxes in pipeline:
+            if should_stop is not None and should_stop():
+                print(f"Stopping {video_path} at frame {frame_count}")
+                break
+            frames_processed += 1
+            last_frame = frame_count
+
+            # Detections -> persistent objects, with new/cleared events
+            events = []
+            if tracker is not None:
+                with registry.time("tracking"):
+                    events = tracker.update(bounding_boxes, frame_count)
+
+            # A frame from the shared ring goes back to the decoder once its last write is done
+            release = None
+            if shared_frames is not None:
+                release = lambda index=frame_count: shared_frames.release(index)
+
+            frame_name = f"frame_{frame_count}.jpg"
+            annotated = frame
+            if save_raw_frames:
+                # The raw frame is queued for writing as it is, draw on a copy
+                annotated = frame.copy()
+                image_writer.write(os.path.join(output_folder, frame_name), frame, on_done=release)
+
+            # YOLO-format label files are only written on request, off the hot path
+            if label_writer is not None:
+                txt_path = os.path.join(output_folder, os.path.splitext(frame_name)[0] + '.txt')
+                label_writer.write(txt_path, bounding_boxes, frame.shape[1], frame.shape[0])
+
+            final_image_path = os.path.join(final_output_folder, frame_name)
+            with registry.time("annotate"):
+                dirty_count, dirty = process_image(annotated, bounding_boxes, final_image_path,
+                                            overlap_threshold=overlap_threshold, writer=image_writer, layout=layout,
+                                            on_written=None if save_raw_frames else release)
+            print(f"Frame {frame_count}: {dirty_count} dirty segments")
+
+            if on_result is not None:
+                result = {"frame": frame_name, "dirty_segments": dirty_count, "frame_index": frame_count,
+                          "camera": camera, "cells": np.packbits(dirty).tobytes().hex()}
+                if timestamps is not None:
+                    # Anchor frames are decoded and OCRed lazily, in here
+                    with registry.time("timestamp"):
+                        result["timestamp"] = format_timestamp(timestamps[0].timestamp_at(frame_count))
+                if tracker is not None:
+                    result["objects"] = len(tracker.active())
+                    result["new_objects"] = sum(1 for event in events if event["event"] == "new")
+                    if events:
+                        result["events"] = events
+                previous, held_result = held_result, result
+                if previous is not None:
+                    deliver(previous)
+    except Exception:
+        if held_result is not None:
+            deliver(held_result)
+        raise
+    finally:
+        pipeline.close()
+        if gate is not None:
+            print(f"Inference ran on {gate.inferred} frames, skipped {gate.skipped} unchanged frames")
+        if shared_frames is None:
+            frames.cap.release()
+        if timestamps is not None:
+            timestamps[1].cap.release()
+        image_writer.close()
+        if label_writer is not None:
+            label_writer.close()
+        if shared_frames is not None:
+            # Every write is done; drop the last views into the ring before freeing it
+            frame = annotated = None
+            shared_frames.close()
+            if shared_frames.decode_stats is not None:
+                print(f"Decoder process: {shared_frames.decode_stats}")
+
+    summary = {"frames_processed": frames_processed}
+    final_events = tracker.finish(last_frame) if tracker is not None else []
+    if held_result is not None:
+        if final_events:
+            held_result.setdefault("events", []).extend(final_events)
+        deliver(held_result)
+    if tracker is not None:
+        summary["objects"] = tracker.total_objects
+        print(f"Tracked {tracker.total_objects} objects over {frames_processed} frames")
+    return summary
+
+if __name__ == "__main__":
+    process_video(get_video_path(), load_model())
+    # Where the time went, per stage
+    for stage, values in sorted(stage_breakdown(registry.snapshot())["stages"].items()):
+        print(f"{stage:14s} {values['count']:6d} calls  {values['total_s']:8.2f} s  {values['mean_ms']:8.2f} ms/call")
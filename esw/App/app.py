@@ -1,18 +1,25 @@
 
 
 import os
-import subprocess
 import logging
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Blueprint, render_template, request, jsonify, Response, stream_with_context
 import random
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
 import requests
+import time
+import json
+import uuid
 import threading
-import queue
-
-app = Flask(__name__)
-CORS(app)  # Enable CORS for all routes
+from datetime import datetime
+import numpy as np
+from scheduler import JobScheduler, FINISHED_STATES
+from uploads import ChunkedUpload, streamable_prefix
+from result_store import ResultStore
+from result_log import ResultLog, to_seconds, from_seconds, BUCKETS, cell_bytes_for
+from regions import max_grid_cells
+from rollups import Rollups
+from metrics import registry
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
@@ -21,34 +28,157 @@ logger = logging.getLogger(__name__)
 # Configure upload folder
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 UPLOAD_FOLDER = os.path.join(BASE_DIR, 'uploads')
+JOBS_FOLDER = os.path.join(BASE_DIR, 'jobs')  # Per-job result/ and final/ image folders
+RESULT_LOG_FOLDER = os.path.join(BASE_DIR, 'result_log')  # Every per-frame result, by day
+ROLLUPS_PATH = os.path.join(BASE_DIR, 'rollups.json')  # Hourly/daily dirty-segment totals per camera
+DASHBOARD_HOURS = 24  # Hour buckets served to the dashboard by default
+DASHBOARD_DAYS = 30
 ALLOWED_EXTENSIONS = {'mp4', 'avi', 'mov'}
 
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-app.config['MAX_CONTENT_LENGTH'] = 300 * 1024 * 1024  # 300MB max file size
+MAX_CONTENT_LENGTH = 300 * 1024 * 1024  # 300MB max file size
+MAX_CHUNKED_UPLOAD_SIZE = 20 * 1024 * 1024 * 1024  # Chunked uploads aren't limited by one request body
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024  # Chunk size suggested to clients
+EARLY_START_BYTES = 16 * 1024 * 1024  # Start processing a streamable upload once this much has arrived
+
+# Inference pool size, by default one worker per THREADS_PER_WORKER cores
+INFERENCE_WORKERS = int(os.environ.get('INFERENCE_WORKERS', 0)) or None
+THREADS_PER_WORKER = int(os.environ.get('THREADS_PER_WORKER', 2))
+
+EXTERNAL_JOB_ID = 'external'  # Results POSTed by a standalone ROI.py run
+STREAM_KEEPALIVE = 15  # seconds between keep-alive comments on an idle stream
+
+# Built by create_app(), not on import: spawned inference workers import this module as __mp_main__
+app = None
+result_store = None  # Per-job result buffers, read by cursor so several viewers never steal each other's data
+result_log = None  # Permanent per-frame history for range and hourly/daily queries
+rollups = None  # Running hourly/daily totals for the dashboard, kept from the result log
+scheduler = None  # Pool of resident ROI processes, each keeps the YOLO model loaded between uploads
+routes = Blueprint('esw', __name__)
+
+def log_result(job_id, result):
+    cells = result.get("cells")
+    dirty = np.unpackbits(np.frombuffer(bytes.fromhex(cells), np.uint8)) if cells else None
+    camera = result.get("camera") or 'default'
+    seconds = to_seconds(result.get("timestamp")) or to_seconds(datetime.now())
+    dirty_count = result.get("dirty_segments", 0)
+    result_log.append(camera, job_id, result.get("frame_index", 0), seconds, dirty_count, dirty)
+
+def store_worker_result(job_id, result):
+    with registry.time("store_result"):
+        result_store.append(job_id, result)
+        log_result(job_id, result)
+
+def store_worker_status(job_id, status):
+    if status.get("state") in FINISHED_STATES:
+        result_store.finish(job_id)
+        with chunked_uploads_lock:
+            upload = chunked_uploads.get(job_id)
+        if upload is not None:
+            upload.mark_job_finished()
+
+def create_app():
+    # Folders, stores, the inference pool and the Flask app; called once by the server process
+    global app, result_store, result_log, rollups, scheduler
+    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+    os.makedirs(JOBS_FOLDER, exist_ok=True)
+    result_store = ResultStore()
+    # The log's cells bitmap is sized for the largest camera grid when it is first created
+    result_log = ResultLog(RESULT_LOG_FOLDER, cell_bytes=cell_bytes_for(max_grid_cells()))
+    # Counted from the log's flushes, after replaying the rows the saved totals don't include
+    rollups = Rollups(ROLLUPS_PATH)
+    rollups.follow(result_log)
+    scheduler = JobScheduler(num_workers=INFERENCE_WORKERS, threads_per_worker=THREADS_PER_WORKER,
+                             on_result=store_worker_result, on_status=store_worker_status)
+
+    app = Flask(__name__)
+    CORS(app)  # Enable CORS for all routes
+    app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+    app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
+    app.register_blueprint(routes)
+    return app
+
+def get_requested_job():
+    # ?job=<id>, or the most recent job when no id is given
+    job_id = request.args.get('job')
+    if job_id:
+        return result_store.get(job_id)
+    return result_store.latest()
+
+# Chunked uploads in progress, by upload id (which is also the job id)
+chunked_uploads = {}
+chunked_uploads_lock = threading.Lock()
+
+def get_chunked_upload(upload_id):
+    with chunked_uploads_lock:
+        upload = chunked_uploads.get(upload_id)
+        resumed = upload is None
+        if resumed:
+            # Resume an upload started before a server restart
+            folder = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(upload_id))
+            metas = [f for f in os.listdir(folder) if f.endswith('.upload.json')] if os.path.isdir(folder) else []
+            if not metas:
+                return None
+            upload = ChunkedUpload.load(os.path.join(folder, metas[0]))
+            chunked_uploads[upload_id] = upload
+    if resumed:
+        resume_chunked_job(upload)
+    return upload
+
+def submit_chunked_job(upload):
+    result_store.create(upload.upload_id)
+    scheduler.submit(upload.path, job_id=upload.upload_id, **job_params(upload.upload_id, upload.camera))
+
+def maybe_start_chunked_job(upload):
+    # Queue the job once the upload is complete, or earlier if the written prefix is decodable
+    with upload.lock:
+        if upload.job_started:
+            return
+        received = upload.received
+        if received < upload.size and (received < EARLY_START_BYTES or not streamable_prefix(upload.path)):
+            return
+        upload.mark_job_started()
+    submit_chunked_job(upload)
+    logger.info(f"Queued job {upload.upload_id} for {upload.path} ({received}/{upload.size} bytes uploaded)")
 
-# Ensure upload directory exists
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+def resume_chunked_job(upload):
+    # A job queued before a server restart was lost with the old process: queue it again
+    with upload.lock:
+        if not upload.job_started or upload.job_finished or scheduler.status(upload.upload_id) is not None:
+            return
+    submit_chunked_job(upload)
+    logger.info(f"Re-queued job {upload.upload_id} for {upload.path} after a restart")
 
-# Thread-safe data storage
-dirty_data_queue = queue.Queue()
+def resume_chunked_uploads():
+    # On startup: reload every chunked upload, which re-queues the jobs that never finished
+    for upload_id in os.listdir(app.config['UPLOAD_FOLDER']):
+        if os.path.isdir(os.path.join(app.config['UPLOAD_FOLDER'], upload_id)):
+            get_chunked_upload(upload_id)
+
+def job_output_folders(job_id):
+    job_folder = os.path.join(JOBS_FOLDER, job_id)
+    return {"output_folder": os.path.join(job_folder, 'result'),
+            "final_output_folder": os.path.join(job_folder, 'final')}
+
+def job_params(job_id, camera=None):
+    # ROI.process_video parameters of a job; the camera picks the layout in App/cameras/
+    params = job_output_folders(job_id)
+    if camera:
+        params["camera"] = secure_filename(camera)
+    return params
 
 def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-@app.route('/')
+@routes.route('/')
 def dashboard():
     return render_template('dashboard.html')
 
-@app.route('/upload', methods=['POST'])
+@routes.route('/upload', methods=['POST'])
 def upload_video():
     try:
         logger.debug("Upload request received")
         
-        # Clear the queue for new data
-        while not dirty_data_queue.empty():
-            dirty_data_queue.get()
-        
         if 'video' not in request.files:
             logger.error("No file part in the request")
             return jsonify({"error": "No file part"}), 400
@@ -61,20 +191,24 @@ def upload_video():
         
         if file and allowed_file(file.filename):
             filename = secure_filename(file.filename)
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+            # Every job gets its own input and output folders, so uploads never overwrite each other
+            job_id = uuid.uuid4().hex
+            job_upload_folder = os.path.join(app.config['UPLOAD_FOLDER'], job_id)
+            os.makedirs(job_upload_folder, exist_ok=True)
+            filepath = os.path.join(job_upload_folder, filename)
             
             file.save(filepath)
             logger.info(f"File saved successfully: {filepath}")
             
-            # Update ROI script with new video path
-            update_roi_script(filepath)
-            
-            # Run ROI script in a separate thread
-            threading.Thread(target=run_roi_script, daemon=True).start()
+            # Queue the video for the inference pool
+            result_store.create(job_id)
+            scheduler.submit(filepath, job_id=job_id, **job_params(job_id, request.form.get('camera')))
+            logger.info(f"Queued job {job_id} for {filepath}")
             
             return jsonify({
                 "message": "Video uploaded and processing started", 
-                "filename": filename
+                "filename": filename,
+                "job_id": job_id
             }), 200
         
         logger.error("File type not allowed")
@@ -84,13 +218,110 @@ def upload_video():
         logger.error(f"Unexpected error in upload: {str(e)}")
         return jsonify({"error": f"Unexpected error: {str(e)}"}), 500
 
-@app.route('/receive_dirty_data', methods=['POST'])
+@routes.route('/uploads', methods=['POST'])
+def start_chunked_upload():
+    # Resumable upload: POST {filename, size}, then PUT the bytes in order to /uploads/<id>?offset=N
+    data = request.get_json(silent=True) or {}
+    filename = secure_filename(data.get('filename', ''))
+    size = data.get('size')
+    if not filename or not allowed_file(filename):
+        return jsonify({"error": "File type not allowed"}), 400
+    if not isinstance(size, int) or size <= 0 or size > MAX_CHUNKED_UPLOAD_SIZE:
+        return jsonify({"error": "Invalid file size"}), 400
+
+    upload_id = uuid.uuid4().hex
+    folder = os.path.join(app.config['UPLOAD_FOLDER'], upload_id)
+    os.makedirs(folder, exist_ok=True)
+    upload = ChunkedUpload.create(upload_id, os.path.join(folder, filename), size, camera=data.get('camera'))
+    with chunked_uploads_lock:
+        chunked_uploads[upload_id] = upload
+    result_store.create(upload_id)  # So viewers can attach before processing starts
+    logger.info(f"Started chunked upload {upload_id} for {filename} ({size} bytes)")
+
+    return jsonify({"upload_id": upload_id, "job_id": upload_id, "chunk_size": UPLOAD_CHUNK_SIZE}), 201
+
+@routes.route('/uploads/<upload_id>', methods=['GET'])
+def get_chunked_upload_status(upload_id):
+    upload = get_chunked_upload(upload_id)
+    if upload is None:
+        return jsonify({"error": "Unknown upload"}), 404
+    return jsonify(upload.info())
+
+@routes.route('/uploads/<upload_id>', methods=['PUT'])
+def put_upload_chunk(upload_id):
+    upload = get_chunked_upload(upload_id)
+    if upload is None:
+        return jsonify({"error": "Unknown upload"}), 404
+
+    offset = request.args.get('offset', type=int)
+    length = request.content_length
+    if offset is None or not length:
+        return jsonify({"error": "offset and a non-empty body are required"}), 400
+
+    try:
+        # The body goes straight from the socket to the file, never fully buffered
+        upload.write_chunk(request.stream, offset, length)
+    except ValueError as e:
+        return jsonify({"error": str(e), "received": upload.received}), 409
+
+    maybe_start_chunked_job(upload)
+    return jsonify(upload.info())
+
+def is_int(value, bits):
+    # A JSON integer that fits the result log's signed `bits`-bit column
+    return isinstance(value, int) and not isinstance(value, bool) and -2 ** (bits - 1) <= value < 2 ** (bits - 1)
+
+def valid_time(value):
+    # A POSTed timestamp that to_seconds() reads as a representable date and time
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        return False
+    try:
+        from_seconds(to_seconds(value))
+    except (TypeError, ValueError, OverflowError):
+        return False
+    return True
+
+def invalid_segment(segment, cell_bytes):
+    # Why a POSTed per-frame result can't be stored, None if it's fine
+    if not isinstance(segment, dict):
+        return "not an object"
+    if "frame" not in segment:
+        return "missing frame"
+    if not is_int(segment.get("dirty_segments"), 32):
+        return "dirty_segments must be an integer"
+    if "frame_index" in segment and not is_int(segment["frame_index"], 64):
+        return "frame_index must be an integer"
+    if segment.get("camera") is not None and not isinstance(segment["camera"], str):
+        return "camera must be a string"
+    timestamp = segment.get("timestamp")
+    if timestamp is not None and not valid_time(timestamp):
+        return "timestamp is not a valid date and time"
+    cells = segment.get("cells")
+    if cells:
+        try:
+            size = len(bytes.fromhex(cells))
+        except (TypeError, ValueError):
+            return "cells must be a hex string"
+        if size > cell_bytes:
+            return f"cells don't fit the result log's {cell_bytes * 8}-cell bitmap"
+    return None
+
+@routes.route('/receive_dirty_data', methods=['POST'])
 def receive_dirty_data():
     try:
-        data = request.json
-        if "dirty_segments_data" in data:
+        data = request.get_json(silent=True)
+        if isinstance(data, dict) and isinstance(data.get("dirty_segments_data"), list):
+            job_id = data.get("job_id", EXTERNAL_JOB_ID)
+            if not isinstance(job_id, str) or not job_id:
+                return jsonify({"error": "job_id must be a non-empty string"}), 400
+            # Check every entry first, so a bad one never reaches the viewers of the job or the log
+            for i, segment in enumerate(data["dirty_segments_data"]):
+                problem = invalid_segment(segment, result_log.cell_bytes)
+                if problem:
+                    return jsonify({"error": f"Invalid entry {i}: {problem}"}), 400
             for segment in data["dirty_segments_data"]:
-                dirty_data_queue.put(segment)
+                result_store.append(job_id, segment)
+                log_result(job_id, segment)
             return jsonify({"message": "Data received successfully"}), 200
         else:
             return jsonify({"error": "Invalid data format"}), 400
@@ -98,45 +329,160 @@ def receive_dirty_data():
         logger.error(f"Error receiving data: {str(e)}")
         return jsonify({"error": f"Error receiving data: {str(e)}"}), 500
 
-@app.route('/dirty_boxes', methods=['GET'])
+@routes.route('/dirty_boxes', methods=['GET'])
 def get_dirty_boxes():
-    dirty_data = []
-    while not dirty_data_queue.empty():
-        dirty_data.append(dirty_data_queue.get())
+    # ?job=<id>&since=<cursor>: only results the caller hasn't seen yet
+    job = get_requested_job()
+    if job is None:
+        return jsonify({"labels": [], "values": [], "next": 0})
+
+    since = request.args.get('since', default=0, type=int)
+    dirty_data, next_cursor = job.read(since)
     
     labels = [entry["frame"] for entry in dirty_data]
     values = [entry["dirty_segments"] for entry in dirty_data]
     
-    return jsonify({"labels": labels, "values": values})
+    return jsonify({"job_id": job.job_id, "labels": labels, "values": values,
+                    "next": next_cursor, "finished": job.finished})
 
-def update_roi_script(video_path):
+def parse_event_id(value):
+    # "<job_id>:<cursor>" as sent in the stream's id: lines, (None, 0) if missing or malformed
+    job_id, _, cursor = (value or '').rpartition(':')
     try:
-        config_dir = os.path.dirname('/home/chaitu/Downloads/video_path.txt')
-        os.makedirs(config_dir, exist_ok=True)
-        
-        with open('/home/chaitu/Downloads/video_path.txt', 'w') as f:
-            f.write(video_path)
-        logger.info(f"Video path written to config: {video_path}")
-    except Exception as e:
-        logger.error(f"Error updating ROI script: {str(e)}")
-        raise
+        cursor = int(cursor)
+    except ValueError:
+        return None, 0
+    if not job_id or cursor < 0:
+        return None, 0
+    return job_id, cursor
 
-def run_roi_script():
-    try:
-        result = subprocess.run(
-            ['python3', '/home/chaitu/Desktop/App/ROI.py'], 
-            capture_output=True, 
-            text=True
-        )
-        
-        logger.info("ROI Script STDOUT: " + result.stdout)
-        logger.error("ROI Script STDERR: " + result.stderr)
-        
-        if result.returncode != 0:
-            logger.error(f"ROI script failed with return code {result.returncode}")
-    
-    except Exception as e:
-        logger.error(f"Error running ROI script: {str(e)}")
+@routes.route('/stream')
+def stream_dirty_boxes():
+    # EventSource sends Last-Event-ID on reconnect, so a dropped stream resumes where it stopped.
+    # That id names its job, so it is only honoured for the same job; ?since= only for the first one.
+    since = request.args.get('since', default=None, type=int)
+    resume_job_id, resume_cursor = parse_event_id(request.headers.get('Last-Event-ID'))
+    job_id = request.args.get('job')
+
+    def start_cursor(job, first):
+        if resume_job_id is not None:
+            return resume_cursor if job.job_id == resume_job_id else 0
+        return (since or 0) if first else 0
+
+    def events():
+        # Flush headers right away and tell the browser how fast to reconnect
+        yield "retry: 3000\n\n"
+        cursor = 0
+        job = None
+        done_sent = False
+        while True:
+            # No job given: follow whatever was uploaded most recently
+            current = result_store.get(job_id) if job_id else result_store.latest()
+            if current is None:
+                if job_id:
+                    yield f"event: error\ndata: {json.dumps({'error': 'Unknown job'})}\n\n"
+                    return
+                yield ": waiting for a job\n\n"
+                time.sleep(1)
+                continue
+            if current is not job:
+                # First job, or a newer upload replaced the one we were following
+                cursor = start_cursor(current, first=job is None)
+                job = current
+                done_sent = False
+                yield f"event: job\ndata: {json.dumps({'job_id': job.job_id})}\n\n"
+
+            if not job.wait(cursor, timeout=STREAM_KEEPALIVE):
+                if job.finished:
+                    if not done_sent:
+                        yield f"event: done\ndata: {json.dumps({'job_id': job.job_id})}\n\n"
+                        done_sent = True
+                    if job_id:
+                        return
+                    time.sleep(1)
+                else:
+                    yield ": keepalive\n\n"
+                continue
+
+            results, next_cursor = job.read(cursor)
+            first = next_cursor - len(results)
+            for offset, result in enumerate(results):
+                payload = dict(result, job_id=job.job_id)
+                # Event id is the job and the cursor to resume from
+                yield f"id: {job.job_id}:{first + offset + 1}\ndata: {json.dumps(payload)}\n\n"
+            cursor = next_cursor
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return Response(stream_with_context(events()), mimetype='text/event-stream', headers=headers)
+
+def requested_time_range():
+    # ?start=&end= as ISO or overlay time (camera clock), default: the last 24 hours
+    end = to_seconds(request.args.get('end')) or to_seconds(datetime.now())
+    start = to_seconds(request.args.get('start')) or end - 86400
+    return start, end
+
+@routes.route('/results', methods=['GET'])
+def query_results():
+    # Raw per-frame rows of a time range, ?camera=&job=&limit=
+    start, end = requested_time_range()
+    rows = result_log.query(start, end, camera=request.args.get('camera'), job=request.args.get('job'),
+                            limit=request.args.get('limit', default=10000, type=int))
+    return jsonify({"rows": rows, "count": len(rows)})
+
+@routes.route('/results/aggregate', methods=['GET'])
+def aggregate_results():
+    # Hourly or daily count/sum/min/max/mean of dirty segments, ?bucket=hour|day&camera=&job=
+    bucket = request.args.get('bucket', 'hour')
+    if bucket not in BUCKETS:
+        return jsonify({"error": "bucket must be hour or day"}), 400
+    start, end = requested_time_range()
+    buckets = result_log.aggregate(start, end, bucket, camera=request.args.get('camera'),
+                                   job=request.args.get('job'))
+    return jsonify({"bucket": bucket, "buckets": buckets})
+
+@routes.route('/rollups', methods=['GET'])
+def get_rollups():
+    # Hourly and daily count/sum/min/max/mean per camera (all cameras combined without ?camera=).
+    # Without ?start= only the latest DASHBOARD_HOURS hours and DASHBOARD_DAYS days are returned.
+    camera = request.args.get('camera')
+    start = to_seconds(request.args.get('start'))
+    end = to_seconds(request.args.get('end'))
+    hours = rollups.series("hour", camera, start, end)
+    days = rollups.series("day", camera, start, end)
+    if start is None:
+        hours, days = hours[-DASHBOARD_HOURS:], days[-DASHBOARD_DAYS:]
+    return jsonify({"camera": camera, "cameras": rollups.cameras(), "hour": hours, "day": days})
+
+@routes.route('/metrics', methods=['GET'])
+def metrics():
+    # Prometheus scrape endpoint: stage latencies of every worker, frame/OCR counters, queue depths
+    scheduler.update_gauges()
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+@routes.route('/jobs', methods=['GET'])
+def list_jobs():
+    return jsonify({"jobs": scheduler.list_jobs()})
+
+@routes.route('/jobs/<job_id>', methods=['GET'])
+def get_job_status(job_id):
+    status = scheduler.status(job_id)
+    if status is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(status)
+
+@routes.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    if scheduler.status(job_id) is None:
+        return jsonify({"error": "Unknown job"}), 404
+    if not scheduler.cancel(job_id):
+        return jsonify({"error": "Job already finished"}), 409
+    return jsonify({"message": "Cancellation requested", "job_id": job_id}), 202
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    create_app()
+    debug = True
+    # With the debug reloader only the child process serves requests
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        scheduler.start()
+        resume_chunked_uploads()
+    app.run(host='0.0.0.0', port=5000, debug=debug)
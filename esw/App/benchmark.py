@@ -0,0 +1,468 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+import cv2
+import numpy as np
+
+from frame_sampler import FrameSampler
+from regions import load_layout, max_grid_cells, DEFAULT_CAMERA
+from result_log import ResultLog, to_seconds, cell_bytes_for
+from result_store import ResultStore
+from rollups import Rollups
+from metrics import registry
+from ocr_cache import OcrCache
+from timestamps import format_timestamp
+from video_source import open_video, DECODE_BACKEND, DECODE_SCALE
+from writers import ImageWriter
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+BENCHMARK_FOLDER = os.path.join(BASE_DIR, 'benchmarks')  # One JSON file per run
+PERCENTILES = (50, 90, 99)
+# Where OCR.py reads the camera clock (TIMESTAMP_BOUNDING_BOXES[0]); OCR.py itself needs easyocr to import
+CLOCK_BOX = (70, 1160, 545, 120)
+
+
+class StageTimer:
+    # Per-stage latency samples in seconds; record() is thread-safe (image writes time themselves)
+
+    def __init__(self):
+        self.samples = {}
+        self.lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        with self.lock:
+            self.samples.setdefault(stage, []).append(seconds)
+
+    def time(self, stage):
+        return _Timed(self, stage)
+
+    def report(self):
+        report = {}
+        for stage, samples in self.samples.items():
+            values = np.asarray(samples) * 1000
+            report[stage] = {"count": len(values), "total_s": round(float(values.sum()) / 1000, 4),
+                             "mean_ms": round(float(values.mean()), 3), "max_ms": round(float(values.max()), 3)}
+            for p in PERCENTILES:
+                report[stage][f"p{p}_ms"] = round(float(np.percentile(values, p)), 3)
+        return report
+
+
+class _Timed:
+    def __init__(self, timer, stage):
+        self.timer = timer
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.timer.record(self.stage, time.perf_counter() - self.start)
+
+
+def draw_clock(frame, text):
+    # Burn the camera clock into CLOCK_BOX, where OCR.py looks for it (bottom left if the frame is too small)
+    x, y, w, h = CLOCK_BOX
+    font, thickness = cv2.FONT_HERSHEY_SIMPLEX, 2
+    if frame.shape[0] < y + h or frame.shape[1] < x + w:
+        x, y, w, h = 10, frame.shape[0] - 60, min(frame.shape[1] - 20, 545), 50
+    (text_width, text_height), _ = cv2.getTextSize(text, font, 1.0, thickness)
+    scale = min(0.9 * w / text_width, 0.6 * h / text_height)
+    origin = (x + int((w - text_width * scale) / 2), y + int((h + text_height * scale) / 2))
+    cv2.putText(frame, text, origin, font, scale, (255, 255, 255), thickness + int(scale))
+
+
+def make_video(path, seconds=60, fps=25, width=2560, height=1440, objects=6, seed=0,
+               start_time=datetime(2024, 1, 1, 8, 0, 0)):
+    """
+    Write a synthetic CCTV-like clip: a textured background, `objects`
+    slowly drifting blobs and the camera clock burnt in where OCR.py reads
+    it (the frame has to be at least 615x1280 for that).
+    """
+    rng = np.random.default_rng(seed)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+    if not writer.isOpened():
+        raise IOError(f"Could not create video {path}")
+    background = cv2.GaussianBlur(rng.integers(60, 160, (height, width, 3), dtype=np.uint8), (0, 0), 3)
+    positions = rng.uniform([0, 0], [width, height], (objects, 2))
+    velocities = rng.uniform(-2, 2, (objects, 2))
+    sizes = rng.uniform(0.02, 0.06, objects) * min(width, height)
+    colours = rng.integers(0, 255, (objects, 3)).tolist()
+    for i in range(int(seconds * fps)):
+        frame = background.copy()
+        positions = (positions + velocities) % [width, height]
+        for (x, y), size, colour in zip(positions, sizes, colours):
+            cv2.circle(frame, (int(x), int(y)), int(size), colour, -1)
+        draw_clock(frame, format_timestamp(start_time + timedelta(seconds=i / fps)))
+        writer.write(frame)
+    writer.release()
+    return path
+
+
+class _Tensor:
+    # Just enough of a torch tensor for FramePipeline (.cpu().numpy())
+    def __init__(self, values):
+        self.values = values
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self.values
+
+
+class _Boxes:
+    def __init__(self, xyxy):
+        self.xyxy = _Tensor(xyxy)
+
+
+class _Result:
+    def __init__(self, xyxy):
+        self.boxes = _Boxes(xyxy)
+
+
+class StubDetector:
+    """
+    Stands in for the YOLO model: predict(source=images) returns
+    `boxes_per_frame` random boxes per image after sleeping `latency`
+    seconds per image, so the rest of the pipeline sees realistic load
+    without a model download.
+    """
+
+    def __init__(self, boxes_per_frame=8, latency=0.02, seed=0):
+        self.boxes_per_frame = boxes_per_frame
+        self.latency = latency
+        self.rng = np.random.default_rng(seed)
+
+    def random_boxes(self, width, height):
+        n = self.rng.poisson(self.boxes_per_frame)
+        centres = self.rng.uniform([0, 0], [width, height], (n, 2))
+        sizes = self.rng.uniform(0.02, 0.15, (n, 2)) * [width, height]
+        boxes = np.hstack([centres - sizes / 2, centres + sizes / 2])
+        return np.clip(boxes, 0, [width, height, width, height]).astype(np.float32)
+
+    def predict(self, source, **kwargs):
+        images = source if isinstance(source, list) else [source]
+        if self.latency:
+            time.sleep(self.latency * len(images))
+        return [_Result(self.random_boxes(image.shape[1], image.shape[0])) for image in images]
+
+
+class TimedImageWriter(ImageWriter):
+    # ImageWriter that records how long each encode + write takes on its threads
+    def __init__(self, timer, **kwargs):
+        self.timer = timer
+        super().__init__(**kwargs)
+
+    def _handle(self, item):
+        with self.timer.time("image_write"):
+            super()._handle(item)
+
+
+class ResultSink:
+    """
+    The server side of result delivery, in process: SSE framing, the
+    per-job ResultStore, the result log and the rollups (in a temporary
+    folder). With a `url` results are POSTed there as ROI.py does instead.
+    """
+
+    def __init__(self, folder, url=None):
+        self.store = ResultStore()
+        self.log = ResultLog(os.path.join(folder, 'result_log'), cell_bytes=cell_bytes_for(max_grid_cells()))
+        self.rollups = Rollups(os.path.join(folder, 'rollups.json'))
+        self.rollups.follow(self.log)
+        self.url = url
+        self.session = None
+        if url:
+            import requests
+            self.session = requests.Session()
+
+    def deliver(self, result):
+        if self.session is not None:
+            self.session.post(self.url, json={"dirty_segments_data": [result]})
+            return
+        seq = self.store.append('benchmark', result)
+        json.dumps(result)  # What /stream sends for it
+        seconds = to_seconds(result.get("timestamp")) or time.time()
+        dirty = np.unpackbits(np.frombuffer(bytes.fromhex(result["cells"]), np.uint8))
+        self.log.append(result["camera"], 'benchmark', result["frame_index"], seconds, result["dirty_segments"], dirty)
+        return seq
+
+    def close(self):
+        self.log.close()
+        self.rollups.close()
+
+
+def load_ocr_reader(work_folder):
+    # easyocr reader with a fresh OCR cache in work_folder, or (None, why not) if OCR can't run here
+    try:
+        import OCR
+    except ImportError as e:
+        return None, f"skipped: {e}"
+    # A warm cache from earlier runs (or real videos) would hide the OCR cost
+    OCR._ocr_cache = OcrCache('easyocr', OCR.OCR_CACHE_VERSION, path=os.path.join(work_folder, 'ocr_cache.sqlite'))
+    return OCR.easyocr.Reader(['en']), None
+
+
+def close_ocr():
+    import OCR
+    OCR._ocr_cache.close()
+    OCR._ocr_cache = None
+
+
+def frame_interval_for(video_path, sample_seconds):
+    cap = cv2.VideoCapture(video_path)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25
+    cap.release()
+    return max(1, int(round(fps * sample_seconds)))
+
+
+def run_stages(video_path, model, work_folder, sample_seconds=1.0, batch_size=8, camera=DEFAULT_CAMERA,
+               writer_threads=2, result_url=None, decode_backend=DECODE_BACKEND, decode_scale=DECODE_SCALE,
+               ocr_reader=None):
+    """
+    Every stage of ROI.process_video one after the other on the same frames,
+    so each stage's latency is measured without the others competing:
+    decode/seek (FrameSampler), inference (per frame, batched), overlap
+    scoring (CameraLayout.dirty), process_image, image writes (raw +
+    annotated frame, timed on the writer threads), camera timestamps (with
+    an `ocr_reader`: anchor decodes and OCR calls as ocr_* stages) and
+    result delivery.
+    """
+    from ROI import process_image
+
+    timer = StageTimer()
+    interval = frame_interval_for(video_path, sample_seconds)
+    cap = open_video(video_path, backend=decode_backend, scale=decode_scale)
+    frames = iter(FrameSampler(cap, interval))
+    timestamps = None
+
+    def record_ocr(stage, seconds):
+        # The other registry stages of process_image are already timed here
+        if stage.startswith("ocr_"):
+            timer.record(stage, seconds)
+
+    if ocr_reader is not None:
+        import OCR
+        timestamps = OCR.timestamp_resolver(video_path, ocr_reader, min_span=interval)
+        registry.stage_listeners.append(record_ocr)
+    layout = load_layout(camera)
+    output = os.path.join(work_folder, 'stage_images')
+    os.makedirs(output, exist_ok=True)
+    writer = TimedImageWriter(timer, num_threads=writer_threads, image_format='.jpg')
+    sink = ResultSink(work_folder, result_url)
+    processed = 0
+    start = time.perf_counter()
+    try:
+        while True:
+            batch = []
+            for _ in range(batch_size):
+                begin = time.perf_counter()
+                item = next(frames, None)
+                if item is None:
+                    break
+                timer.record("decode", time.perf_counter() - begin)
+                batch.append(item)
+            if not batch:
+                break
+
+            begin = time.perf_counter()
+            results = model.predict(source=[frame for _, frame in batch], save=False, verbose=False)
+            per_frame = (time.perf_counter() - begin) / len(batch)
+            for _ in batch:
+                timer.record("inference", per_frame)
+
+            for (frame_index, frame), result in zip(batch, results):
+                boxes = result.boxes.xyxy.cpu().numpy()
+                height, width = frame.shape[:2]
+                with timer.time("overlap"):
+                    layout.dirty(boxes, width, height)
+                writer.write(os.path.join(output, f"raw_{frame_index}.jpg"), frame)
+                # Scoring again plus drawing the grid, as ROI.py does for every frame
+                with timer.time("annotate"):
+                    dirty_count, dirty = process_image(frame.copy(), boxes, os.path.join(output, f"frame_{frame_index}.jpg"),
+                                                       writer=writer, layout=layout)
+                result = {"frame": f"frame_{frame_index}.jpg", "dirty_segments": dirty_count,
+                          "frame_index": frame_index, "camera": camera,
+                          "cells": np.packbits(dirty).tobytes().hex()}
+                if timestamps is not None:
+                    with timer.time("timestamp"):
+                        result["timestamp"] = format_timestamp(timestamps[0].timestamp_at(frame_index))
+                with timer.time("delivery"):
+                    sink.deliver(result)
+                processed += 1
+    finally:
+        cap.release()
+        writer.close()
+        sink.close()
+        if timestamps is not None:
+            registry.stage_listeners.remove(record_ocr)
+            timestamps[1].cap.release()
+    elapsed = time.perf_counter() - start
+    report = {"frames": processed, "seconds": round(elapsed, 3), "fps": round(processed / elapsed, 2) if elapsed else 0,
+              "decoder": cap.stats.report(), "stages": timer.report()}
+    if timestamps is not None:
+        report["ocr_calls"] = timestamps[0].ocr_calls
+    return report
+
+
+def run_pipeline(video_path, model, work_folder, sample_seconds=1.0, batch_size=8, camera=DEFAULT_CAMERA,
+                 writer_threads=2, result_url=None, decode_backend=DECODE_BACKEND, decode_scale=DECODE_SCALE,
+                 skip_unchanged=True, decode_process=False, ocr_reader=None):
+    # ROI.process_video end to end (threaded decode, batched inference, background writes, camera
+    # timestamps with an `ocr_reader`); every stage it times in metrics.registry is sampled into the report
+    import ROI
+
+    if ocr_reader is not None:
+        ROI._ocr_reader = ocr_reader
+    sink = ResultSink(work_folder, result_url)
+    timer = StageTimer()
+    registry.stage_listeners.append(timer.record)
+
+    start = time.perf_counter()
+    try:
+        summary = ROI.process_video(video_path, model, output_folder=os.path.join(work_folder, 'result'),
+                                    final_output_folder=os.path.join(work_folder, 'final'),
+                                    sample_seconds=sample_seconds, batch_size=batch_size,
+                                    writer_threads=writer_threads, resolve_timestamps=ocr_reader is not None, camera=camera,
+                                    skip_unchanged=skip_unchanged, decode_backend=decode_backend,
+                                    decode_scale=decode_scale, decode_process=decode_process,
+                                    on_result=sink.deliver)
+    finally:
+        registry.stage_listeners.remove(timer.record)
+        sink.close()
+    elapsed = time.perf_counter() - start
+    frames = summary["frames_processed"]
+    return {"frames": frames, "seconds": round(elapsed, 3), "fps": round(frames / elapsed, 2) if elapsed else 0,
+            "stages": timer.report()}
+
+
+def peak_rss_mb():
+    # Peak resident set size of this process and its finished children (ru_maxrss is KB on Linux)
+    divisor = 1024 * 1024 if sys.platform == 'darwin' else 1024  # macOS reports bytes
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return round(max(own, children) / divisor, 1)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(previous_path, report):
+    # Print fps and p50 changes against an earlier run's JSON
+    with open(previous_path) as f:
+        previous = json.load(f)
+    print(f"Compared with {previous_path} ({previous.get('commit')}):")
+    for mode in ("stages", "pipeline"):
+        old, new = previous.get(mode), report.get(mode)
+        if not old or not new:
+            continue
+        print(f"  {mode}: {old['fps']} -> {new['fps']} fps ({new['fps'] / max(old['fps'], 1e-9):.2f}x)")
+        for stage, values in new["stages"].items():
+            if stage in old["stages"]:
+                print(f"    {stage:12s} p50 {old['stages'][stage]['p50_ms']:8.2f} -> {values['p50_ms']:8.2f} ms")
+
+
+def print_report(report):
+    if report.get("ocr"):
+        print(f"OCR {report['ocr']}")
+    for mode in ("stages", "pipeline"):
+        if mode not in report:
+            continue
+        run = report[mode]
+        print(f"{mode}: {run['frames']} frames in {run['seconds']} s = {run['fps']} frames/s")
+        if "decoder" in run:
+            print(f"  decoder {run['decoder']['backend']}: {run['decoder']['decode_fps']} frames/s decoded")
+        for stage, values in run["stages"].items():
+            print(f"  {stage:12s} n={values['count']:5d}  p50 {values['p50_ms']:8.2f}  p90 {values['p90_ms']:8.2f}"
+                  f"  p99 {values['p99_ms']:8.2f}  max {values['max_ms']:8.2f} ms")
+    print(f"Peak RSS: {report['peak_rss_mb']} MB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the video -> dirty count pipeline on a synthetic video")
+    parser.add_argument("--video", help="Benchmark this video instead of a generated one")
+    parser.add_argument("--seconds", type=float, default=60, help="Length of the generated video")
+    parser.add_argument("--fps", type=int, default=25)
+    parser.add_argument("--width", type=int, default=2560)
+    parser.add_argument("--height", type=int, default=1440, help="At least 1280 to contain the OCR clock box")
+    parser.add_argument("--sample-seconds", type=float, default=1.0, help="Video time between processed frames")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--writer-threads", type=int, default=2)
+    parser.add_argument("--boxes", type=int, default=8, help="Mean boxes per frame from the stub detector")
+    parser.add_argument("--infer-ms", type=float, default=20, help="Stub detector latency per image")
+    parser.add_argument("--model", help="Benchmark a real YOLO model instead of the stub (needs ultralytics)")
+    parser.add_argument("--camera", default=DEFAULT_CAMERA)
+    parser.add_argument("--decode-backend", choices=("ffmpeg", "pyav", "opencv"), default=DECODE_BACKEND)
+    parser.add_argument("--decode-scale", type=float, default=DECODE_SCALE,
+                        help="Process frames at this fraction of their size (e.g. 0.5)")
+    parser.add_argument("--no-gate", action="store_true", help="Run the model on every frame in pipeline mode")
+    parser.add_argument("--decode-process", action="store_true",
+                        help="Decode in a separate process into the shared-memory frame ring in pipeline mode")
+    parser.add_argument("--no-ocr", action="store_true", help="Don't resolve camera timestamps (skips easyocr)")
+    parser.add_argument("--mode", choices=("stages", "pipeline", "both"), default="both")
+    parser.add_argument("--result-url", help="POST results here (e.g. app.py's /receive_dirty_data) instead of in-process delivery")
+    parser.add_argument("--output", help="Where to save the JSON report (default: benchmarks/<time>.json, not in git)")
+    parser.add_argument("--compare", help="Earlier JSON report to compare against")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    work_folder = tempfile.mkdtemp(prefix='esw_benchmark_')
+    try:
+        video_path = args.video
+        if video_path is None:
+            video_path = os.path.join(work_folder, 'synthetic.mp4')
+            begin = time.perf_counter()
+            make_video(video_path, args.seconds, args.fps, args.width, args.height, seed=args.seed)
+            print(f"Generated {args.seconds:g} s {args.width}x{args.height} video in {time.perf_counter() - begin:.1f} s")
+
+        if args.model:
+            import ROI
+            model = ROI.load_model(args.model)
+        else:
+            model = StubDetector(args.boxes, args.infer_ms / 1000, seed=args.seed)
+
+        report = {"created": datetime.now().isoformat(timespec='seconds'), "commit": git_commit(),
+                  "config": vars(args),
+                  "environment": {"python": platform.python_version(), "opencv": cv2.__version__,
+                                  "numpy": np.__version__, "cpus": os.cpu_count(), "machine": platform.machine()}}
+        ocr_reader, report["ocr"] = (None, "skipped: --no-ocr") if args.no_ocr else load_ocr_reader(work_folder)
+        if ocr_reader is not None:
+            print("Resolving camera timestamps with easyocr")
+        options = dict(sample_seconds=args.sample_seconds, batch_size=args.batch_size, camera=args.camera,
+                       writer_threads=args.writer_threads, result_url=args.result_url,
+                       decode_backend=args.decode_backend, decode_scale=args.decode_scale, ocr_reader=ocr_reader)
+        if args.mode in ("stages", "both"):
+            report["stages"] = run_stages(video_path, model, os.path.join(work_folder, 'stages'), **options)
+        if args.mode in ("pipeline", "both"):
+            report["pipeline"] = run_pipeline(video_path, model, os.path.join(work_folder, 'pipeline'),
+                                              skip_unchanged=not args.no_gate,
+                                              decode_process=args.decode_process, **options)
+        report["peak_rss_mb"] = peak_rss_mb()
+        if ocr_reader is not None:
+            close_ocr()
+    finally:
+        shutil.rmtree(work_folder, ignore_errors=True)
+
+    print_report(report)
+    output = args.output or os.path.join(BENCHMARK_FOLDER, f"{datetime.now():%Y%m%d_%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved {output}")
+    if args.compare:
+        compare(args.compare, report)
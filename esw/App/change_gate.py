@@ -0,0 +1,70 @@
+import math
+
+import cv2
+import numpy as np
+
+MIN_OBJECT_AREA = 100    # Frame pixels; a changed region this big counts as a new scene (count_objects' min_area)
+OBJECT_GATE_PIXELS = 4   # A minimum-size object still spans this many gate pixels across
+PIXEL_DELTA = 25         # Grey-level change that counts a pixel as changed
+REFRESH_EVERY = 10       # Run inference at least every this many sampled frames
+
+
+class ChangeGate:
+    """
+    Cheap "did anything happen?" check in front of the detector, in the
+    spirit of ESW-codes/main3.py's count_objects.
+
+    Each frame is reduced to a blurred greyscale image and compared
+    (absdiff) with the last frame that went through inference. The
+    reduction factor follows from `min_object_area`, so the gate keeps a
+    fixed resolution per object rather than per frame and a large crop is
+    compared at a proportionally larger size. If no connected region of
+    pixels that changed by more than `pixel_delta` covers `min_object_area`
+    frame pixels, the previous detections still hold and inference can be
+    skipped. Every `refresh_every` skipped frames a refresh is forced
+    anyway, so slow changes are picked up.
+    """
+
+    def __init__(self, min_object_area=MIN_OBJECT_AREA, pixel_delta=PIXEL_DELTA, refresh_every=REFRESH_EVERY):
+        self.min_object_area = min_object_area
+        self.pixel_delta = pixel_delta
+        self.refresh_every = refresh_every
+        # Frame pixels per gate pixel along each axis
+        self.factor = max(1, int(math.sqrt(min_object_area) / OBJECT_GATE_PIXELS))
+        self.reference = None  # Signature of the last inferred frame
+        self.pixel_area = 1.0  # Frame pixels covered by one signature pixel
+        self.since_refresh = 0
+        self.inferred = 0
+        self.skipped = 0
+
+    def signature(self, frame):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        height, width = gray.shape
+        size = (max(1, width // self.factor), max(1, height // self.factor))
+        small = cv2.resize(gray, size, interpolation=cv2.INTER_AREA) if self.factor > 1 else gray
+        self.pixel_area = (width / size[0]) * (height / size[1])
+        # Blur away sensor noise and compression artefacts
+        return cv2.GaussianBlur(small, (3, 3), 0)
+
+    def change(self, signature):
+        # Frame pixels covered by the largest connected region that differs from the reference
+        if self.reference is None or self.reference.shape != signature.shape:
+            return math.inf
+        changed = (cv2.absdiff(signature, self.reference) > self.pixel_delta).astype(np.uint8)
+        count, _, stats, _ = cv2.connectedComponentsWithStats(changed, connectivity=8)
+        if count < 2:
+            return 0.0
+        # Label 0 is the unchanged background
+        return float(stats[1:, cv2.CC_STAT_AREA].max()) * self.pixel_area
+
+    def needs_inference(self, frame):
+        # True if the frame has to go through the detector (and becomes the new reference)
+        signature = self.signature(frame)
+        if self.change(signature) >= self.min_object_area or self.since_refresh >= self.refresh_every:
+            self.reference = signature
+            self.since_refresh = 0
+            self.inferred += 1
+            return True
+        self.since_refresh += 1
+        self.skipped += 1
+        return False
@@ -0,0 +1,172 @@
+import multiprocessing as mp
+import queue
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from frame_sampler import FrameSampler, upload_in_progress
+from metrics import registry
+from video_source import open_video, DECODE_BACKEND, DECODE_SCALE
+
+RING_SLOTS = 12  # Frames decoded ahead; each slot holds one full-size BGR frame
+
+
+class FrameRing:
+    """
+    Fixed number of frame slots in one multiprocessing.shared_memory block.
+    The process that creates it owns (and unlinks) the block; others
+    attach() with its spec. Frames are copied in with write() and read
+    back as NumPy views with view(), so only slot numbers and shapes have
+    to be sent between processes.
+    """
+
+    def __init__(self, slots, slot_shape, dtype=np.uint8, name=None):
+        self.slots = slots
+        self.slot_shape = tuple(slot_shape)
+        self.dtype = np.dtype(dtype)
+        size = slots * int(np.prod(self.slot_shape)) * self.dtype.itemsize
+        self.owner = name is None
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner, size=size if self.owner else 0)
+        # Processes started by the owner share its resource tracker, so attaching doesn't
+        # register the block a second time; only the owner unlinks it
+        self.array = np.ndarray((slots,) + self.slot_shape, dtype=self.dtype, buffer=self.shm.buf)
+
+    @property
+    def spec(self):
+        # Everything another process needs to attach()
+        return self.shm.name, self.slots, self.slot_shape, self.dtype.str
+
+    @classmethod
+    def attach(cls, spec):
+        name, slots, slot_shape, dtype = spec
+        return cls(slots, slot_shape, dtype, name=name)
+
+    def write(self, slot, frame):
+        # Copy a frame (up to the slot size) into a slot, returns its shape for view()
+        flat = self.array[slot].reshape(-1)
+        if frame.size > flat.size:
+            raise ValueError(f"Frame of shape {frame.shape} doesn't fit a {self.slot_shape} slot")
+        flat[:frame.size] = frame.reshape(-1)
+        return frame.shape
+
+    def view(self, slot, shape):
+        return self.array[slot].reshape(-1)[:int(np.prod(shape))].reshape(shape)
+
+    def close(self):
+        self.array = None
+        try:
+            self.shm.close()
+        except BufferError:
+            # A frame view is still referenced; the mapping goes away with the last one
+            print("Frame ring closed while a frame view was still in use")
+        if self.owner:
+            self.shm.unlink()
+
+
+def decode_to_ring(spec, video_path, frame_interval, backend, scale, growing, free_slots, ready, stop_event):
+    """
+    Entry point of the decoder process: sample `video_path` with a
+    FrameSampler and put each frame into a free slot of the ring, then send
+    (slot, frame_index, shape) on `ready`. Blocks while every slot is in
+    use. Ends with ("end", decode stats) or ("error", message).
+    """
+    ring = FrameRing.attach(spec)
+    sampler = None
+    try:
+        cap = open_video(video_path, backend=backend, scale=scale)
+        if growing:
+            sampler = FrameSampler(cap, frame_interval, is_growing=lambda: upload_in_progress(video_path),
+                                   reopen=lambda: open_video(video_path, backend=backend, scale=scale))
+        else:
+            sampler = FrameSampler(cap, frame_interval)
+        for frame_index, frame in sampler:
+            slot = None
+            while slot is None:
+                if stop_event.is_set():
+                    return
+                try:
+                    slot = free_slots.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+            shape = ring.write(slot, frame)
+            ready.put((slot, frame_index, shape))
+        ready.put(("end", sampler.cap.stats.report()))
+    except Exception as e:
+        ready.put(("error", str(e)))
+    finally:
+        if sampler is not None:
+            sampler.cap.release()
+        ring.close()
+
+
+class SharedMemoryFrames:
+    """
+    Iterable of (frame_index, frame) like FrameSampler, but decoded by a
+    separate process into a FrameRing, so decoding runs on its own core and
+    frames never get pickled. The frames are views into shared memory:
+    call release(frame_index) once nothing uses a frame any more, which
+    hands its slot back to the decoder. At most `slots` frames are out at
+    once; the decoder waits for a release when the ring is full.
+    """
+
+    def __init__(self, video_path, frame_interval, frame_shape, slots=RING_SLOTS, backend=DECODE_BACKEND,
+                 scale=DECODE_SCALE, growing=False):
+        self.ring = FrameRing(slots, frame_shape)
+        ctx = mp.get_context('spawn')
+        self.free_slots = ctx.Queue()
+        for slot in range(slots):
+            self.free_slots.put(slot)
+        self.ready = ctx.Queue()
+        self.stop_event = ctx.Event()
+        self.process = ctx.Process(target=decode_to_ring,
+                                   args=(self.ring.spec, video_path, frame_interval, backend, scale, growing,
+                                         self.free_slots, self.ready, self.stop_event),
+                                   daemon=True)
+        self.slot_of = {}  # frame_index -> slot, for frames handed out and not yet released
+        self.decode_stats = None
+
+    def __iter__(self):
+        if self.process.pid is None:
+            self.process.start()
+        while not self.stop_event.is_set():
+            try:
+                item = self.ready.get(timeout=0.1)
+            except queue.Empty:
+                if not self.process.is_alive():
+                    raise IOError(f"Decoder process exited with code {self.process.exitcode}")
+                continue
+            if item[0] == "end":
+                self.decode_stats = item[1]
+                return
+            if item[0] == "error":
+                raise IOError(f"Decoder process failed: {item[1]}")
+            slot, frame_index, shape = item
+            self.slot_of[frame_index] = slot
+            registry.set("esw_queue_depth", len(self.slot_of), queue="frame_ring")
+            yield frame_index, self.ring.view(slot, shape)
+
+    def stop(self):
+        # Called by FramePipeline.close(): ends iteration and the decoder, even while the ring is full
+        self.stop_event.set()
+
+    def release(self, frame_index):
+        slot = self.slot_of.pop(frame_index, None)
+        if slot is not None:
+            self.free_slots.put(slot)
+
+    def close(self):
+        # Call once no frame view is used any more: stops the decoder and frees the shared memory
+        self.stop()
+        if self.process.pid is not None:
+            # The decoder can't exit while what it sent is still stuck in the pipe
+            deadline = time.monotonic() + 10
+            while self.process.is_alive() and time.monotonic() < deadline:
+                try:
+                    self.ready.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            if self.process.is_alive():
+                self.process.terminate()
+            self.process.join()
+        self.ring.close()
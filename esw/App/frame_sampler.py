@@ -0,0 +1,143 @@
+import os
+import time
+
+import cv2
+
+from metrics import registry
+
+# Marker file that sits next to a video while it is still being uploaded
+UPLOADING_SUFFIX = '.uploading'
+
+# If the next sampled frame is at most this many frames ahead, grabbing forward
+# is cheaper than a seek (a seek decodes again from the previous keyframe anyway)
+DEFAULT_MAX_GRAB_GAP = 90
+
+
+class FrameSampler:
+    """
+    Yields (frame_index, frame) for every `frame_interval`-th frame of an open
+    cv2.VideoCapture, decoding only the frames that are actually returned.
+
+    Far-away targets are reached by seeking (CAP_PROP_POS_MSEC) followed by
+    grab() + retrieve(). Near targets are reached by grab() without retrieve(),
+    which skips the colour conversion and copy of the frames in between.
+    If a seek lands on the wrong frame (codecs/containers with an inaccurate
+    index) the sampler switches to grab-only mode for the rest of the video.
+
+    For a file that is still being written, pass `is_growing` (returns True
+    while more data may arrive) and `reopen` (returns a fresh VideoCapture).
+    At the current end of the file the sampler then waits, reopens the file
+    and carries on from the next target frame.
+    """
+
+    def __init__(self, cap, frame_interval, start_frame=0, end_frame=None,
+                 max_grab_gap=DEFAULT_MAX_GRAB_GAP, allow_seek=True,
+                 is_growing=None, reopen=None, poll_interval=2.0):
+        if frame_interval < 1:
+            raise ValueError("frame_interval must be at least 1")
+        self.cap = cap
+        self.frame_interval = int(frame_interval)
+        self.start_frame = int(start_frame)
+        self.max_grab_gap = max_grab_gap
+        self.seek_enabled = allow_seek
+        self.is_growing = is_growing
+        self.reopen = reopen
+        self.poll_interval = poll_interval
+
+        self.fps = cap.get(cv2.CAP_PROP_FPS) or 0
+        total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+        # The frame count of a partial file isn't final
+        self.total_frames = total if total > 0 and is_growing is None else None
+        if end_frame is None:
+            end_frame = self.total_frames
+        elif self.total_frames is not None:
+            end_frame = min(end_frame, self.total_frames)
+        self.end_frame = end_frame
+
+        # Index of the frame the next grab() will return
+        self.position = 0
+        self.final_read = False  # Whether the file was reopened once more after it stopped growing
+        self.seeks = 0
+        self.grabs = 0
+
+    def __iter__(self):
+        target = self.start_frame
+        while self.end_frame is None or target < self.end_frame:
+            frame = self._read_at(target)
+            if frame is None:
+                if not self._wait_for_more():
+                    break
+                continue
+            yield target, frame
+            target += self.frame_interval
+
+    def read(self, frame_index):
+        # Decode one frame by index (random access), None past the end
+        return self._read_at(frame_index)
+
+    def _wait_for_more(self):
+        # At the end of a file that is still growing: wait, then reopen it
+        if self.is_growing is None or self.reopen is None:
+            return False
+        if self.is_growing():
+            with registry.time("upload_wait"):
+                time.sleep(self.poll_interval)
+        elif self.final_read:
+            return False
+        else:
+            # The last chunk may have landed after the failed read: read what's there now, once
+            self.final_read = True
+        self.cap.release()
+        self.cap = self.reopen()
+        self.position = 0
+        return True
+
+    def _seek(self, target):
+        if self.fps > 0:
+            ok = self.cap.set(cv2.CAP_PROP_POS_MSEC, target * 1000.0 / self.fps)
+        else:
+            ok = self.cap.set(cv2.CAP_PROP_POS_FRAMES, target)
+        self.seeks += 1
+        landed = int(round(self.cap.get(cv2.CAP_PROP_POS_FRAMES))) if ok else -1
+        if landed == target:
+            self.position = target
+            return True
+
+        # Inaccurate or unsupported seek: fall back to sequential grabbing
+        self.seek_enabled = False
+        if landed < 0 or landed > target:
+            # Can't grab backwards, rewind to the start and grab forward
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            landed = 0
+        self.position = landed
+        return False
+
+    def _read_at(self, target):
+        gap = target - self.position
+        if gap < 0 or (gap > self.max_grab_gap and self.seek_enabled):
+            self._seek(target)
+
+        while self.position < target:
+            if not self.cap.grab():
+                return None
+            self.grabs += 1
+            self.position += 1
+
+        if not self.cap.grab():
+            return None
+        self.grabs += 1
+        self.position += 1
+        ret, frame = self.cap.retrieve()
+        if not ret:
+            return None
+        return frame
+
+
+def upload_in_progress(video_path, stall_timeout=300):
+    # True while the video is being uploaded and its data is still changing
+    if not os.path.exists(video_path + UPLOADING_SUFFIX):
+        return False
+    try:
+        return time.time() - os.path.getmtime(video_path) < stall_timeout
+    except OSError:
+        return False
@@ -0,0 +1,131 @@
+import collections
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import requests
+from requests.adapters import HTTPAdapter
+
+LOCAL_INFERENCE_URL = 'http://localhost:9001/infer'  # inference_server.py
+MAX_IN_FLIGHT = 4  # Concurrent requests per backend
+JPEG_QUALITY = 90
+
+logger = logging.getLogger(__name__)
+
+
+def encode_jpeg(frame, quality=JPEG_QUALITY):
+    # Frame -> JPEG bytes in memory
+    ok, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, int(quality)])
+    if not ok:
+        raise ValueError("Could not encode frame as JPEG")
+    return buffer.tobytes()
+
+
+class InferenceBackend:
+    """
+    Object detection behind a Roboflow-style response:
+    {"image": {"width", "height"}, "predictions": [{"x", "y", "width",
+    "height", "confidence", "class", "class_id"}, ...]} with x/y the box
+    centre in pixels.
+    """
+
+    def infer(self, frame):
+        raise NotImplementedError
+
+    def infer_many(self, frames, max_in_flight=None):
+        # Yield (item, result) for (item, frame) pairs in order, keeping up to max_in_flight requests running
+        max_in_flight = max_in_flight or getattr(self, 'max_in_flight', 1)
+        with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+            pending = collections.deque()
+            for item, frame in frames:
+                pending.append((item, pool.submit(self.infer, frame)))
+                if len(pending) >= max_in_flight:
+                    item, future = pending.popleft()
+                    yield item, future.result()
+            while pending:
+                item, future = pending.popleft()
+                yield item, future.result()
+
+    def close(self):
+        pass
+
+
+class HttpBackend(InferenceBackend):
+    """
+    Client of inference_server.py (or anything serving the same schema).
+    Frames are JPEG-encoded in memory and POSTed as the request body over
+    a pooled keep-alive session.
+    """
+
+    def __init__(self, url=LOCAL_INFERENCE_URL, max_in_flight=MAX_IN_FLIGHT, jpeg_quality=JPEG_QUALITY,
+                 confidence=None, timeout=60):
+        self.url = url
+        self.max_in_flight = max_in_flight
+        self.jpeg_quality = jpeg_quality
+        self.confidence = confidence
+        self.timeout = timeout
+        self.session = requests.Session()
+        # One pooled connection per in-flight request
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_in_flight)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def infer(self, frame):
+        params = {"confidence": self.confidence} if self.confidence is not None else None
+        response = self.session.post(self.url, data=encode_jpeg(frame, self.jpeg_quality), params=params,
+                                     headers={"Content-Type": "image/jpeg"}, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def close(self):
+        self.session.close()
+
+
+class RoboflowBackend(InferenceBackend):
+    # Hosted Roboflow model; inference_sdk takes the numpy frame directly, no temp file
+    def __init__(self, model_id, api_key, api_url="https://detect.roboflow.com", max_in_flight=MAX_IN_FLIGHT):
+        from inference_sdk import InferenceHTTPClient
+        self.client = InferenceHTTPClient(api_url=api_url, api_key=api_key)
+        self.model_id = model_id
+        self.max_in_flight = max_in_flight
+
+    def infer(self, frame):
+        return self.client.infer(frame, model_id=self.model_id)
+
+
+class FallbackBackend(InferenceBackend):
+    """
+    The primary backend until it can't be reached (e.g. inference_server.py
+    is not running), then the fallback for the rest of the run. The
+    fallback is built on first use by make_fallback, so its dependencies
+    are only needed when it is. Errors other than connection failures are
+    raised as usual.
+    """
+
+    def __init__(self, primary, make_fallback):
+        self.primary = primary
+        self.make_fallback = make_fallback
+        self.fallback = None
+        self.max_in_flight = primary.max_in_flight
+        self.lock = threading.Lock()
+
+    def infer(self, frame):
+        if self.fallback is None:
+            try:
+                return self.primary.infer(frame)
+            except requests.ConnectionError as e:
+                self._switch(e)
+        return self.fallback.infer(frame)
+
+    def _switch(self, error):
+        # Concurrent requests fail together; only the first one builds the fallback
+        with self.lock:
+            if self.fallback is None:
+                logger.warning(f"Inference backend unreachable ({error}), switching to the fallback")
+                self.fallback = self.make_fallback()
+
+    def close(self):
+        self.primary.close()
+        if self.fallback is not None:
+            self.fallback.close()
@@ -0,0 +1,113 @@
+import argparse
+import queue
+import threading
+import time
+import uuid
+
+import cv2
+import numpy as np
+from flask import Flask, request, jsonify
+
+MODEL_PATH = '/home/chaitu/Downloads/best1.pt'  # Path to your YOLOv8 model
+DEFAULT_PORT = 9001
+MAX_BATCH = 8         # Concurrent requests run through the model together
+BATCH_WAIT = 0.005    # Seconds to wait for more requests to join a batch
+
+app = Flask(__name__)
+model = None
+batcher = None
+
+
+def load_model(model_path=MODEL_PATH):
+    from ultralytics import YOLO
+    return YOLO(model_path)
+
+
+class Batcher:
+    """
+    Runs all predict calls on one thread. Requests that arrive while the
+    model is busy (or within BATCH_WAIT) are stacked into one
+    model.predict call, so concurrent clients share the GPU/CPU work.
+    """
+
+    def __init__(self, model, max_batch=MAX_BATCH, batch_wait=BATCH_WAIT):
+        self.model = model
+        self.max_batch = max_batch
+        self.batch_wait = batch_wait
+        self.queue = queue.Queue()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def predict(self, frame):
+        # Blocks until the frame's result is ready
+        job = {"frame": frame, "done": threading.Event()}
+        self.queue.put(job)
+        job["done"].wait()
+        if "error" in job:
+            raise job["error"]
+        return job["result"]
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.batch_wait
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self.queue.get(timeout=max(0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            try:
+                results = self.model.predict([job["frame"] for job in batch], save=False, verbose=False)
+                for job, result in zip(batch, results):
+                    job["result"] = result
+            except Exception as e:
+                for job in batch:
+                    job["error"] = e
+            for job in batch:
+                job["done"].set()
+
+
+def roboflow_predictions(result, confidence=0.0):
+    # ultralytics Result -> Roboflow-style prediction dicts (box centre, size, class)
+    boxes = result.boxes
+    xywh = boxes.xywh.cpu().numpy()
+    conf = boxes.conf.cpu().numpy()
+    cls = boxes.cls.cpu().numpy().astype(int)
+    predictions = []
+    for (x, y, w, h), score, class_id in zip(xywh, conf, cls):
+        if score < confidence:
+            continue
+        predictions.append({"x": float(x), "y": float(y), "width": float(w), "height": float(h),
+                            "confidence": float(score), "class": result.names.get(class_id, str(class_id)),
+                            "class_id": int(class_id), "detection_id": uuid.uuid4().hex})
+    return predictions
+
+
+@app.route('/infer', methods=['POST'])
+def infer():
+    # Body: encoded image bytes (or a multipart 'file'), ?confidence= to filter
+    data = request.files['file'].read() if 'file' in request.files else request.get_data()
+    frame = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    if frame is None:
+        return jsonify({"error": "Could not decode image"}), 400
+    confidence = float(request.args.get('confidence', 0.0))
+
+    start = time.perf_counter()
+    result = batcher.predict(frame)
+    return jsonify({"time": time.perf_counter() - start,
+                    "image": {"width": frame.shape[1], "height": frame.shape[0]},
+                    "predictions": roboflow_predictions(result, confidence)})
+
+
+@app.route('/health')
+def health():
+    return jsonify({"status": "ok", "model_loaded": model is not None})
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Local YOLO server with a Roboflow-compatible response")
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    args = parser.parse_args()
+    model = load_model(args.model)
+    batcher = Batcher(model)
+    app.run(host='0.0.0.0', port=args.port, threaded=True)
@@ -0,0 +1,185 @@
+import bisect
+import threading
+import time
+
+# Upper bounds (seconds) of the stage latency histogram buckets
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+STAGE_METRIC = "esw_stage_seconds"
+
+HELP = {
+    STAGE_METRIC: ("histogram", "Time spent per call in each processing stage"),
+    "esw_frames_total": ("counter", "Sampled frames, by what happened to them"),
+    "esw_ocr_total": ("counter", "Timestamp reads, by outcome"),
+    "esw_results_total": ("counter", "Per-frame results received from the workers"),
+    "esw_queue_depth": ("gauge", "Items waiting in a queue when last sampled"),
+    "esw_jobs": ("gauge", "Jobs by state"),
+    "esw_workers_ready": ("gauge", "Inference workers with the model loaded"),
+    "esw_decode_fps": ("gauge", "Frames per second decoded by the last video closed, by backend"),
+}
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+class Metrics:
+    """
+    In-process counters, gauges and latency histograms, cheap enough to
+    leave on: an update is a dict lookup and a few additions under a lock.
+
+    Worker processes send delta() over their event queue and the parent
+    merge()s it, so the parent's render() (Prometheus text format) covers
+    every process. Series are keyed by (name, sorted label items).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}  # key -> [bucket counts..., +Inf count, sum]
+        self.sent = {"counters": {}, "histograms": {}}  # Totals already handed out by delta()
+        self.stage_listeners = []  # Called with (stage, seconds) for every stage timing, e.g. by benchmark.py
+
+    def inc(self, name, value=1, **labels):
+        key = _key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self.lock:
+            self.gauges[_key(name, labels)] = value
+
+    def observe(self, name, seconds, **labels):
+        key = _key(name, labels)
+        index = bisect.bisect_left(LATENCY_BUCKETS, seconds)
+        with self.lock:
+            values = self.histograms.get(key)
+            if values is None:
+                values = self.histograms[key] = [0] * (len(LATENCY_BUCKETS) + 2)
+            values[index] += 1
+            values[-1] += seconds
+
+    def time(self, stage):
+        # with metrics.time("decode"): ...  -> one esw_stage_seconds{stage="decode"} observation
+        return _StageTimer(self, stage)
+
+    def observe_stage(self, stage, seconds):
+        self.observe(STAGE_METRIC, seconds, stage=stage)
+        for listener in self.stage_listeners:
+            listener(stage, seconds)
+
+    def snapshot(self):
+        with self.lock:
+            return {"counters": dict(self.counters), "gauges": dict(self.gauges),
+                    "histograms": {key: list(values) for key, values in self.histograms.items()}}
+
+    def delta(self):
+        # What changed since the last delta() (gauges: current values), to send to another process
+        with self.lock:
+            counters = {key: value - self.sent["counters"].get(key, 0) for key, value in self.counters.items()
+                        if value != self.sent["counters"].get(key, 0)}
+            histograms = {}
+            for key, values in self.histograms.items():
+                sent = self.sent["histograms"].get(key)
+                if sent is None:
+                    histograms[key] = list(values)
+                elif sent != values:
+                    histograms[key] = [a - b for a, b in zip(values, sent)]
+            self.sent = {"counters": dict(self.counters),
+                         "histograms": {key: list(values) for key, values in self.histograms.items()}}
+            return {"counters": counters, "gauges": dict(self.gauges), "histograms": histograms}
+
+    def merge(self, delta, **gauge_labels):
+        # Add a delta() from another process; its gauges get `gauge_labels` (e.g. worker=...) added
+        with self.lock:
+            for key, value in delta["counters"].items():
+                self.counters[key] = self.counters.get(key, 0) + value
+            for (name, labels), value in delta["gauges"].items():
+                self.gauges[_key(name, dict(labels, **gauge_labels))] = value
+            for key, values in delta["histograms"].items():
+                current = self.histograms.get(key)
+                self.histograms[key] = list(values) if current is None else [a + b for a, b in zip(current, values)]
+
+    def render(self):
+        # Prometheus text exposition format
+        snapshot = self.snapshot()
+        series = {}
+        for kind in ("counters", "gauges", "histograms"):
+            for (name, labels), values in snapshot[kind].items():
+                series.setdefault(name, []).append((labels, values))
+
+        lines = []
+        for name in sorted(series):
+            kind, text = HELP.get(name, ("untyped", name))
+            lines.append(f"# HELP {name} {text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, values in sorted(series[name]):
+                if kind != "histogram":
+                    lines.append(f"{name}{_labels(labels)} {values}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), values[:-1]):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(labels + (('le', str(bound)),))} {cumulative}")
+                lines.append(f"{name}_sum{_labels(labels)} {values[-1]:.6f}")
+                lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+
+class _StageTimer:
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe_stage(self.stage, time.perf_counter() - self.start)
+
+
+def timed_iter(iterable, stage, metrics=None):
+    # Yield from `iterable`, recording how long each next() took (e.g. decoding a frame)
+    metrics = metrics or registry
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        metrics.observe_stage(stage, time.perf_counter() - start)
+        yield item
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + "}"
+
+
+def stage_breakdown(delta, breakdown=None):
+    """
+    Fold the esw_stage_seconds histograms and the counters of a delta()
+    into a per-job summary: {"stages": {stage: {count, total_s, mean_ms}},
+    "counters": {"name{label=value}": n}}.
+    """
+    breakdown = breakdown if breakdown is not None else {"stages": {}, "counters": {}}
+    for (name, labels), values in delta["histograms"].items():
+        if name != STAGE_METRIC:
+            continue
+        stage = dict(labels).get("stage")
+        entry = breakdown["stages"].setdefault(stage, {"count": 0, "total_s": 0.0})
+        entry["count"] += sum(values[:-1])
+        entry["total_s"] = round(entry["total_s"] + values[-1], 6)
+        entry["mean_ms"] = round(entry["total_s"] * 1000 / entry["count"], 3) if entry["count"] else 0
+    for (name, labels), value in delta["counters"].items():
+        label = name + _labels(labels)
+        breakdown["counters"][label] = breakdown["counters"].get(label, 0) + value
+    return breakdown
+
+
+# The process's own registry; every module records into this one
+registry = Metrics()
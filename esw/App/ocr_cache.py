@@ -0,0 +1,166 @@
+import atexit
+import collections
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import cv2
+import numpy as np
+
+# Shared by App/OCR.py and ESW-codes/crop.py
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'esw_ocr_cache.sqlite')
+KEY_HEIGHT = 32  # Crops are reduced to this height before hashing
+
+MISS = object()  # get() result for a crop that was never OCRed
+COMMIT_EVERY = 64  # Buffered writes (new entries, last-used times) that trigger a commit
+COMMIT_INTERVAL = 5.0  # Seconds after which buffered writes are committed anyway
+
+
+def crop_key(region, exact=False):
+    """
+    Cache key of a timestamp crop. By default the crop is reduced to a
+    small binarized bitmap first, so re-encoded or slightly noisy copies of
+    the same overlay map to the same key while a changed digit doesn't.
+    `exact` hashes the raw pixels instead.
+    """
+    if exact:
+        return hashlib.blake2b(np.ascontiguousarray(region).tobytes(), digest_size=16).hexdigest()
+    gray = cv2.cvtColor(region, cv2.COLOR_BGR2GRAY) if region.ndim == 3 else region
+    width = max(1, int(gray.shape[1] * KEY_HEIGHT / gray.shape[0]))
+    small = cv2.resize(gray, (width, KEY_HEIGHT), interpolation=cv2.INTER_AREA)
+    _, binary = cv2.threshold(small, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    bits = np.packbits(binary > 0)
+    return hashlib.blake2b(bits.tobytes() + bytes(str(binary.shape), 'ascii'), digest_size=16).hexdigest()
+
+
+class OcrCache:
+    """
+    Parsed OCR timestamps by crop key: an in-memory LRU in front of a
+    SQLite file.
+
+    Entries are stored under `engine` and `version` (engine version,
+    allowlist/config...) and only read back for the same pair, so changing
+    either starts a fresh namespace. A crop with no readable timestamp is
+    cached as None for the same version and `mode` (how it was read, e.g.
+    fast or full OCR) only. `also_read` maps other engines to the one
+    version of each whose timestamps are trusted as well.
+
+    New entries and last-used times of disk hits are buffered and written
+    in one transaction every COMMIT_EVERY changes or COMMIT_INTERVAL
+    seconds, and by flush()/close(). Past `max_entries` the least recently
+    used rows are deleted from the file.
+    """
+
+    def __init__(self, engine, version, path=DEFAULT_CACHE_PATH, memory_entries=4096,
+                 max_entries=200000, also_read=None):
+        self.engine = engine
+        self.version = version
+        self.path = path
+        self.memory_entries = memory_entries
+        self.max_entries = max_entries
+        # (engine, version) pairs whose timestamps are accepted
+        self.sources = ((engine, version),) + tuple((also_read or {}).items())
+        self.memory = collections.OrderedDict()  # (key, mode) -> timestamp
+        self.lock = threading.Lock()
+        self.hits = self.misses = 0
+        self.puts_since_trim = 0
+        self.pending = {}  # (key, version) -> (timestamp, last_used), not written yet
+        self.touched = {}  # key -> last_used of disk hits, not written yet
+        self.last_commit = time.monotonic()
+        self.closed = False
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        # Pool workers share the file, wait for each other's writes
+        self.db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.db.execute("CREATE TABLE IF NOT EXISTS ocr (key TEXT, engine TEXT, version TEXT, timestamp TEXT, "
+                        "last_used REAL, PRIMARY KEY (key, engine, version))")
+        self.db.execute("CREATE INDEX IF NOT EXISTS ocr_last_used ON ocr (last_used)")
+        self.db.commit()
+        atexit.register(self.flush)
+
+    def _version(self, mode):
+        # Version a failed read in `mode` is stored under
+        return self.version if mode is None else f"{self.version}|{mode}"
+
+    def _remember(self, key, value):
+        self.memory[key] = value
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
+
+    def get(self, key, mode=None):
+        # Cached timestamp (None if it's known to be unreadable in this mode) or MISS
+        with self.lock:
+            if (key, mode) in self.memory:
+                self.memory.move_to_end((key, mode))
+                self.hits += 1
+                return self.memory[(key, mode)]
+
+            sources = ' OR '.join(['(engine = ? AND version = ?)'] * len(self.sources))
+            row = self.db.execute(
+                "SELECT timestamp FROM ocr WHERE key = ? AND ((engine = ? AND version = ?) OR "
+                f"(timestamp IS NOT NULL AND ({sources}))) "
+                "ORDER BY timestamp IS NULL LIMIT 1",
+                (key, self.engine, self._version(mode)) + sum(self.sources, ())).fetchone()
+            if row is None:
+                self.misses += 1
+                return MISS
+            self.touched[key] = time.time()
+            self._maybe_flush()
+            self.hits += 1
+            self._remember((key, mode), row[0])
+            return row[0]
+
+    def put(self, key, timestamp, mode=None):
+        with self.lock:
+            self._remember((key, mode), timestamp)
+            version = self.version if timestamp is not None else self._version(mode)
+            self.pending[(key, version)] = (timestamp, time.time())
+            self._maybe_flush()
+
+    def _maybe_flush(self):
+        # Called with self.lock held
+        changes = len(self.pending) + len(self.touched)
+        if changes >= COMMIT_EVERY or (changes and time.monotonic() - self.last_commit >= COMMIT_INTERVAL):
+            self._flush()
+
+    def _flush(self):
+        # Called with self.lock held: write the buffered entries and touches in one transaction
+        if self.closed or not (self.pending or self.touched):
+            return
+        self.db.executemany("INSERT OR REPLACE INTO ocr VALUES (?, ?, ?, ?, ?)",
+                            [(key, self.engine, version, timestamp, last_used)
+                             for (key, version), (timestamp, last_used) in self.pending.items()])
+        self.db.executemany("UPDATE ocr SET last_used = ? WHERE key = ?",
+                            [(last_used, key) for key, last_used in self.touched.items()])
+        self.db.commit()
+        self.puts_since_trim += len(self.pending)
+        self.pending, self.touched = {}, {}
+        self.last_commit = time.monotonic()
+        if self.puts_since_trim >= 1000:
+            self._trim()
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def _trim(self):
+        # Called with self.lock held: drop the least recently used rows past max_entries
+        self.puts_since_trim = 0
+        (count,) = self.db.execute("SELECT COUNT(*) FROM ocr").fetchone()
+        excess = count - self.max_entries
+        if excess > 0:
+            self.db.execute("DELETE FROM ocr WHERE rowid IN "
+                            "(SELECT rowid FROM ocr ORDER BY last_used LIMIT ?)", (excess,))
+            self.db.commit()
+
+    def close(self):
+        with self.lock:
+            if self.closed:
+                return
+            self._flush()
+            self._trim()
+            self.closed = True
+            self.db.close()
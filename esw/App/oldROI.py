@@ -2,6 +2,7 @@ import os
 import cv2
 from ultralytics import YOLO
 from datetime import datetime
+from regions import load_layout
 
 VIDEO_PATH_CONFIG = '/home/chaitu/Downloads/video_path.txt'
 # Load the YOLOv8 model
@@ -58,29 +59,12 @@ def process_image(image, bounding_boxes, output_path, overlap_threshold=0.5):
     img_height, img_width, _ = image.shape
     absolute_boxes = convert_to_absolute_coords(bounding_boxes, img_width, img_height)
 
-    rows, cols = 24, 12
-    segment_width = img_width // cols
-    segment_height = img_height // rows
-
-    for i in range(rows):
-        for j in range(cols):
-            x1 = j * segment_width
-            y1 = i * segment_height
-            x2 = x1 + segment_width
-            y2 = y1 + segment_height
-            segment_area = segment_width * segment_height
-
-            intersection_area = 0
-            for bx1, by1, bx2, by2 in absolute_boxes:
-                intersect_x1 = max(x1, bx1)
-                intersect_y1 = max(y1, by1)
-                intersect_x2 = min(x2, bx2)
-                intersect_y2 = min(y2, by2)
-                if intersect_x1 < intersect_x2 and intersect_y1 < intersect_y2:
-                    intersection_area += (intersect_x2 - intersect_x1) * (intersect_y2 - intersect_y1)
-            
-            color = (0, 0, 255) if intersection_area > overlap_threshold * segment_area else (0, 255, 0)
-            cv2.rectangle(image, (x1, y1), (x2, y2), color, 2)
+    # Every cell of the 24x12 grid, see cameras/all-24x12.json
+    cells, dirty = load_layout('all-24x12').dirty(absolute_boxes, img_width, img_height, overlap_threshold)
+
+    for (x1, y1, x2, y2), is_dirty in zip(cells.tolist(), dirty):
+        color = (0, 0, 255) if is_dirty else (0, 255, 0)
+        cv2.rectangle(image, (x1, y1), (x2, y2), color, 2)
 
     cv2.imwrite(output_path, image)
 
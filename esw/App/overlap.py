@@ -0,0 +1,52 @@
+import numpy as np
+
+
+def grid_cells(img_width, img_height, rows, cols, active=None):
+    """
+    Rectangles (x1, y1, x2, y2) of the cells of a rows x cols grid laid over
+    the image, in row-major order. `active` is an optional (rows, cols)
+    boolean mask; only the active cells are returned.
+    """
+    segment_width = img_width // cols
+    segment_height = img_height // rows
+
+    row_idx, col_idx = np.mgrid[0:rows, 0:cols]
+    row_idx = row_idx.ravel()
+    col_idx = col_idx.ravel()
+    if active is not None:
+        keep = np.asarray(active, dtype=bool).reshape(rows, cols).ravel()
+        row_idx = row_idx[keep]
+        col_idx = col_idx[keep]
+
+    x1 = col_idx * segment_width
+    y1 = row_idx * segment_height
+    cells = np.stack([x1, y1, x1 + segment_width, y1 + segment_height], axis=1)
+    return cells
+
+
+def cell_areas(cells):
+    cells = np.asarray(cells, dtype=np.float64).reshape(-1, 4)
+    return (cells[:, 2] - cells[:, 0]) * (cells[:, 3] - cells[:, 1])
+
+
+def intersection_matrix(cells, boxes):
+    # (cells x boxes) intersection areas, zero where they don't overlap
+    cells = np.asarray(cells, dtype=np.float64).reshape(-1, 4)
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    ix1 = np.maximum(cells[:, None, 0], boxes[None, :, 0])
+    iy1 = np.maximum(cells[:, None, 1], boxes[None, :, 1])
+    ix2 = np.minimum(cells[:, None, 2], boxes[None, :, 2])
+    iy2 = np.minimum(cells[:, None, 3], boxes[None, :, 3])
+    return np.clip(ix2 - ix1, 0, None) * np.clip(iy2 - iy1, 0, None)
+
+
+def dirty_cells(cells, boxes, overlap_threshold, areas=None):
+    # Boolean mask of cells whose covered area (summed over all boxes, overlapping ones counted
+    # once each like the old loops) is above threshold * cell area.
+    # Pass precomputed cell `areas` when the same cells are scored every frame.
+    if areas is None:
+        areas = cell_areas(cells)
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    if len(boxes) == 0 or len(areas) == 0:
+        return np.zeros(len(areas), dtype=bool)
+    return intersection_matrix(cells, boxes).sum(axis=1) > overlap_threshold * areas
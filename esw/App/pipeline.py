@@ -0,0 +1,165 @@
+import queue
+import threading
+import time
+
+import numpy as np
+
+from metrics import registry, timed_iter
+from regions import to_frame_coords
+
+_END = object()
+JOIN_TIMEOUT = 10  # Seconds close() waits for each stage thread
+
+
+class _StageError:
+    def __init__(self, exc):
+        self.exc = exc
+
+
+class FramePipeline:
+    """
+    Decode -> batched inference -> caller, each stage in its own thread.
+
+    `frames` is any iterable of (frame_index, frame), e.g. a FrameSampler.
+    A decoder thread fills a bounded queue with sampled frames, an inference
+    thread pulls up to `batch_size` of them and calls the Ultralytics model
+    once per batch. Iterating the pipeline yields (frame_index, frame, boxes)
+    in the original frame order, where boxes is an (N, 4) xyxy array.
+
+    With a `gate` (change_gate.ChangeGate) frames showing the same scene as
+    the last inferred frame skip the model and get that frame's boxes.
+    With a `crop` (x1, y1, x2, y2) only that part of each frame is compared
+    and inferred; boxes are still returned in full-frame coordinates.
+    """
+
+    def __init__(self, frames, model, batch_size=8, queue_size=32,
+                 batch_timeout=0.5, predict_kwargs=None, gate=None, crop=None):
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+        self.frames = frames
+        self.model = model
+        self.batch_size = batch_size
+        self.batch_timeout = batch_timeout
+        self.predict_kwargs = dict(save=False, verbose=False)
+        self.predict_kwargs.update(predict_kwargs or {})
+        self.gate = gate
+        self.crop = crop
+        self.last_boxes = None  # Boxes of the last inferred frame, reused for unchanged frames
+
+        self.frame_queue = queue.Queue(maxsize=queue_size)
+        self.result_queue = queue.Queue(maxsize=queue_size)
+        self.stop_event = threading.Event()
+        self.threads = []
+
+    def _put(self, q, item):
+        # put() that gives up once the pipeline is being shut down
+        while not self.stop_event.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _decode(self):
+        try:
+            for frame_index, frame in timed_iter(self.frames, "decode"):
+                if not self._put(self.frame_queue, (frame_index, frame)):
+                    return
+        except Exception as e:
+            self._put(self.frame_queue, _StageError(e))
+        self._put(self.frame_queue, _END)
+
+    def _next_batch(self):
+        batch = []
+        deadline = None
+        while len(batch) < self.batch_size:
+            timeout = 0.1
+            if deadline is not None:
+                timeout = min(timeout, deadline - time.monotonic())
+                if timeout <= 0:
+                    break
+            try:
+                item = self.frame_queue.get(timeout=timeout)
+            except queue.Empty:
+                if self.stop_event.is_set():
+                    return batch, _END
+                continue
+            if item is _END or isinstance(item, _StageError):
+                return batch, item
+            batch.append(item)
+            if deadline is None:
+                # Don't hold the first frame of a batch back for too long
+                deadline = time.monotonic() + self.batch_timeout
+        return batch, None
+
+    def _crop(self, frame):
+        if self.crop is None:
+            return frame
+        x1, y1, x2, y2 = self.crop
+        return np.ascontiguousarray(frame[y1:y2, x1:x2])
+
+    def _infer(self):
+        try:
+            while True:
+                batch, tail = self._next_batch()
+                if batch:
+                    registry.set("esw_queue_depth", self.frame_queue.qsize(), queue="frames")
+                    registry.set("esw_queue_depth", self.result_queue.qsize(), queue="results")
+                    # Which frames need the model; the others reuse the boxes of the frame before them
+                    crops = [self._crop(frame) for _, frame in batch]
+                    with registry.time("change_gate"):
+                        infer = [self.gate is None or self.gate.needs_inference(crop) for crop in crops]
+                    images = [crop for crop, needed in zip(crops, infer) if needed]
+                    registry.inc("esw_frames_total", len(images), result="inferred")
+                    registry.inc("esw_frames_total", len(batch) - len(images), result="unchanged")
+                    results = iter([])
+                    if images:
+                        with registry.time("inference"):
+                            results = iter(self.model.predict(source=images, **self.predict_kwargs))
+                    for (frame_index, frame), needed in zip(batch, infer):
+                        if needed:
+                            self.last_boxes = to_frame_coords(next(results).boxes.xyxy.cpu().numpy(), self.crop)
+                        if not self._put(self.result_queue, (frame_index, frame, self.last_boxes)):
+                            return
+                if tail is not None:
+                    self._put(self.result_queue, tail)
+                    return
+        except Exception as e:
+            self._put(self.result_queue, _StageError(e))
+
+    def start(self):
+        for target in (self._decode, self._infer):
+            thread = threading.Thread(target=target, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def close(self):
+        self.stop_event.set()
+        # A frame source that blocks on its own (e.g. frame_ring.SharedMemoryFrames) gets told to stop too
+        stop = getattr(self.frames, 'stop', None)
+        if stop is not None:
+            stop()
+        for thread in self.threads:
+            thread.join(timeout=JOIN_TIMEOUT)
+            if thread.is_alive():
+                print(f"Pipeline thread {thread.name} didn't stop within {JOIN_TIMEOUT} s")
+        self.threads = []
+        # Drop frames nobody will read (they may be views into a shared frame ring)
+        for q in (self.frame_queue, self.result_queue):
+            with q.mutex:
+                q.queue.clear()
+
+    def __iter__(self):
+        if not self.threads:
+            self.start()
+        try:
+            while True:
+                item = self.result_queue.get()
+                if item is _END:
+                    break
+                if isinstance(item, _StageError):
+                    raise item.exc
+                yield item
+        finally:
+            self.close()
@@ -0,0 +1,171 @@
+import json
+import os
+
+import cv2
+import numpy as np
+
+from overlap import grid_cells, cell_areas, dirty_cells
+
+# One <camera>.json per camera
+CAMERA_CONFIG_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cameras')
+DEFAULT_CAMERA = 'default'
+DEFAULT_MARGIN = 0.03  # Context kept around the regions, as a fraction of the frame size
+DEFAULT_OVERLAP_THRESHOLD = 0.4
+
+
+def load_camera_config(camera=DEFAULT_CAMERA, folder=CAMERA_CONFIG_FOLDER):
+    # Parsed <camera>.json, {} if the camera has no config file
+    path = os.path.join(folder, f"{camera}.json")
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def union_crop(regions, img_width, img_height, margin=DEFAULT_MARGIN):
+    """
+    Pixel rectangle (x1, y1, x2, y2) around all `regions` (x1, y1, x2, y2 as
+    fractions of the frame) plus `margin`, clipped to the frame. Edges are
+    rounded to even pixels so chroma-subsampled crops line up.
+    """
+    regions = np.asarray(regions, dtype=np.float64).reshape(-1, 4)
+    x1, y1 = regions[:, 0].min() - margin, regions[:, 1].min() - margin
+    x2, y2 = regions[:, 2].max() + margin, regions[:, 3].max() + margin
+    x1 = max(0, int(x1 * img_width) // 2 * 2)
+    y1 = max(0, int(y1 * img_height) // 2 * 2)
+    x2 = min(img_width, -(-int(np.ceil(x2 * img_width)) // 2) * 2)
+    y2 = min(img_height, -(-int(np.ceil(y2 * img_height)) // 2) * 2)
+    return x1, y1, x2, y2
+
+
+def to_frame_coords(boxes, crop):
+    # (N, 4) xyxy boxes found in the crop -> full-frame coordinates
+    if crop is None:
+        return boxes
+    x1, y1 = crop[0], crop[1]
+    return boxes + np.array([x1, y1, x1, y1], dtype=boxes.dtype)
+
+
+def _parse_bitmap(rows_text, rows, cols):
+    # ["000111...", ...] -> (rows, cols) bool mask
+    if len(rows_text) != rows or any(len(row) != cols for row in rows_text):
+        raise ValueError(f"active_cells must be {rows} strings of {cols} characters")
+    return np.array([[c == '1' for c in row] for row in rows_text], dtype=bool)
+
+
+def _cells_in_polygons(polygons, rows, cols):
+    # Cells whose centre lies inside any polygon (points as fractions of the frame)
+    centres = [((c + 0.5) / cols, (r + 0.5) / rows) for r in range(rows) for c in range(cols)]
+    active = np.zeros(rows * cols, dtype=bool)
+    for polygon in polygons:
+        contour = np.asarray(polygon, dtype=np.float32).reshape(-1, 1, 2)
+        active |= [cv2.pointPolygonTest(contour, centre, False) >= 0 for centre in centres]
+    return active.reshape(rows, cols)
+
+
+class CompiledGrid:
+    # Cell rectangles of one layout at one frame size, computed once and reused for every frame
+
+    def __init__(self, cells, areas):
+        self.cells = cells
+        self.areas = areas
+
+
+class CameraLayout:
+    """
+    Monitored grid of one camera, from cameras/<camera>.json:
+
+        {"grid": {"rows": 24, "cols": 12},
+         "active_cells": ["000000000000", ...]   # one string per row, '1' = monitored
+         "polygons": [[[x, y], ...], ...],       # or: cells whose centre is inside
+         "overlap_threshold": 0.4,
+         "roi": {"regions": [[x1, y1, x2, y2]], "margin": 0.03}}
+
+    Coordinates are fractions of the frame. Without active_cells or
+    polygons every cell is monitored; without roi regions the inference
+    crop is the bounding box of the monitored cells. The cell rectangles
+    are compiled once per frame size (compile()).
+    """
+
+    def __init__(self, camera, rows, cols, active, overlap_threshold=DEFAULT_OVERLAP_THRESHOLD,
+                 roi_regions=None, margin=DEFAULT_MARGIN):
+        self.camera = camera
+        self.rows = rows
+        self.cols = cols
+        self.active = np.asarray(active, dtype=bool).reshape(rows, cols)
+        self.overlap_threshold = overlap_threshold
+        self.roi_regions = roi_regions if roi_regions else self._active_bounds()
+        self.margin = margin
+        self.compiled = {}  # (width, height) -> CompiledGrid
+
+    @classmethod
+    def from_config(cls, camera, config):
+        grid = config.get("grid", {})
+        rows, cols = grid.get("rows", 24), grid.get("cols", 12)
+        if "active_cells" in config:
+            active = _parse_bitmap(config["active_cells"], rows, cols)
+        elif "polygons" in config:
+            active = _cells_in_polygons(config["polygons"], rows, cols)
+        else:
+            active = np.ones((rows, cols), dtype=bool)
+        roi = config.get("roi", {})
+        return cls(camera, rows, cols, active,
+                   overlap_threshold=config.get("overlap_threshold", DEFAULT_OVERLAP_THRESHOLD),
+                   roi_regions=roi.get("regions"), margin=roi.get("margin", DEFAULT_MARGIN))
+
+    def _active_bounds(self):
+        # Bounding box of the monitored cells, as fractions of the frame
+        rows, cols = np.nonzero(self.active)
+        if len(rows) == 0:
+            return None
+        return [[cols.min() / self.cols, rows.min() / self.rows,
+                 (cols.max() + 1) / self.cols, (rows.max() + 1) / self.rows]]
+
+    def compile(self, img_width, img_height):
+        grid = self.compiled.get((img_width, img_height))
+        if grid is None:
+            cells = grid_cells(img_width, img_height, self.rows, self.cols, active=self.active)
+            grid = self.compiled[(img_width, img_height)] = CompiledGrid(cells, cell_areas(cells))
+        return grid
+
+    def dirty(self, boxes, img_width, img_height, overlap_threshold=None):
+        # (cells, dirty mask) of the monitored cells for one frame's xyxy boxes
+        grid = self.compile(img_width, img_height)
+        threshold = self.overlap_threshold if overlap_threshold is None else overlap_threshold
+        return grid.cells, dirty_cells(grid.cells, boxes, threshold, areas=grid.areas)
+
+    def crop(self, img_width, img_height):
+        # Inference crop (x1, y1, x2, y2) in pixels, None to run on the full frame
+        if not self.roi_regions:
+            return None
+        crop = union_crop(self.roi_regions, img_width, img_height, self.margin)
+        if crop[2] - crop[0] <= 0 or crop[3] - crop[1] <= 0:
+            return None
+        if crop == (0, 0, img_width, img_height):
+            return None
+        return crop
+
+
+def max_grid_cells(folder=CAMERA_CONFIG_FOLDER):
+    # Cells of the largest grid any camera config uses (24x12 when there are none)
+    sizes = [24 * 12]
+    if os.path.isdir(folder):
+        for name in os.listdir(folder):
+            if name.endswith('.json'):
+                grid = load_camera_config(name[:-5], folder).get("grid", {})
+                sizes.append(grid.get("rows", 24) * grid.get("cols", 12))
+    return max(sizes)
+
+
+_layouts = {}
+
+
+def load_layout(camera=DEFAULT_CAMERA, folder=CAMERA_CONFIG_FOLDER):
+    # CameraLayout of a camera, parsed once and then cached; unknown cameras get the default layout
+    key = (camera, folder)
+    if key not in _layouts:
+        config = load_camera_config(camera, folder)
+        if not config and camera != DEFAULT_CAMERA:
+            config = load_camera_config(DEFAULT_CAMERA, folder)
+        _layouts[key] = CameraLayout.from_config(camera, config)
+    return _layouts[key]
@@ -0,0 +1,279 @@
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from timestamps import parse_timestamp
+
+logger = logging.getLogger(__name__)
+
+CELL_BYTES = 36  # Default per-row dirty-cell bitmap, room for a 24x12 grid; fixed when a log is created
+# Column name -> dtype; every column is one append-only file per day partition
+COLUMNS = {"ts": "<f8", "camera": "<i4", "job": "<i4", "frame": "<i8", "dirty": "<i4",
+           "cells": f"({CELL_BYTES},)u1"}
+BUCKETS = {"hour": 3600, "day": 86400}
+
+
+def cell_bytes_for(cells):
+    # Bitmap width that holds a grid of `cells` cells
+    return max(1, -(-int(cells) // 8))
+
+
+def to_seconds(value):
+    """
+    Camera wall-clock time -> seconds since 1970-01-01 00:00 of that clock.
+    Times are kept as they read on the camera (no timezone), so hour and
+    day buckets line up with the overlay. Accepts datetime, overlay text,
+    ISO text or a number.
+    """
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        parsed = parse_timestamp(value)
+        if parsed is None:
+            try:
+                parsed = datetime.fromisoformat(value)
+            except ValueError:
+                return None
+        value = parsed
+    return value.replace(tzinfo=timezone.utc).timestamp()
+
+
+def from_seconds(seconds):
+    return datetime(1970, 1, 1) + timedelta(seconds=float(seconds))
+
+
+def pack_cells(dirty, cell_bytes=CELL_BYTES):
+    # Boolean dirty mask -> fixed-width bitmap row; a mask that doesn't fit is an error, not cut short
+    bits = np.packbits(np.asarray(dirty, dtype=bool))
+    if len(bits) > cell_bytes:
+        raise ValueError(f"{np.size(dirty)} cells don't fit the result log's {cell_bytes * 8}-cell bitmap")
+    return np.pad(bits, (0, cell_bytes - len(bits)))
+
+
+class ResultLog:
+    """
+    Append-only, columnar log of per-frame results, partitioned by day.
+
+    <folder>/<YYYY-MM-DD>/<column>.bin holds one column of that day's rows
+    as raw little-endian values, so a query maps only the columns and days
+    it needs (np.memmap) and filters them vectorised. Camera and job names
+    are dictionary-coded in <folder>/dictionary.json, which also records
+    the width of the cells bitmap: `cell_bytes` (see cell_bytes_for())
+    applies to a new log, an existing one keeps the width it was made with.
+
+    append() only buffers; rows are written in batches every
+    `flush_interval` seconds or `batch_size` rows, by a background thread.
+    After each flush every function in `listeners` is called with
+    (day, first_row, columns) for each partition written to: the rows'
+    position in that day and their column arrays.
+    """
+
+    def __init__(self, folder, batch_size=500, flush_interval=2.0, cell_bytes=CELL_BYTES):
+        self.folder = folder
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        os.makedirs(folder, exist_ok=True)
+        self.lock = threading.Lock()       # Guards the pending rows
+        self.write_lock = threading.Lock()  # One flush at a time
+        self.pending = []
+        self.listeners = []
+        self.dictionary = self._load_dictionary(cell_bytes)
+        self.cell_bytes = self.dictionary["cell_bytes"]
+        if self.cell_bytes < cell_bytes:
+            logger.warning(f"Result log {folder} stores {self.cell_bytes * 8} cells per row, "
+                           f"larger grids can't be logged there")
+        self.columns = dict(COLUMNS, cells=f"({self.cell_bytes},)u1")
+        # name -> code, so coding a row doesn't search the ever-growing job list
+        self.codes = {kind: {name: code for code, name in enumerate(self.dictionary[kind])}
+                      for kind in ("camera", "job")}
+        self.stopped = threading.Event()
+        self.flusher = threading.Thread(target=self._run, daemon=True)
+        self.flusher.start()
+
+    @property
+    def dictionary_path(self):
+        return os.path.join(self.folder, 'dictionary.json')
+
+    def _load_dictionary(self, cell_bytes):
+        if not os.path.exists(self.dictionary_path):
+            return {"camera": [], "job": [], "cell_bytes": cell_bytes}
+        with open(self.dictionary_path) as f:
+            dictionary = json.load(f)
+        dictionary.setdefault("cell_bytes", CELL_BYTES)  # Logs from before the width was recorded
+        return dictionary
+
+    def _code(self, kind, name):
+        # Called with self.write_lock held
+        codes = self.codes[kind]
+        code = codes.get(name)
+        if code is None:
+            code = codes[name] = len(self.dictionary[kind])
+            self.dictionary[kind].append(name)
+        return code
+
+    def append(self, camera, job, frame, timestamp, dirty_count, dirty=None):
+        row = (to_seconds(timestamp) or to_seconds(datetime.now()), camera or 'default', job or '',
+               int(frame), int(dirty_count), pack_cells(dirty if dirty is not None else [], self.cell_bytes))
+        with self.lock:
+            self.pending.append(row)
+            full = len(self.pending) >= self.batch_size
+        if full:
+            self.flush()
+
+    def flush(self):
+        with self.write_lock:
+            with self.lock:
+                rows, self.pending = self.pending, []
+            if not rows:
+                return
+            dictionary_size = (len(self.dictionary["camera"]), len(self.dictionary["job"]))
+            by_day = {}
+            for row in rows:
+                by_day.setdefault(from_seconds(row[0]).strftime('%Y-%m-%d'), []).append(row)
+            written = []
+            for day, day_rows in by_day.items():
+                columns = {
+                    "ts": np.array([r[0] for r in day_rows], dtype=self.columns["ts"]),
+                    "camera": np.array([self._code("camera", r[1]) for r in day_rows], dtype=self.columns["camera"]),
+                    "job": np.array([self._code("job", r[2]) for r in day_rows], dtype=self.columns["job"]),
+                    "frame": np.array([r[3] for r in day_rows], dtype=self.columns["frame"]),
+                    "dirty": np.array([r[4] for r in day_rows], dtype=self.columns["dirty"]),
+                    "cells": np.stack([r[5] for r in day_rows]).astype(np.uint8),
+                }
+                if (len(self.dictionary["camera"]), len(self.dictionary["job"])) != dictionary_size:
+                    # New names must be on disk before rows that use their codes
+                    self._save_dictionary()
+                    dictionary_size = (len(self.dictionary["camera"]), len(self.dictionary["job"]))
+                partition = os.path.join(self.folder, day)
+                os.makedirs(partition, exist_ok=True)
+                first_row = self._row_count(partition)
+                for name, values in columns.items():
+                    with open(os.path.join(partition, f"{name}.bin"), 'ab') as f:
+                        values.tofile(f)
+                written.append((day, first_row, columns))
+            for listener in self.listeners:
+                for day, first_row, columns in written:
+                    try:
+                        listener(day, first_row, columns)
+                    except Exception as e:
+                        logger.error(f"Error in result log listener: {str(e)}")
+
+    def _save_dictionary(self):
+        tmp_path = self.dictionary_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.dictionary, f)
+        os.replace(tmp_path, self.dictionary_path)
+
+    def _run(self):
+        while not self.stopped.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error flushing result log: {str(e)}")
+
+    def close(self):
+        self.stopped.set()
+        self.flusher.join()
+        self.flush()
+
+    def _row_count(self, path):
+        # Rows of a day partition that every column holds
+        counts = []
+        for name, dtype in self.columns.items():
+            file_path = os.path.join(path, f"{name}.bin")
+            counts.append(os.path.getsize(file_path) // np.dtype(dtype).itemsize if os.path.exists(file_path) else 0)
+        return min(counts)
+
+    def row_counts(self):
+        # day -> rows on disk, for every day partition
+        return {name: self._row_count(os.path.join(self.folder, name)) for name in sorted(os.listdir(self.folder))
+                if os.path.isdir(os.path.join(self.folder, name))}
+
+    def read_rows(self, day, first_row, columns):
+        # Column arrays of one day's rows from first_row on, in the order they were written
+        return {name: np.asarray(values[first_row:])
+                for name, values in self._read_partition(os.path.join(self.folder, day), columns).items()}
+
+    def _partitions(self, start, end):
+        # Day folders that can hold rows in [start, end)
+        day = from_seconds(start).date()
+        last = from_seconds(end - 1e-6).date()
+        while day <= last:
+            path = os.path.join(self.folder, day.strftime('%Y-%m-%d'))
+            if os.path.isdir(path):
+                yield path
+            day += timedelta(days=1)
+
+    def _read_partition(self, path, names):
+        # Memory-mapped columns of one day, cut to the rows every column has
+        columns = {}
+        for name in names:
+            file_path = os.path.join(path, f"{name}.bin")
+            dtype = np.dtype(self.columns[name])
+            count = os.path.getsize(file_path) // dtype.itemsize if os.path.exists(file_path) else 0
+            columns[name] = np.memmap(file_path, dtype=dtype, mode='r', shape=(count,)) if count else \
+                np.zeros(0, dtype=dtype)
+        rows = min(len(values) for values in columns.values())
+        return {name: values[:rows] for name, values in columns.items()}
+
+    def scan(self, start, end, columns, camera=None, job=None):
+        # Column arrays of the rows with start <= ts < end (optionally one camera/job), in time order
+        names = set(columns) | {"ts"}
+        if camera is not None:
+            names.add("camera")
+        if job is not None:
+            names.add("job")
+        camera_code = self.codes["camera"].get(camera, -1)
+        job_code = self.codes["job"].get(job, -1)
+
+        parts = {name: [] for name in names}
+        for path in self._partitions(start, end):
+            data = self._read_partition(path, names)
+            keep = (data["ts"] >= start) & (data["ts"] < end)
+            if camera is not None:
+                keep &= data["camera"] == camera_code
+            if job is not None:
+                keep &= data["job"] == job_code
+            for name in names:
+                parts[name].append(np.asarray(data[name][keep]))
+        result = {name: np.concatenate(values) if values else np.zeros(0, dtype=np.dtype(self.columns[name]))
+                  for name, values in parts.items()}
+        order = np.argsort(result["ts"], kind='stable')
+        return {name: values[order] for name, values in result.items()}
+
+    def query(self, start, end, camera=None, job=None, limit=10000):
+        # Rows as dicts, oldest first
+        data = self.scan(start, end, self.columns.keys(), camera, job)
+        rows = []
+        for i in range(min(limit, len(data["ts"]))):
+            rows.append({"timestamp": from_seconds(data["ts"][i]).isoformat(),
+                         "camera": self.dictionary["camera"][data["camera"][i]],
+                         "job": self.dictionary["job"][data["job"][i]],
+                         "frame": int(data["frame"][i]), "dirty_segments": int(data["dirty"][i]),
+                         "cells": data["cells"][i].tobytes().rstrip(b'\0').hex()})
+        return rows
+
+    def aggregate(self, start, end, bucket='hour', camera=None, job=None):
+        # Count/sum/min/max/mean of dirty segments per hour or day bucket
+        size = BUCKETS[bucket]
+        data = self.scan(start, end, ["dirty"], camera, job)
+        if len(data["ts"]) == 0:
+            return []
+        keys = (data["ts"] // size).astype(np.int64)
+        dirty = data["dirty"].astype(np.int64)
+        unique, index = np.unique(keys, return_inverse=True)
+        count = np.bincount(index)
+        total = np.bincount(index, weights=dirty)
+        minimum = np.full(len(unique), np.iinfo(np.int64).max)
+        maximum = np.full(len(unique), np.iinfo(np.int64).min)
+        np.minimum.at(minimum, index, dirty)
+        np.maximum.at(maximum, index, dirty)
+        return [{"bucket": from_seconds(key * size).isoformat(), "count": int(n), "sum": int(s),
+                 "min": int(lo), "max": int(hi), "mean": round(float(s) / int(n), 3)}
+                for key, n, s, lo, hi in zip(unique, count, total, minimum, maximum)]
@@ -0,0 +1,104 @@
+import collections
+import itertools
+import threading
+import time
+
+
+class JobResults:
+    """
+    Append-only ring buffer of one job's results.
+
+    Every result gets a sequence number (0, 1, 2, ...). Readers keep a cursor
+    and ask for everything after it, so any number of viewers can follow the
+    same job without taking results away from each other. Once more than
+    `capacity` results exist the oldest are dropped.
+    """
+
+    def __init__(self, job_id, capacity=10000):
+        self.job_id = job_id
+        self.buffer = collections.deque(maxlen=capacity)
+        self.count = 0  # Sequence number of the next result
+        self.finished = False
+        self.created_at = time.time()
+        self.finished_at = None
+        self.changed = threading.Condition()
+
+    def append(self, result):
+        with self.changed:
+            self.buffer.append(result)
+            self.count += 1
+            self.changed.notify_all()
+            return self.count - 1
+
+    def finish(self):
+        with self.changed:
+            self.finished = True
+            self.finished_at = time.time()
+            self.changed.notify_all()
+
+    def read(self, since=0):
+        # Results with sequence number >= since, and the cursor to use next time
+        with self.changed:
+            first = self.count - len(self.buffer)
+            since = max(since, first)
+            new = self.count - since
+            if new <= 0:
+                return [], self.count
+            # Walk from the newest end so this is O(new results), not O(buffer)
+            items = list(itertools.islice(reversed(self.buffer), new))
+            items.reverse()
+            return items, self.count
+
+    def wait(self, since, timeout=None):
+        # Block until there is something after `since` or the job finishes
+        with self.changed:
+            self.changed.wait_for(lambda: self.count > since or self.finished, timeout=timeout)
+            return self.count > since
+
+
+class ResultStore:
+    """
+    Per-job result buffers. Finished jobs are kept for late viewers and
+    evicted oldest-first once more than `max_finished_jobs` have piled up.
+    """
+
+    def __init__(self, capacity_per_job=10000, max_finished_jobs=20):
+        self.capacity_per_job = capacity_per_job
+        self.max_finished_jobs = max_finished_jobs
+        self.jobs = {}
+        self.latest_job_id = None
+        self.lock = threading.Lock()  # Only guards the job table, not reads/appends
+
+    def create(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                job = JobResults(job_id, self.capacity_per_job)
+                self.jobs[job_id] = job
+            self.latest_job_id = job_id
+            return job
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def latest(self):
+        job_id = self.latest_job_id
+        return self.jobs.get(job_id) if job_id is not None else None
+
+    def append(self, job_id, result):
+        job = self.jobs.get(job_id) or self.create(job_id)
+        return job.append(result)
+
+    def finish(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is not None:
+            job.finish()
+            self._evict()
+
+    def _evict(self):
+        with self.lock:
+            finished = [job for job in self.jobs.values()
+                        if job.finished and job.job_id != self.latest_job_id]
+            finished.sort(key=lambda job: job.finished_at)
+            for job in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+                del self.jobs[job.job_id]
@@ -0,0 +1,82 @@
+import os
+import queue
+import time
+
+from metrics import registry
+
+METRICS_INTERVAL = 2.0  # Seconds between metric deltas sent while a job runs
+
+
+def _cancel_requested(control_queue, job_id):
+    # Drain pending control messages, True if one of them cancels this job
+    cancelled = False
+    while True:
+        try:
+            command, target = control_queue.get_nowait()
+        except queue.Empty:
+            return cancelled
+        if command == "cancel" and target == job_id:
+            cancelled = True
+
+
+def worker_main(worker_id, job_queue, control_queue, event_queue, model_path, num_threads):
+    """
+    Entry point of one inference worker process.
+
+    Imports torch/ultralytics and loads the YOLO model once, then runs
+    ROI.process_video for every (job_id, video_path, params) taken from
+    `job_queue`. Everything it has to say goes back over `event_queue` as
+    (kind, worker_id, job_id, payload) tuples, including the stage timings
+    recorded in this process ("metrics", payload = metrics.registry.delta()).
+    """
+    if num_threads:
+        # Keep workers from fighting over the same cores
+        os.environ["OMP_NUM_THREADS"] = str(num_threads)
+
+    try:
+        import ROI
+
+        if num_threads:
+            import torch
+            torch.set_num_threads(num_threads)
+
+        model = ROI.load_model(model_path) if model_path else ROI.load_model()
+    except Exception as e:
+        # Tell the scheduler why, it decides whether to start this worker again
+        event_queue.put(("startup_error", worker_id, None, {"error": str(e)}))
+        raise
+    event_queue.put(("ready", worker_id, None, {"pid": os.getpid()}))
+
+    while True:
+        job = job_queue.get()
+        if job is None:
+            break
+        job_id, video_path, params = job
+        event_queue.put(("status", worker_id, job_id, {"state": "running", "started_at": time.time()}))
+        registry.delta()  # Whatever was recorded between jobs isn't this job's
+        last_metrics = time.monotonic()
+
+        cancelled = False
+
+        def should_stop(job_id=job_id):
+            nonlocal cancelled
+            cancelled = cancelled or _cancel_requested(control_queue, job_id)
+            return cancelled
+
+        def on_result(result, job_id=job_id):
+            nonlocal last_metrics
+            event_queue.put(("result", worker_id, job_id, result))
+            if time.monotonic() - last_metrics >= METRICS_INTERVAL:
+                event_queue.put(("metrics", worker_id, job_id, registry.delta()))
+                last_metrics = time.monotonic()
+
+        try:
+            summary = ROI.process_video(video_path, model, on_result=on_result, should_stop=should_stop, **params)
+            event_queue.put(("metrics", worker_id, job_id, registry.delta()))
+            state = "cancelled" if cancelled else "done"
+            event_queue.put(("status", worker_id, job_id, {"state": state, "finished_at": time.time(),
+                                                           "summary": summary}))
+        except Exception as e:
+            event_queue.put(("metrics", worker_id, job_id, registry.delta()))
+            event_queue.put(("status", worker_id, job_id, {"state": "failed", "error": str(e),
+                                                           "finished_at": time.time()}))
@@ -0,0 +1,171 @@
+import json
+import logging
+import os
+import threading
+
+import numpy as np
+
+from result_log import BUCKETS, from_seconds
+
+logger = logging.getLogger(__name__)
+
+
+class Rollups:
+    """
+    Running per-camera count/sum/min/max of dirty segments for every hour
+    and every day (camera clock), updated as results arrive.
+
+    The totals live in memory and are saved to a JSON file by a background
+    thread every `save_interval` seconds when they changed, so the dashboard
+    gets its charts from a few hundred numbers instead of the raw results.
+
+    follow(result_log) feeds them from the log's flushes. The file then
+    also records how many rows of each day of the log the totals include,
+    and on the next start the rows written after that (or the whole log,
+    if the file is missing) are replayed.
+    """
+
+    def __init__(self, path, save_interval=5.0):
+        self.path = path
+        self.save_interval = save_interval
+        self.lock = threading.Lock()
+        self.changed = False
+        # bucket -> camera -> bucket start (seconds) -> [count, sum, min, max]
+        self.totals = {bucket: {} for bucket in BUCKETS}
+        self.positions = {}  # day -> rows of that result log partition included in the totals
+        self.loaded = self._load()
+        self.stopped = threading.Event()
+        self.saver = threading.Thread(target=self._run, daemon=True)
+        self.saver.start()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path) as f:
+            saved = json.load(f)
+        if "positions" not in saved:
+            # Saved before positions were recorded: which rows they hold is unknown, start over
+            logger.warning(f"Rollups {self.path} don't record their result log position, rebuilding them")
+            return False
+        self.positions = saved["positions"]
+        for bucket in BUCKETS:
+            self.totals[bucket] = {camera: {int(start): values for start, values in series.items()}
+                                   for camera, series in saved.get(bucket, {}).items()}
+        return True
+
+    def _merge(self, bucket, camera, start, count, total, low, high):
+        # Called with self.lock held
+        series = self.totals[bucket].setdefault(camera, {})
+        values = series.get(start)
+        if values is None:
+            series[start] = [count, total, low, high]
+        else:
+            series[start] = [values[0] + count, values[1] + total, min(values[2], low), max(values[3], high)]
+
+    def add(self, camera, seconds, dirty_count):
+        # One result by hand; results logged to a followed result log are counted from its flushes
+        with self.lock:
+            for bucket, size in BUCKETS.items():
+                self._merge(bucket, camera, int(seconds // size * size), 1, dirty_count, dirty_count, dirty_count)
+            self.changed = True
+
+    def _add_rows(self, result_log, day, first_row, columns):
+        # Rows first_row... of a result log day, minus those the totals already include
+        skip = self.positions.get(day, 0) - first_row
+        if skip >= len(columns["ts"]):
+            return
+        skip = max(skip, 0)
+        ts = np.asarray(columns["ts"][skip:], dtype=np.float64)
+        cameras = np.asarray(columns["camera"][skip:], dtype=np.int64)
+        dirty = np.asarray(columns["dirty"][skip:], dtype=np.int64)
+        names = result_log.dictionary["camera"]
+        for bucket, size in BUCKETS.items():
+            # Group by (camera, bucket start) and merge each group's count/sum/min/max
+            keys = (ts // size).astype(np.int64) * size
+            order = np.lexsort((keys, cameras))
+            group_cameras, group_keys, group_dirty = cameras[order], keys[order], dirty[order]
+            starts = np.flatnonzero(np.r_[True, (np.diff(group_cameras) != 0) | (np.diff(group_keys) != 0)])
+            counts = np.diff(np.r_[starts, len(order)])
+            totals = np.add.reduceat(group_dirty, starts)
+            lows = np.minimum.reduceat(group_dirty, starts)
+            highs = np.maximum.reduceat(group_dirty, starts)
+            for i, row in enumerate(starts):
+                self._merge(bucket, names[group_cameras[row]], int(group_keys[row]), int(counts[i]),
+                            int(totals[i]), int(lows[i]), int(highs[i]))
+        self.positions[day] = first_row + skip + len(ts)
+        self.changed = True
+
+    def catch_up(self, result_log):
+        # Replay the rows written to the log since the saved totals (all of them for a new rollup file)
+        for day, rows in result_log.row_counts().items():
+            if rows > self.positions.get(day, 0):
+                columns = result_log.read_rows(day, self.positions.get(day, 0), ["ts", "camera", "dirty"])
+                with self.lock:
+                    self._add_rows(result_log, day, self.positions.get(day, 0), columns)
+
+    def follow(self, result_log):
+        # Catch up with the log, then count every row it flushes
+        def on_flush(day, first_row, columns):
+            with self.lock:
+                self._add_rows(result_log, day, first_row, columns)
+
+        with result_log.write_lock:  # No flush in between
+            self.catch_up(result_log)
+            result_log.listeners.append(on_flush)
+
+    def rebuild(self, result_log):
+        # Recompute every total from the result log
+        with self.lock:
+            self.totals = {bucket: {} for bucket in BUCKETS}
+            self.positions = {}
+            self.changed = True
+        self.catch_up(result_log)
+
+    def series(self, bucket, camera=None, start=None, end=None):
+        # [{bucket, count, sum, min, max, mean}] oldest first; all cameras combined when camera is None
+        with self.lock:
+            cameras = [camera] if camera is not None else list(self.totals[bucket])
+            merged = {}
+            for name in cameras:
+                for key, (count, total, low, high) in self.totals[bucket].get(name, {}).items():
+                    if (start is not None and key < start) or (end is not None and key >= end):
+                        continue
+                    values = merged.get(key)
+                    if values is None:
+                        merged[key] = [count, total, low, high]
+                    else:
+                        merged[key] = [values[0] + count, values[1] + total, min(values[2], low), max(values[3], high)]
+        return [{"bucket": from_seconds(key).isoformat(), "count": count, "sum": total, "min": low, "max": high,
+                 "mean": round(total / count, 3)}
+                for key, (count, total, low, high) in sorted(merged.items())]
+
+    def cameras(self):
+        with self.lock:
+            return sorted(self.totals["day"])
+
+    def save(self):
+        with self.lock:
+            if not self.changed:
+                return
+            saved = {bucket: {camera: {str(k): v for k, v in series.items()} for camera, series in cameras.items()}
+                     for bucket, cameras in self.totals.items()}
+            saved["positions"] = self.positions
+            snapshot = json.dumps(saved)
+            self.changed = False
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(snapshot)
+        os.replace(tmp_path, self.path)
+
+    def _run(self):
+        while not self.stopped.wait(self.save_interval):
+            try:
+                self.save()
+            except Exception as e:
+                logger.error(f"Error saving rollups: {str(e)}")
+
+    def close(self):
+        self.stopped.set()
+        self.saver.join()
+        self.save()
+
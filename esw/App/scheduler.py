@@ -0,0 +1,270 @@
+import collections
+import logging
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+import uuid
+
+from roi_worker import worker_main
+from metrics import registry, stage_breakdown
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+
+RESTART_DELAY = 1.0  # Seconds before restarting a worker that died while starting, doubled each time
+MAX_RESTART_DELAY = 60.0
+MAX_START_FAILURES = 5  # A worker that dies this many times in a row before it is ready stays down
+
+
+def default_worker_count(threads_per_worker):
+    return max(1, (os.cpu_count() or 1) // max(1, threads_per_worker))
+
+
+class _Worker:
+    # Parent-side handle of one worker process
+
+    def __init__(self, ctx, worker_id, event_queue, model_path, threads_per_worker):
+        self.worker_id = worker_id
+        self.job_queue = ctx.Queue()
+        self.control_queue = ctx.Queue()
+        self.process = ctx.Process(target=worker_main,
+                                   args=(worker_id, self.job_queue, self.control_queue, event_queue,
+                                         model_path, threads_per_worker),
+                                   daemon=True)
+        self.ready = False
+        self.job_id = None  # Job currently assigned to this worker
+        self.start_failures = 0  # Deaths in a row before getting ready, carried over to replacements
+        self.restart_at = None  # When a dead worker gets replaced
+        self.given_up = False
+
+
+class JobScheduler:
+    """
+    FIFO job queue in front of a pool of inference worker processes.
+
+    Each worker keeps its own copy of the YOLO model loaded. A job is handed
+    to the first idle, ready worker; jobs go queued -> running -> done /
+    failed / cancelled. Every job carries its own video path and
+    ROI.process_video parameters (output folders etc.), so nothing is shared
+    between jobs through files.
+
+    `on_result(job_id, result)` is called for every processed frame and
+    `on_status(job_id, status)` whenever a job changes state, both on the
+    scheduler's listener thread. Workers that die before loading the model
+    are restarted with a growing delay and given up on after
+    MAX_START_FAILURES tries; once no worker is left, queued jobs fail. Stage timings sent by the workers are
+    merged into metrics.registry and into the job's "metrics" breakdown.
+    """
+
+    def __init__(self, num_workers=None, threads_per_worker=2, model_path=None,
+                 on_result=None, on_status=None, max_finished_jobs=200):
+        self.ctx = mp.get_context("spawn")  # Don't fork the Flask process and its threads
+        self.num_workers = num_workers or default_worker_count(threads_per_worker)
+        self.threads_per_worker = threads_per_worker
+        self.model_path = model_path
+        self.on_result = on_result
+        self.on_status = on_status
+        self.max_finished_jobs = max_finished_jobs
+
+        self.event_queue = self.ctx.Queue()
+        self.workers = []
+        self.pending = collections.deque()  # job ids waiting for a worker
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.worker_error = None  # Last reason a worker gave for failing to start
+        self.running = False
+        self.listener = threading.Thread(target=self._listen, daemon=True)
+
+    def _spawn(self, worker_id):
+        worker = _Worker(self.ctx, worker_id, self.event_queue, self.model_path, self.threads_per_worker)
+        worker.process.start()
+        logger.info(f"Inference worker {worker_id} started (pid {worker.process.pid})")
+        return worker
+
+    def start(self):
+        self.running = True
+        self.workers = [self._spawn(i) for i in range(self.num_workers)]
+        self.listener.start()
+
+    def stop(self):
+        self.running = False
+        for worker in self.workers:
+            worker.job_queue.put(None)
+        for worker in self.workers:
+            worker.process.join(timeout=10)
+        self.listener.join(timeout=10)
+
+    def submit(self, video_path, job_id=None, **params):
+        job_id = job_id or uuid.uuid4().hex
+        with self.lock:
+            self.jobs[job_id] = {"job_id": job_id, "video_path": video_path, "params": params,
+                                 "state": QUEUED, "frames_processed": 0, "worker": None,
+                                 "submitted_at": time.time()}
+            self.pending.append(job_id)
+            self._dispatch()
+            failed = self._fail_pending()
+        for failed_id, status in failed:
+            self._notify(self.on_status, failed_id, status)
+        return job_id
+
+    def cancel(self, job_id):
+        # True if the job was queued or running and is now being cancelled
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None or job["state"] in FINISHED_STATES:
+                return False
+            if job["state"] == QUEUED:
+                self.pending.remove(job_id)
+                job.update(state=CANCELLED, finished_at=time.time())
+                status = dict(state=CANCELLED)
+            else:
+                # The worker checks its control queue between frames
+                self.workers[job["worker"]].control_queue.put(("cancel", job_id))
+                job["cancel_requested"] = True
+                return True
+        self._notify(self.on_status, job_id, status)
+        return True
+
+    def status(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            status = {k: v for k, v in job.items() if k != "params"}
+            if job["state"] == QUEUED:
+                status["queue_position"] = self.pending.index(job_id)
+            return status
+
+    def update_gauges(self):
+        # Job, worker and queue gauges for a /metrics scrape
+        with self.lock:
+            states = collections.Counter(job["state"] for job in self.jobs.values())
+            for state in (QUEUED, RUNNING) + FINISHED_STATES:
+                registry.set("esw_jobs", states.get(state, 0), state=state)
+            registry.set("esw_workers_ready", sum(1 for worker in self.workers if worker.ready))
+        try:
+            registry.set("esw_queue_depth", self.event_queue.qsize(), queue="events")
+        except NotImplementedError:
+            pass  # multiprocessing queues can't report their size on macOS
+
+    def list_jobs(self):
+        with self.lock:
+            return [{k: v for k, v in job.items() if k != "params"} for job in self.jobs.values()]
+
+    def _dispatch(self):
+        # Called with self.lock held: hand queued jobs to idle, ready workers in FIFO order
+        for worker in self.workers:
+            if not self.pending:
+                break
+            if worker.ready and worker.job_id is None:
+                job_id = self.pending.popleft()
+                job = self.jobs[job_id]
+                job.update(state=RUNNING, worker=worker.worker_id)
+                worker.job_id = job_id
+                worker.job_queue.put((job_id, job["video_path"], job["params"]))
+
+    def _fail_pending(self):
+        # Called with self.lock held: fail every queued job once no worker can start
+        if not self.pending or not self.workers or not all(worker.given_up for worker in self.workers):
+            return []
+        status = dict(state=FAILED, error=f"No inference worker could start: {self.worker_error}")
+        failed = []
+        while self.pending:
+            job_id = self.pending.popleft()
+            self.jobs[job_id].update(status, finished_at=time.time())
+            failed.append((job_id, dict(status)))
+        return failed
+
+    def _prune(self):
+        # Called with self.lock held: forget the oldest finished jobs
+        finished = [job for job in self.jobs.values() if job["state"] in FINISHED_STATES]
+        finished.sort(key=lambda job: job.get("finished_at", 0))
+        for job in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+            del self.jobs[job["job_id"]]
+
+    def _check_workers(self):
+        # Fail the job of any worker that died and start a replacement, later each time it dies while starting
+        failed = []
+        with self.lock:
+            now = time.monotonic()
+            for i, worker in enumerate(self.workers):
+                if worker.given_up or worker.process.is_alive():
+                    continue
+                if worker.restart_at is None:
+                    logger.error(f"Inference worker {i} exited with code {worker.process.exitcode}")
+                    if worker.job_id is not None:
+                        error = "Inference worker crashed"
+                        self.jobs[worker.job_id].update(state=FAILED, error=error, finished_at=time.time())
+                        failed.append((worker.job_id, dict(state=FAILED, error=error)))
+                        worker.job_id = None
+                    worker.start_failures = 0 if worker.ready else worker.start_failures + 1
+                    if worker.start_failures >= MAX_START_FAILURES:
+                        worker.given_up = True
+                        logger.error(f"Inference worker {i} failed to start {worker.start_failures} times, "
+                                     f"not restarting it: {self.worker_error}")
+                        continue
+                    delay = 0
+                    if worker.start_failures:
+                        delay = min(MAX_RESTART_DELAY, RESTART_DELAY * 2 ** (worker.start_failures - 1))
+                    worker.restart_at = now + delay
+                if now >= worker.restart_at:
+                    self.workers[i] = self._spawn(i)
+                    self.workers[i].start_failures = worker.start_failures
+            failed += self._fail_pending()
+        for job_id, status in failed:
+            self._notify(self.on_status, job_id, status)
+
+    def _notify(self, callback, job_id, payload):
+        if callback is None:
+            return
+        try:
+            callback(job_id, payload)
+        except Exception as e:
+            logger.error(f"Error handling event for job {job_id}: {str(e)}")
+
+    def _listen(self):
+        last_check = time.monotonic()
+        while self.running:
+            if time.monotonic() - last_check >= 1:
+                self._check_workers()
+                last_check = time.monotonic()
+            try:
+                kind, worker_id, job_id, payload = self.event_queue.get(timeout=1)
+            except queue.Empty:
+                continue
+
+            with self.lock:
+                worker = self.workers[worker_id]
+                if kind == "ready":
+                    worker.ready = True
+                    logger.info(f"Inference worker {worker_id} ready, model loaded")
+                    self._dispatch()
+                    continue
+                if kind == "startup_error":
+                    self.worker_error = payload["error"]
+                    logger.error(f"Inference worker {worker_id} failed to start: {payload['error']}")
+                    continue
+                job = self.jobs.get(job_id)
+                if job is None:
+                    continue
+                if kind == "metrics":
+                    registry.merge(payload, worker=str(worker_id))
+                    job["metrics"] = stage_breakdown(payload, job.get("metrics"))
+                    continue
+                if kind == "status":
+                    job.update(payload)
+                    if payload["state"] in FINISHED_STATES:
+                        worker.job_id = None
+                        self._dispatch()
+                        self._prune()
+                elif kind == "result":
+                    job["frames_processed"] += 1
+                    registry.inc("esw_results_total")
+
+            if kind == "status" and payload["state"] == FAILED:
+                logger.error(f"Job {job_id} failed: {payload.get('error')}")
+            self._notify(self.on_result if kind == "result" else self.on_status, job_id, payload)
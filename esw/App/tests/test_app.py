@@ -0,0 +1,113 @@
+import json
+
+import pytest
+
+pytest.importorskip("flask_cors")
+
+import app as app_module
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    # The app with every folder in tmp_path and the inference pool never started
+    for name in ("UPLOAD_FOLDER", "JOBS_FOLDER", "RESULT_LOG_FOLDER"):
+        monkeypatch.setattr(app_module, name, str(tmp_path / name.lower()))
+    monkeypatch.setattr(app_module, "ROLLUPS_PATH", str(tmp_path / "rollups.json"))
+    flask_app = app_module.create_app()
+    yield flask_app.test_client()
+    app_module.result_log.close()
+    app_module.rollups.close()
+
+
+def finished_job(job_id, count):
+    app_module.result_store.create(job_id)
+    for i in range(count):
+        app_module.result_store.append(job_id, {"frame": f"frame_{i}.jpg", "dirty_segments": i})
+    app_module.result_store.finish(job_id)
+
+
+def stream(client, query, last_event_id=None):
+    # (event ids, data payloads) of a stream that ends because its job is finished
+    headers = {"Last-Event-ID": last_event_id} if last_event_id else {}
+    body = client.get(f"/stream?{query}", headers=headers).get_data(as_text=True)
+    ids, data = [], []
+    for event in body.split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in event.splitlines() if ": " in line and not line.startswith(":"))
+        if "id" in lines:
+            ids.append(lines["id"])
+            data.append(json.loads(lines["data"]))
+    return ids, data
+
+
+def test_stream_sends_every_result_with_a_resumable_id(client):
+    finished_job("a", 3)
+    ids, data = stream(client, "job=a")
+    assert ids == ["a:1", "a:2", "a:3"]
+    assert [d["frame"] for d in data] == ["frame_0.jpg", "frame_1.jpg", "frame_2.jpg"]
+    assert all(d["job_id"] == "a" for d in data)
+
+
+def test_last_event_id_resumes_after_the_last_received_result(client):
+    finished_job("a", 5)
+    ids, data = stream(client, "job=a", last_event_id="a:3")
+    assert ids == ["a:4", "a:5"] and data[0]["frame"] == "frame_3.jpg"
+    # Takes precedence over ?since= of the original URL
+    assert stream(client, "job=a&since=1", last_event_id="a:4")[0] == ["a:5"]
+
+
+def test_last_event_id_of_another_job_starts_from_the_beginning(client):
+    finished_job("a", 2)
+    finished_job("b", 2)
+    assert stream(client, "job=b", last_event_id="a:2")[0] == ["b:1", "b:2"]
+    assert stream(client, "job=b", last_event_id="garbage")[0] == ["b:1", "b:2"]
+    assert stream(client, "job=b&since=1")[0] == ["b:2"]
+
+
+def test_stream_of_an_unknown_job_ends_with_an_error(client):
+    body = client.get("/stream?job=missing").get_data(as_text=True)
+    assert "event: error" in body
+
+
+def test_parse_event_id():
+    assert app_module.parse_event_id("job:with:colons:12") == ("job:with:colons", 12)
+    assert app_module.parse_event_id("a:-1") == (None, 0)
+    assert app_module.parse_event_id(None) == (None, 0)
+
+
+def post(client, entries, job_id="posted"):
+    return client.post("/receive_dirty_data", json={"job_id": job_id, "dirty_segments_data": entries})
+
+
+@pytest.mark.parametrize("bad", [
+    {"dirty_segments": 1},
+    {"frame": "f", "dirty_segments": "1"},
+    {"frame": "f", "dirty_segments": 1, "cells": "zz"},
+    {"frame": "f", "dirty_segments": 1, "cells": "ff" * 1000},
+    {"frame": "f", "dirty_segments": 1, "frame_index": "abc"},
+    {"frame": "f", "dirty_segments": 1, "timestamp": "not a time"},
+    {"frame": "f", "dirty_segments": 1, "timestamp": 1e300},
+    {"frame": "f", "dirty_segments": 1, "camera": ["cam"]},
+])
+def test_a_bad_entry_rejects_the_whole_batch(client, bad):
+    good = {"frame": "frame_0.jpg", "dirty_segments": 2}
+    response = post(client, [good, bad])
+    assert response.status_code == 400 and "Invalid entry 1" in response.get_json()["error"]
+    assert app_module.result_store.get("posted") is None
+    app_module.result_log.flush()
+    assert app_module.result_log.row_counts() == {}
+
+
+def test_valid_entries_are_stored_and_logged(client):
+    entry = {"frame": "frame_7.jpg", "dirty_segments": 3, "frame_index": 7, "camera": "cam",
+             "timestamp": "12-03-2024 10:15:42", "cells": "a0"}
+    assert post(client, [entry]).status_code == 200
+    assert app_module.result_store.get("posted").read(0)[0] == [entry]
+    app_module.result_log.flush()
+    (row,) = app_module.result_log.query(0, 4e9)
+    assert (row["timestamp"], row["camera"], row["frame"], row["dirty_segments"], row["cells"]) == (
+        "2024-03-12T10:15:42", "cam", 7, 3, "a0")
+
+
+def test_malformed_batches_are_rejected(client):
+    assert client.post("/receive_dirty_data", data="nope").status_code == 400
+    assert post(client, [], job_id=5).status_code == 400
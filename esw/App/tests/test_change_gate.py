@@ -0,0 +1,59 @@
+import cv2
+import numpy as np
+import pytest
+
+from change_gate import MIN_OBJECT_AREA, ChangeGate
+
+
+def scene(width, height, seed=0):
+    rng = np.random.default_rng(seed)
+    noise = rng.normal(110, 20, (height, width, 3)).clip(0, 255).astype(np.uint8)
+    return cv2.GaussianBlur(noise, (7, 7), 0)
+
+
+def with_object(frame, side, x=501, y=203):
+    frame = frame.copy()
+    cv2.rectangle(frame, (x, y), (x + side - 1, y + side - 1), (220, 220, 220), -1)
+    return frame
+
+
+def gate_after(reference, **kwargs):
+    gate = ChangeGate(**kwargs)
+    assert gate.needs_inference(reference)  # The first frame always goes through
+    return gate
+
+
+@pytest.mark.parametrize("width, height", [(640, 360), (1920, 1080), (3840, 2160)])
+def test_minimum_size_object_triggers_inference_at_any_crop_size(width, height):
+    base = scene(width, height)
+    side = int(np.ceil(np.sqrt(MIN_OBJECT_AREA)))
+    assert gate_after(base).needs_inference(with_object(base, side))
+    assert not gate_after(base).needs_inference(with_object(base, side // 2))
+
+
+def test_threshold_is_an_object_area_in_frame_pixels():
+    base = scene(1920, 1080)
+    frame = with_object(base, 30)  # 900 frame pixels
+    assert gate_after(base, min_object_area=800).needs_inference(frame)
+    assert not gate_after(base, min_object_area=1600).needs_inference(frame)
+
+
+def test_scattered_changes_do_not_add_up_to_an_object():
+    base = scene(1920, 1080)
+    frame = base.copy()
+    for i in range(40):
+        frame = with_object(frame, 4, x=40 + 45 * i, y=100 + 20 * (i % 10))
+    noisy = np.clip(frame.astype(int) + np.random.default_rng(1).integers(-8, 9, frame.shape), 0, 255)
+    assert not gate_after(base).needs_inference(noisy.astype(np.uint8))
+
+
+def test_refresh_is_forced_and_counted():
+    base = scene(640, 360)
+    gate = gate_after(base, refresh_every=3)
+    assert [gate.needs_inference(base) for _ in range(4)] == [False, False, False, True]
+    assert (gate.inferred, gate.skipped) == (2, 3)
+
+
+def test_a_new_frame_size_resets_the_reference():
+    gate = gate_after(scene(640, 360))
+    assert gate.needs_inference(scene(320, 180))
@@ -0,0 +1,67 @@
+import threading
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+import pytest
+
+from frame_ring import FrameRing, SharedMemoryFrames
+
+SHAPE = (48, 64, 3)
+
+
+@pytest.fixture
+def video(tmp_path):
+    # 10 frames whose brightness is their index * 20
+    path = str(tmp_path / "clip.avi")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 10, (SHAPE[1], SHAPE[0]))
+    for i in range(10):
+        writer.write(np.full(SHAPE, i * 20, np.uint8))
+    writer.release()
+    return path
+
+
+def test_ring_slots_are_shared_with_attached_rings():
+    ring = FrameRing(2, SHAPE)
+    other = FrameRing.attach(ring.spec)
+    shape = other.write(1, np.full((24, 32, 3), 7, np.uint8))
+    assert ring.view(1, shape).shape == (24, 32, 3) and (ring.view(1, shape) == 7).all()
+    with pytest.raises(ValueError):
+        ring.write(0, np.zeros((96, 64, 3), np.uint8))
+    other.close()
+    name = ring.spec[0]
+    ring.close()
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(name=name)
+
+
+def test_released_slots_are_reused_for_every_frame(video):
+    frames = SharedMemoryFrames(video, 1, SHAPE, slots=2, backend='opencv', scale=None)
+    seen, most_out = [], 0
+    for frame_index, frame in frames:
+        most_out = max(most_out, len(frames.slot_of))
+        seen.append((frame_index, int(round(frame.mean() / 20))))
+        frames.release(frame_index)
+        frames.release(frame_index)  # A second release is a no-op
+    frames.close()
+    assert seen == [(i, i) for i in range(10)]
+    assert most_out == 1 and frames.slot_of == {}
+    assert frames.decode_stats["frames_delivered"] == 10
+
+
+def test_the_decoder_waits_for_a_release_when_the_ring_is_full(video):
+    frames = SharedMemoryFrames(video, 1, SHAPE, slots=2, backend='opencv', scale=None)
+    timer = threading.Timer(2.0, frames.stop)  # Nothing is released, so only stop() ends the iteration
+    timer.start()
+    held = list(frames)
+    timer.join()
+    assert [frame_index for frame_index, _ in held] == [0, 1]
+    assert sorted(frames.slot_of) == [0, 1]
+    # The frames still held weren't overwritten by later ones
+    assert [int(round(frame.mean() / 20)) for _, frame in held] == [0, 1]
+    del held
+    name = frames.ring.spec[0]
+    frames.close()
+    assert not frames.process.is_alive()
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(name=name)
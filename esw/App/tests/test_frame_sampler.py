@@ -0,0 +1,51 @@
+import cv2
+import numpy as np
+import pytest
+
+from frame_sampler import FrameSampler
+
+
+@pytest.fixture
+def video(tmp_path):
+    path = str(tmp_path / "video.avi")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 25, (64, 48))
+    for i in range(100):
+        writer.write(np.full((48, 64, 3), i * 2, np.uint8))
+    writer.release()
+    return path
+
+
+def test_samples_every_interval(video):
+    sampler = FrameSampler(cv2.VideoCapture(video), 10)
+    frames = list(sampler)
+    assert [index for index, _ in frames] == list(range(0, 100, 10))
+    # Frame i is filled with 2 * i (give or take JPEG)
+    assert all(abs(int(frame.mean()) - 2 * index) <= 2 for index, frame in frames)
+    sampler.cap.release()
+
+
+def test_random_access(video):
+    sampler = FrameSampler(cv2.VideoCapture(video), 1)
+    assert abs(int(sampler.read(57).mean()) - 114) <= 2
+    assert abs(int(sampler.read(3).mean()) - 6) <= 2
+    assert sampler.read(150) is None
+    sampler.cap.release()
+
+
+def test_growing_file_is_read_to_the_end_after_growth_stops(video, tmp_path):
+    with open(video, 'rb') as f:
+        data = f.read()
+    partial = str(tmp_path / "partial.avi")
+    with open(partial, 'wb') as f:
+        f.write(data[:len(data) // 2])
+
+    def is_growing():
+        # The last chunk lands between the failed read and this check
+        with open(partial, 'wb') as f:
+            f.write(data)
+        return False
+
+    sampler = FrameSampler(cv2.VideoCapture(partial), 10, is_growing=is_growing,
+                           reopen=lambda: cv2.VideoCapture(partial), poll_interval=0)
+    assert [index for index, _ in sampler] == list(range(0, 100, 10))
+    sampler.cap.release()
@@ -0,0 +1,91 @@
+import socket
+import threading
+
+import numpy as np
+import pytest
+import requests
+
+pytest.importorskip("flask")
+from werkzeug.serving import make_server
+
+import inference_server
+from inference_backends import FallbackBackend, HttpBackend, InferenceBackend
+
+
+class FakeBackend(InferenceBackend):
+    # Answers with the frame's mean so results can be matched to frames
+    def __init__(self, name):
+        self.name = name
+        self.max_in_flight = 2
+        self.calls = 0
+        self.closed = False
+
+    def infer(self, frame):
+        self.calls += 1
+        return {"backend": self.name, "mean": float(frame.mean()), "predictions": []}
+
+    def close(self):
+        self.closed = True
+
+
+class FakeBatcher:
+    # inference_server.Batcher stand-in; the server answers without a model
+    def predict(self, frame):
+        return None
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def server_url(monkeypatch):
+    monkeypatch.setattr(inference_server, "batcher", FakeBatcher())
+    monkeypatch.setattr(inference_server, "roboflow_predictions", lambda result, confidence=0.0: [])
+    server = make_server("127.0.0.1", 0, inference_server.app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/infer"
+    server.shutdown()
+    thread.join()
+
+
+def frames(count):
+    return [(i, np.full((16, 16, 3), i * 10, np.uint8)) for i in range(count)]
+
+
+def test_the_local_server_is_used_while_it_is_up(server_url):
+    fallbacks = []
+    backend = FallbackBackend(HttpBackend(server_url, max_in_flight=2), lambda: fallbacks.append(1))
+    results = list(backend.infer_many(frames(4)))
+    backend.close()
+    assert [item for item, _ in results] == [0, 1, 2, 3]
+    assert all(result["image"] == {"width": 16, "height": 16} for _, result in results)
+    assert fallbacks == []
+
+
+def test_an_unreachable_server_switches_to_the_fallback_once():
+    made = []
+
+    def make_fallback():
+        made.append(FakeBackend("fallback"))
+        return made[-1]
+
+    primary = HttpBackend(f"http://127.0.0.1:{free_port()}/infer", max_in_flight=4, timeout=5)
+    backend = FallbackBackend(primary, make_fallback)
+    results = list(backend.infer_many(frames(8)))
+    # Every frame is answered, in order, by the one fallback built
+    assert [item for item, _ in results] == list(range(8))
+    assert [result["mean"] for _, result in results] == [i * 10 for i in range(8)]
+    assert len(made) == 1 and made[0].calls == 8
+    backend.close()
+    assert made[0].closed
+
+
+def test_other_errors_do_not_switch(server_url):
+    backend = FallbackBackend(HttpBackend(server_url.replace("/infer", "/missing")), lambda: FakeBackend("fallback"))
+    with pytest.raises(requests.HTTPError):
+        backend.infer(np.zeros((16, 16, 3), np.uint8))
+    assert backend.fallback is None
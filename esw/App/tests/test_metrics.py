@@ -0,0 +1,89 @@
+from metrics import LATENCY_BUCKETS, STAGE_METRIC, Metrics, stage_breakdown
+
+
+def sample_lines(text, name):
+    return [line for line in text.splitlines() if line.startswith(name) and not line.startswith("#")]
+
+
+def test_render_is_prometheus_text():
+    metrics = Metrics()
+    metrics.inc("esw_frames_total", outcome="inferred")
+    metrics.inc("esw_frames_total", 2, outcome="skipped")
+    metrics.set("esw_queue_depth", 3, queue="jobs")
+    metrics.set("custom", 1, path='a"b\\c')
+    text = metrics.render()
+
+    assert "# TYPE esw_frames_total counter" in text and "# TYPE esw_queue_depth gauge" in text
+    assert sample_lines(text, "esw_frames_total") == ['esw_frames_total{outcome="inferred"} 1',
+                                                      'esw_frames_total{outcome="skipped"} 2']
+    assert 'esw_queue_depth{queue="jobs"} 3' in text
+    # Unknown names are untyped and label values are escaped
+    assert "# TYPE custom untyped" in text and 'custom{path="a\\"b\\\\c"} 1' in text
+    assert text.endswith("\n")
+
+
+def test_histogram_buckets_are_cumulative():
+    metrics = Metrics()
+    for seconds in (0.0002, 0.003, 0.003, 100.0):
+        metrics.observe_stage("decode", seconds)
+    lines = sample_lines(metrics.render(), STAGE_METRIC)
+
+    buckets = [line for line in lines if "_bucket" in line]
+    assert len(buckets) == len(LATENCY_BUCKETS) + 1
+    assert buckets[0] == f'{STAGE_METRIC}_bucket{{stage="decode",le="0.0005"}} 1'
+    assert f'{STAGE_METRIC}_bucket{{stage="decode",le="0.005"}} 3' in buckets
+    assert buckets[-2].endswith(" 3") and buckets[-1] == f'{STAGE_METRIC}_bucket{{stage="decode",le="+Inf"}} 4'
+    assert f'{STAGE_METRIC}_sum{{stage="decode"}} 100.006200' in lines
+    assert f'{STAGE_METRIC}_count{{stage="decode"}} 4' in lines
+
+
+def test_deltas_only_carry_what_changed():
+    worker, parent = Metrics(), Metrics()
+    worker.inc("esw_results_total", 2)
+    worker.observe_stage("infer", 0.01)
+    parent.merge(worker.delta(), worker="0")
+
+    worker.inc("esw_results_total", 3)
+    worker.set("esw_workers_ready", 1)
+    second = worker.delta()
+    assert second["counters"] == {("esw_results_total", ()): 3} and second["histograms"] == {}
+    parent.merge(second, worker="0")
+    assert worker.delta()["counters"] == {}
+
+    snapshot = parent.snapshot()
+    assert snapshot["counters"] == {("esw_results_total", ()): 5}
+    # Gauges are current values and get the merging process's labels
+    assert snapshot["gauges"] == {("esw_workers_ready", (("worker", "0"),)): 1}
+    assert sum(snapshot["histograms"][(STAGE_METRIC, (("stage", "infer"),))][:-1]) == 1
+
+
+def test_merging_two_workers_adds_their_histograms():
+    parent = Metrics()
+    for _ in range(2):
+        worker = Metrics()
+        worker.observe_stage("infer", 0.02)
+        worker.observe_stage("infer", 0.2)
+        parent.merge(worker.delta())
+    values = parent.snapshot()["histograms"][(STAGE_METRIC, (("stage", "infer"),))]
+    assert sum(values[:-1]) == 4 and round(values[-1], 6) == 0.44
+
+
+def test_stage_timer_and_listeners():
+    metrics = Metrics()
+    heard = []
+    metrics.stage_listeners.append(lambda stage, seconds: heard.append(stage))
+    with metrics.time("write"):
+        pass
+    assert heard == ["write"] and f'{STAGE_METRIC}_count{{stage="write"}} 1' in metrics.render()
+
+
+def test_stage_breakdown_accumulates_deltas():
+    metrics = Metrics()
+    metrics.observe_stage("infer", 0.01)
+    metrics.inc("esw_ocr_total", outcome="read")
+    breakdown = stage_breakdown(metrics.delta())
+    metrics.observe_stage("infer", 0.03)
+    metrics.inc("esw_ocr_total", outcome="read")
+    breakdown = stage_breakdown(metrics.delta(), breakdown)
+    assert breakdown["stages"] == {"infer": {"count": 2, "total_s": 0.04, "mean_ms": 20.0}}
+    assert breakdown["counters"] == {'esw_ocr_total{outcome="read"}': 2}
@@ -0,0 +1,151 @@
+import json
+from datetime import datetime, timedelta
+
+import cv2
+import numpy as np
+import pytest
+
+pytest.importorskip("easyocr")
+
+import OCR
+from ocr_cache import OcrCache
+from timestamps import format_timestamp, parse_timestamp
+
+START = datetime(2024, 3, 12, 10, 0, 0)
+FPS = 4
+
+
+class FakeReader:
+    # easyocr.Reader stand-in returning fixed texts and counting calls
+    def __init__(self, recognized=(), read=()):
+        self.recognized = recognized
+        self.read = read
+        self.calls = {"recognize": 0, "readtext": 0}
+
+    def recognize(self, image, allowlist=None):
+        self.calls["recognize"] += 1
+        return [(None, text, 0.9) for text in self.recognized]
+
+    def readtext(self, image, allowlist=None):
+        self.calls["readtext"] += 1
+        return [(None, text, 0.9) for text in self.read]
+
+
+@pytest.fixture(autouse=True)
+def ocr_cache(tmp_path, monkeypatch):
+    # A fresh cache per test instead of the user's ~/.cache one
+    cache = OcrCache('easyocr', OCR.OCR_CACHE_VERSION, path=str(tmp_path / "ocr.sqlite"))
+    monkeypatch.setattr(OCR, "_ocr_cache", cache)
+    monkeypatch.chdir(tmp_path)  # extract_timestamp_frames saves frames in the working directory
+    yield cache
+    cache.close()
+
+
+def crop(seed=0):
+    return np.random.default_rng(seed).integers(0, 255, (120, 545, 3), dtype=np.uint8)
+
+
+def make_video(path, minutes):
+    # Each frame shows its own index as three base-16 digits in grey levels, which survive compression
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*'mp4v'), FPS, (96, 64))
+    for i in range(int(minutes * 60 * FPS)):
+        frame = np.zeros((64, 96, 3), np.uint8)
+        for block, digit in enumerate((i // 256, i // 16 % 16, i % 16)):
+            frame[:, block * 32:(block + 1) * 32] = digit * 16
+        writer.write(frame)
+    writer.release()
+    return str(path)
+
+
+def frame_index(frame):
+    digits = [int(round(frame[8:56, block * 32 + 4:block * 32 + 28].mean() / 16)) for block in range(3)]
+    return digits[0] * 256 + digits[1] * 16 + digits[2]
+
+
+def clock_ocr(calls):
+    # ocr_frame stand-in that reads the camera clock of the synthetic video
+    def ocr_frame(reader, frame, fast=True):
+        calls.append(frame_index(frame))
+        return format_timestamp(START + timedelta(seconds=frame_index(frame) // FPS))
+    return ocr_frame
+
+
+# Recognition-only fast path
+
+def test_fast_path_reads_the_crop_without_text_detection():
+    reader = FakeReader(recognized=["12-03-2024", "10:15:42"])
+    assert OCR.read_timestamp(reader, crop(), fast=True) == "12-03-2024 10:15:42"
+    assert reader.calls == {"recognize": 1, "readtext": 0}
+
+
+def test_fast_path_falls_back_to_readtext():
+    reader = FakeReader(recognized=["12-03"], read=["12-03-2024 10:15:42"])
+    assert OCR.read_timestamp(reader, crop(), fast=True) == "12-03-2024 10:15:42"
+    assert reader.calls == {"recognize": 1, "readtext": 1}
+
+
+def test_full_mode_skips_the_recognizer():
+    reader = FakeReader(read=["x", "12-03-2024 10:15:42"])
+    assert OCR.read_timestamp(reader, crop(), fast=False) == "12-03-2024 10:15:42"
+    assert reader.calls == {"recognize": 0, "readtext": 1}
+
+
+def test_preprocessed_crop_is_binary_at_the_recognizer_height():
+    binary = OCR.preprocess_timestamp(crop())
+    assert binary.shape[0] == OCR.FAST_OCR_HEIGHT and set(np.unique(binary)) <= {0, 255}
+
+
+def test_cached_reads_skip_the_reader():
+    reader = FakeReader(recognized=["12-03-2024 10:15:42"])
+    OCR.read_timestamp(reader, crop(), fast=True)
+    assert OCR.read_timestamp(reader, crop(), fast=True) == "12-03-2024 10:15:42"
+    assert reader.calls["recognize"] == 1
+    unreadable = FakeReader()
+    assert OCR.read_timestamp(unreadable, crop(1), fast=True) is None
+    # A failed fast read doesn't stop a full read of the same crop
+    assert OCR.read_timestamp(FakeReader(read=["12-03-2024 10:15:43"]), crop(1), fast=False) == "12-03-2024 10:15:43"
+
+
+# Sharded extraction
+
+def test_shards_are_whole_minutes_covering_the_video(tmp_path):
+    video = make_video(tmp_path / "clip.mp4", 2.5)
+    assert OCR.plan_shards(video) == [(video, 0, None)]
+    assert OCR.plan_shards(video, shard_minutes=1) == [(video, 0, 240), (video, 240, 480), (video, 480, 600)]
+
+
+def test_sharded_run_matches_one_pass(tmp_path, monkeypatch):
+    folder = tmp_path / "videos"
+    folder.mkdir()
+    make_video(folder / "a.mp4", 3)
+    make_video(folder / "b.mp4", 2)
+    monkeypatch.setattr(OCR, "ocr_frame", clock_ocr([]))
+    monkeypatch.setattr(OCR.easyocr, "Reader", lambda languages: FakeReader())
+
+    whole = OCR.process_videos_in_folder(str(folder), workers=1, manifest_path="whole.json", interpolate=False)
+    sharded = OCR.process_videos_in_folder(str(folder), workers=1, shard_minutes=1, manifest_path="sharded.json",
+                                           interpolate=False)
+    key = lambda record: (record["video"], record["frame"], record["timestamp"])
+    assert sorted(map(key, whole)) == sorted(map(key, sharded))
+    assert len(whole) == 5  # The last frame of every minute
+    manifest = json.loads((tmp_path / "sharded.json").read_text())
+    assert [frame["frame"] for frame in manifest["frames"]] == [240, 480, 720, 240, 480]
+    assert manifest["videos"][str(folder / "a.mp4")] == {"frames": 3, "with_timestamp": 3}
+
+
+# Interpolated timestamps
+
+def test_interpolated_timestamps_match_reading_every_frame(tmp_path, monkeypatch):
+    video = make_video(tmp_path / "clip.mp4", 10)
+    every, anchors = [], []
+    monkeypatch.setattr(OCR, "ocr_frame", clock_ocr(every))
+    read = OCR.extract_timestamp_frames(video, reader=FakeReader(), interpolate=False)
+    monkeypatch.setattr(OCR, "ocr_frame", clock_ocr(anchors))
+    interpolated = OCR.extract_timestamp_frames(video, reader=FakeReader(), interpolate=True)
+
+    assert [r["frame"] for r in read] == [r["frame"] for r in interpolated]
+    for expected, actual in zip(read, interpolated):
+        difference = parse_timestamp(actual["timestamp"]) - parse_timestamp(expected["timestamp"])
+        assert abs(difference.total_seconds()) <= 1
+    assert len(every) == 10 and len(anchors) < len(every)
+    assert {r["source"] for r in interpolated} == {"ocr", "interpolated"}
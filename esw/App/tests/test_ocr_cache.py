@@ -0,0 +1,61 @@
+import sqlite3
+
+import pytest
+
+from ocr_cache import MISS, OcrCache
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "ocr.sqlite")
+
+
+def test_timestamps_are_shared_across_modes(path):
+    cache = OcrCache('easyocr', 'v1', path=path)
+    cache.put('key', '12-03-2024 10:15:42', mode='fast')
+    cache.close()
+    cache = OcrCache('easyocr', 'v1', path=path)
+    assert cache.get('key', mode='full') == '12-03-2024 10:15:42'
+    cache.close()
+
+
+def test_timestamps_are_scoped_to_the_version(path):
+    cache = OcrCache('easyocr', 'v1', path=path)
+    cache.put('key', '12-03-2024 10:15:42')
+    cache.close()
+    cache = OcrCache('easyocr', 'v2', path=path)
+    assert cache.get('key') is MISS
+    cache.close()
+
+
+def test_other_engines_are_only_read_at_the_mapped_version(path):
+    cache = OcrCache('easyocr', 'v1', path=path)
+    cache.put('key', '12-03-2024 10:15:42')
+    cache.close()
+    for also_read, expected in [(None, MISS), ({'easyocr': 'v0'}, MISS), ({'easyocr': 'v1'}, '12-03-2024 10:15:42')]:
+        other = OcrCache('tesseract', 'v9', path=path, also_read=also_read)
+        assert other.get('key') == expected
+        other.close()
+
+
+def test_failed_reads_are_only_reused_by_the_same_mode(path):
+    cache = OcrCache('easyocr', 'v1', path=path)
+    cache.put('key', None, mode='full')
+    assert cache.get('key', mode='full') is None
+    assert cache.get('key', mode='fast') is MISS
+    cache.close()
+    cache = OcrCache('easyocr', 'v1', path=path)
+    assert cache.get('key', mode='full') is None and cache.get('key', mode='fast') is MISS
+    cache.close()
+
+
+def test_writes_are_batched_until_flush(path):
+    cache = OcrCache('easyocr', 'v1', path=path)
+    for i in range(10):
+        cache.put(f'key{i}', f'ts{i}')
+    db = sqlite3.connect(path)
+    assert db.execute("SELECT COUNT(*) FROM ocr").fetchone() == (0,)
+    cache.flush()
+    assert db.execute("SELECT COUNT(*) FROM ocr").fetchone() == (10,)
+    db.close()
+    cache.close()
@@ -0,0 +1,42 @@
+import numpy as np
+
+from overlap import grid_cells, cell_areas, dirty_cells
+
+
+def test_grid_cells_row_major_with_active_mask():
+    active = np.array([[1, 0, 1], [0, 1, 0]], dtype=bool)
+    cells = grid_cells(300, 200, 2, 3, active=active)
+    assert cells.tolist() == [[0, 0, 100, 100], [200, 0, 300, 100], [100, 100, 200, 200]]
+
+
+def test_dirty_cells_threshold():
+    cells = grid_cells(200, 100, 1, 2)
+    # Covers 60% of the left cell and 10% of the right one
+    boxes = np.array([[40, 0, 110, 100]])
+    assert cell_areas(cells).tolist() == [10000, 10000]
+    assert dirty_cells(cells, boxes, 0.5).tolist() == [True, False]
+    assert dirty_cells(cells, boxes, 0.6).tolist() == [False, False]
+
+
+def test_dirty_cells_sums_overlapping_boxes():
+    cells = grid_cells(100, 100, 1, 1)
+    boxes = np.array([[0, 0, 50, 100], [0, 0, 50, 100]])
+    assert dirty_cells(cells, boxes, 0.9).tolist() == [True]
+
+
+def test_dirty_cells_without_boxes():
+    cells = grid_cells(100, 100, 2, 2)
+    assert dirty_cells(cells, np.zeros((0, 4)), 0.4).tolist() == [False] * 4
+
+
+def test_dirty_cells_matches_per_cell_loop():
+    rng = np.random.default_rng(0)
+    cells = grid_cells(640, 480, 8, 12)
+    xy = rng.uniform(0, 600, (20, 2))
+    boxes = np.hstack([xy, xy + rng.uniform(5, 120, (20, 2))])
+    expected = []
+    for x1, y1, x2, y2 in cells:
+        covered = sum(max(0, min(x2, bx2) - max(x1, bx1)) * max(0, min(y2, by2) - max(y1, by1))
+                      for bx1, by1, bx2, by2 in boxes)
+        expected.append(covered > 0.4 * (x2 - x1) * (y2 - y1))
+    assert dirty_cells(cells, boxes, 0.4).tolist() == expected
@@ -0,0 +1,110 @@
+import time
+
+import numpy as np
+import pytest
+
+from pipeline import FramePipeline
+
+
+class _Tensor:
+    # Just enough of a torch tensor (.cpu().numpy()) and of an Ultralytics result (.boxes.xyxy)
+    def __init__(self, values):
+        self.values = values
+        self.xyxy = self
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self.values
+
+
+class _Result:
+    def __init__(self, xyxy):
+        self.boxes = _Tensor(xyxy)
+
+
+class FakeModel:
+    # One box per image whose corner is the image's first pixel value, so boxes can be matched to frames
+    def __init__(self, fail=False):
+        self.batches = []
+        self.fail = fail
+
+    def predict(self, source, **kwargs):
+        if self.fail:
+            raise RuntimeError("model failed")
+        self.batches.append(len(source))
+        return [_Result(np.array([[v, v, v + 1, v + 1]], dtype=np.float32))
+                for v in (float(image[0, 0]) for image in source)]
+
+
+def frames(count):
+    return [(i, np.full((8, 8), i, dtype=np.uint8)) for i in range(count)]
+
+
+def test_results_keep_frame_order_and_their_own_boxes():
+    model = FakeModel()
+    out = list(FramePipeline(frames(23), model, batch_size=4))
+    assert [index for index, _, _ in out] == list(range(23))
+    assert all(frame[0, 0] == index and boxes[0, 0] == index for index, frame, boxes in out)
+
+
+def test_frames_are_inferred_in_full_batches():
+    model = FakeModel()
+    list(FramePipeline(frames(10), model, batch_size=4, batch_timeout=5))
+    assert model.batches == [4, 4, 2]
+
+
+def test_a_slow_source_does_not_hold_a_batch_back():
+    def slow():
+        for item in frames(3):
+            yield item
+            time.sleep(0.3)
+
+    model = FakeModel()
+    list(FramePipeline(slow(), model, batch_size=8, batch_timeout=0.05))
+    assert sum(model.batches) == 3 and max(model.batches) < 3
+
+
+def test_gated_frames_reuse_the_last_inferred_boxes():
+    class EvenGate:
+        def needs_inference(self, frame):
+            return frame[0, 0] % 2 == 0
+
+    model = FakeModel()
+    out = list(FramePipeline(frames(6), model, batch_size=3, gate=EvenGate()))
+    assert [boxes[0, 0] for _, _, boxes in out] == [0, 0, 2, 2, 4, 4]
+    assert sum(model.batches) == 3
+
+
+def test_crop_boxes_are_returned_in_frame_coordinates():
+    image = np.zeros((20, 20), dtype=np.uint8)
+    image[5, 10] = 7  # First pixel of the crop
+    model = FakeModel()
+    ((_, frame, boxes),) = list(FramePipeline([(0, image)], model, crop=(10, 5, 20, 15)))
+    assert frame.shape == (20, 20)
+    assert boxes.tolist() == [[17, 12, 18, 13]]
+
+
+def test_stage_errors_reach_the_caller():
+    def broken():
+        yield from frames(2)
+        raise IOError("decode failed")
+
+    with pytest.raises(IOError, match="decode failed"):
+        list(FramePipeline(broken(), FakeModel()))
+    with pytest.raises(RuntimeError, match="model failed"):
+        list(FramePipeline(frames(2), FakeModel(fail=True)))
+
+
+def test_closing_early_stops_the_threads():
+    pipeline = FramePipeline(frames(100), FakeModel(), batch_size=2, queue_size=2)
+    for index, _, _ in pipeline:
+        if index == 3:
+            break
+    assert pipeline.threads == [] and pipeline.stop_event.is_set()
+
+
+def test_batch_size_must_be_positive():
+    with pytest.raises(ValueError):
+        FramePipeline(frames(1), FakeModel(), batch_size=0)
@@ -0,0 +1,42 @@
+import json
+
+import numpy as np
+import pytest
+
+from regions import CameraLayout, _parse_bitmap, max_grid_cells, union_crop
+
+
+def test_parse_bitmap():
+    mask = _parse_bitmap(["101", "010"], 2, 3)
+    assert mask.tolist() == [[True, False, True], [False, True, False]]
+
+
+@pytest.mark.parametrize("rows_text", [["101"], ["101", "01"], ["101", "0101"]])
+def test_parse_bitmap_rejects_wrong_shape(rows_text):
+    with pytest.raises(ValueError):
+        _parse_bitmap(rows_text, 2, 3)
+
+
+def test_union_crop_adds_margin_and_rounds_to_even_pixels():
+    crop = union_crop([[0.2, 0.3, 0.4, 0.5], [0.5, 0.25, 0.6, 0.4]], 1001, 801, margin=0.01)
+    assert crop == (190, 192, 612, 410)
+    assert all(v % 2 == 0 for v in crop)
+
+
+def test_union_crop_is_clipped_to_the_frame():
+    assert union_crop([[0.0, 0.0, 1.0, 1.0]], 640, 480, margin=0.05) == (0, 0, 640, 480)
+
+
+def test_layout_crop_covers_the_active_cells():
+    layout = CameraLayout.from_config("cam", {"grid": {"rows": 2, "cols": 2}, "active_cells": ["01", "00"],
+                                              "roi": {"margin": 0}})
+    assert layout.crop(200, 100) == (100, 0, 200, 50)
+    cells, dirty = layout.dirty(np.array([[100, 0, 200, 50]]), 200, 100)
+    assert cells.tolist() == [[100, 0, 200, 50]] and dirty.tolist() == [True]
+
+
+def test_max_grid_cells(tmp_path):
+    assert max_grid_cells(str(tmp_path)) == 24 * 12
+    (tmp_path / "big.json").write_text(json.dumps({"grid": {"rows": 48, "cols": 24}}))
+    (tmp_path / "small.json").write_text(json.dumps({"grid": {"rows": 2, "cols": 4}}))
+    assert max_grid_cells(str(tmp_path)) == 48 * 24
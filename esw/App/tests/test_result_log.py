@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from result_log import ResultLog, cell_bytes_for, pack_cells, to_seconds
+
+DAY = to_seconds("2024-03-12T00:00:00")
+
+
+@pytest.fixture
+def log(tmp_path):
+    log = ResultLog(str(tmp_path / "log"), flush_interval=60, cell_bytes=cell_bytes_for(48 * 24))
+    yield log
+    log.close()
+
+
+def cells_of(row):
+    return np.nonzero(np.unpackbits(np.frombuffer(bytes.fromhex(row["cells"]), np.uint8)))[0].tolist()
+
+
+def test_large_grid_bitmap_round_trips(log):
+    dirty = np.zeros(48 * 24, dtype=bool)
+    dirty[[0, 500, 48 * 24 - 1]] = True
+    log.append("cam", "job", 1, DAY + 10, 3, dirty)
+    log.flush()
+    (row,) = log.query(DAY, DAY + 3600)
+    assert cells_of(row) == [0, 500, 48 * 24 - 1]
+
+
+def test_bitmap_that_doesnt_fit_is_refused():
+    with pytest.raises(ValueError):
+        pack_cells(np.ones(24 * 12 + 1, dtype=bool))
+    assert len(pack_cells(np.ones(24 * 12, dtype=bool))) == 36
+
+
+def test_width_is_kept_by_an_existing_log(log):
+    log.append("cam", "job", 1, DAY, 0)
+    log.flush()
+    reopened = ResultLog(log.folder, cell_bytes=36)
+    assert reopened.cell_bytes == cell_bytes_for(48 * 24)
+    assert len(reopened.query(DAY, DAY + 60)) == 1
+    reopened.close()
+
+
+def test_query_filters_by_camera_job_and_time(log):
+    for i in range(6):
+        log.append("cam-a" if i % 2 else "cam-b", f"job{i % 3}", i, DAY + i * 600, i)
+    log.flush()
+    rows = log.query(DAY, DAY + 86400, camera="cam-a")
+    assert [row["frame"] for row in rows] == [1, 3, 5]
+    assert [row["frame"] for row in log.query(DAY, DAY + 86400, job="job0")] == [0, 3]
+    assert [row["frame"] for row in log.query(DAY + 600, DAY + 1800)] == [1, 2]
+    assert log.query(DAY, DAY + 86400, job="unknown") == []
+
+
+def test_aggregate_by_hour_and_day(log):
+    for i, count in enumerate([1, 5, 3]):
+        log.append("cam", "job", i, DAY + i * 1800, count)
+    log.append("cam", "job", 3, DAY + 86400 + 60, 7)
+    log.flush()
+    hours = log.aggregate(DAY, DAY + 2 * 86400, "hour")
+    assert [(row["bucket"], row["count"], row["sum"], row["min"], row["max"]) for row in hours] == [
+        ("2024-03-12T00:00:00", 2, 6, 1, 5), ("2024-03-12T01:00:00", 1, 3, 3, 3),
+        ("2024-03-13T00:00:00", 1, 7, 7, 7)]
+    days = log.aggregate(DAY, DAY + 2 * 86400, "day")
+    assert [(row["count"], row["mean"]) for row in days] == [(3, 3.0), (1, 7.0)]
@@ -0,0 +1,48 @@
+import threading
+
+from result_store import JobResults, ResultStore
+
+
+def test_cursor_reads_only_new_results():
+    job = JobResults("job")
+    for i in range(3):
+        assert job.append({"frame": i}) == i
+    items, cursor = job.read(0)
+    assert [item["frame"] for item in items] == [0, 1, 2] and cursor == 3
+    assert job.read(cursor) == ([], 3)
+    job.append({"frame": 3})
+    assert job.read(cursor) == ([{"frame": 3}], 4)
+
+
+def test_readers_dont_take_results_from_each_other():
+    job = JobResults("job")
+    job.append({"frame": 0})
+    assert job.read(0)[0] == job.read(0)[0] == [{"frame": 0}]
+
+
+def test_old_results_are_dropped_past_capacity():
+    job = JobResults("job", capacity=3)
+    for i in range(5):
+        job.append({"frame": i})
+    items, cursor = job.read(0)
+    assert [item["frame"] for item in items] == [2, 3, 4] and cursor == 5
+    assert [item["frame"] for item in job.read(4)[0]] == [4]
+
+
+def test_wait_wakes_up_on_append_and_finish():
+    job = JobResults("job")
+    assert job.wait(0, timeout=0.01) is False
+    threading.Timer(0.05, job.append, args=({"frame": 0},)).start()
+    assert job.wait(0, timeout=5) is True
+    threading.Timer(0.05, job.finish).start()
+    assert job.wait(1, timeout=5) is False and job.finished
+
+
+def test_store_keeps_latest_and_evicts_oldest_finished_jobs():
+    store = ResultStore(max_finished_jobs=1)
+    for job_id in ("a", "b", "c"):
+        store.append(job_id, {"frame": 0})
+    assert store.latest().job_id == "c"
+    store.finish("a")
+    store.finish("b")
+    assert store.get("a") is None and store.get("b") is not None
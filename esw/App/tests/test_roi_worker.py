@@ -0,0 +1,88 @@
+import queue
+import sys
+import types
+
+import pytest
+
+from roi_worker import worker_main
+
+
+@pytest.fixture
+def fake_roi(monkeypatch):
+    # Stands in for ROI.py: the worker loop is tested without torch/ultralytics
+    roi = types.SimpleNamespace(loads=0)
+
+    def load_model(model_path=None):
+        roi.loads += 1
+        return "model"
+
+    def process_video(video_path, model, on_result=None, should_stop=None, frames=3, fail=False, **params):
+        if fail:
+            raise IOError(f"Could not open {video_path}")
+        for i in range(frames):
+            if should_stop():
+                return {"frames_processed": i}
+            on_result({"frame": f"frame_{i}.jpg", "dirty_segments": i})
+        return {"frames_processed": frames}
+
+    roi.load_model = load_model
+    roi.process_video = process_video
+    monkeypatch.setitem(sys.modules, "ROI", roi)
+    return roi
+
+
+def run_worker(jobs, control=()):
+    job_queue, control_queue, event_queue = queue.Queue(), queue.Queue(), queue.Queue()
+    for job in list(jobs) + [None]:
+        job_queue.put(job)
+    for message in control:
+        control_queue.put(message)
+    worker_main(0, job_queue, control_queue, event_queue, None, 0)
+    events = []
+    while not event_queue.empty():
+        events.append(event_queue.get())
+    return events
+
+
+def kinds(events, job_id=None):
+    return [(kind, payload.get("state")) for kind, _, job, payload in events
+            if kind != "metrics" and (job_id is None or job == job_id)]
+
+
+def test_model_is_loaded_once_for_every_job(fake_roi):
+    events = run_worker([("a", "a.mp4", {}), ("b", "b.mp4", {"frames": 2})])
+    assert fake_roi.loads == 1
+    assert events[0][0] == "ready"
+    assert kinds(events, "a") == [("status", "running")] + [("result", None)] * 3 + [("status", "done")]
+    assert kinds(events, "b") == [("status", "running")] + [("result", None)] * 2 + [("status", "done")]
+    done = [payload for kind, _, job, payload in events if kind == "status" and payload["state"] == "done"]
+    assert [status["summary"] for status in done] == [{"frames_processed": 3}, {"frames_processed": 2}]
+
+
+def test_every_job_sends_its_metrics(fake_roi):
+    events = run_worker([("a", "a.mp4", {})])
+    assert [kind for kind, _, job, _ in events if job == "a"][-2:] == ["metrics", "status"]
+
+
+def test_cancel_stops_only_the_named_job(fake_roi):
+    events = run_worker([("a", "a.mp4", {}), ("b", "b.mp4", {})], control=[("cancel", "a"), ("cancel", "x")])
+    assert kinds(events, "a") == [("status", "running"), ("status", "cancelled")]
+    assert kinds(events, "b")[-1] == ("status", "done")
+
+
+def test_a_failed_job_does_not_stop_the_worker(fake_roi):
+    events = run_worker([("a", "a.mp4", {"fail": True}), ("b", "b.mp4", {})])
+    failed = [payload for kind, _, job, payload in events if job == "a" and kind == "status"][-1]
+    assert failed["state"] == "failed" and "Could not open a.mp4" in failed["error"]
+    assert kinds(events, "b")[-1] == ("status", "done")
+
+
+def test_startup_errors_are_reported(fake_roi):
+    def broken(model_path=None):
+        raise RuntimeError("no weights")
+
+    fake_roi.load_model = broken
+    event_queue = queue.Queue()
+    with pytest.raises(RuntimeError):
+        worker_main(3, queue.Queue(), queue.Queue(), event_queue, None, 0)
+    assert event_queue.get_nowait() == ("startup_error", 3, None, {"error": "no weights"})
@@ -0,0 +1,96 @@
+import pytest
+
+from result_log import ResultLog, to_seconds
+from rollups import Rollups
+
+DAY = to_seconds("2024-03-12T00:00:00")
+
+
+@pytest.fixture
+def rollups(tmp_path):
+    rollups = Rollups(str(tmp_path / "rollups.json"), save_interval=60)
+    yield rollups
+    rollups.close()
+
+
+def test_hour_and_day_totals(rollups):
+    for offset, count in [(0, 2), (600, 4), (3600, 1)]:
+        rollups.add("cam", DAY + offset, count)
+    rollups.add("other", DAY + 60, 10)
+    hours = rollups.series("hour", camera="cam")
+    assert [(row["count"], row["sum"], row["min"], row["max"], row["mean"]) for row in hours] == [
+        (2, 6, 2, 4, 3.0), (1, 1, 1, 1, 1.0)]
+    (day,) = rollups.series("day")
+    assert (day["bucket"], day["count"], day["sum"], day["max"]) == ("2024-03-12T00:00:00", 4, 17, 10)
+    assert rollups.cameras() == ["cam", "other"]
+    assert rollups.series("hour", start=DAY + 3600) == hours[1:]
+
+
+def test_saved_totals_are_loaded_again(rollups):
+    rollups.add("cam", DAY, 3)
+    rollups.save()
+    reloaded = Rollups(rollups.path, save_interval=60)
+    assert reloaded.loaded and reloaded.series("day") == rollups.series("day")
+    reloaded.close()
+
+
+def test_rebuild_from_the_result_log_matches_live_totals(rollups, tmp_path):
+    log = ResultLog(str(tmp_path / "log"), flush_interval=60)
+    for i in range(30):
+        seconds = DAY + i * 1700
+        camera = "cam-a" if i % 3 else "cam-b"
+        log.append(camera, "job", i, seconds, i % 7)
+        rollups.add(camera, seconds, i % 7)
+    log.close()
+    rebuilt = Rollups(str(tmp_path / "rebuilt.json"), save_interval=60)
+    rebuilt.rebuild(log)
+    for bucket in ("hour", "day"):
+        for camera in ("cam-a", "cam-b", None):
+            assert rebuilt.series(bucket, camera=camera) == rollups.series(bucket, camera=camera)
+    rebuilt.close()
+
+
+def log_rows(log, rows):
+    for i, (camera, seconds, count) in enumerate(rows):
+        log.append(camera, "job", i, seconds, count)
+    log.flush()
+
+
+def test_followed_log_is_replayed_past_the_saved_position(tmp_path):
+    log = ResultLog(str(tmp_path / "log"), flush_interval=60)
+    path = str(tmp_path / "rollups.json")
+    rollups = Rollups(path, save_interval=60)
+    rollups.follow(log)
+    log_rows(log, [("cam", DAY + i * 900, i % 5) for i in range(40)])
+    rollups.save()
+    # Written to the log after the last save, then the server dies before saving again
+    log_rows(log, [("cam", DAY + 86400 + i * 900, 2) for i in range(10)] + [("other", DAY + 60, 9)])
+    rollups.stopped.set()
+
+    reloaded = Rollups(path, save_interval=60)
+    assert reloaded.loaded
+    reloaded.follow(log)
+    rebuilt = Rollups(str(tmp_path / "rebuilt.json"), save_interval=60)
+    rebuilt.rebuild(log)
+    for bucket in ("hour", "day"):
+        for camera in ("cam", "other", None):
+            assert reloaded.series(bucket, camera=camera) == rebuilt.series(bucket, camera=camera)
+    assert sum(row["count"] for row in reloaded.series("day")) == 51
+    log_rows(log, [("cam", DAY, 1)])
+    assert sum(row["count"] for row in reloaded.series("day")) == 52
+    log.close()
+    reloaded.close()
+    rebuilt.close()
+
+
+def test_rollups_without_a_position_are_rebuilt(tmp_path):
+    log = ResultLog(str(tmp_path / "log"), flush_interval=60)
+    log_rows(log, [("cam", DAY, 3), ("cam", DAY + 60, 5)])
+    path = tmp_path / "rollups.json"
+    path.write_text('{"hour": {"cam": {"0": [7, 7, 1, 1]}}, "day": {}}')
+    rollups = Rollups(str(path), save_interval=60)
+    assert not rollups.loaded
+    rollups.follow(log)
+    assert [(row["count"], row["sum"]) for row in rollups.series("hour")] == [(2, 8)]
+    log.close()
+    rollups.close()
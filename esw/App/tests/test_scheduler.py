@@ -0,0 +1,147 @@
+import queue
+import time
+
+import pytest
+
+import scheduler as scheduler_module
+from scheduler import JobScheduler
+
+
+class FakeProcess:
+    def __init__(self, alive=True):
+        self.alive = alive
+        self.exitcode = None if alive else 1
+        self.pid = 1234
+
+    def is_alive(self):
+        return self.alive
+
+    def join(self, timeout=None):
+        pass
+
+
+class FakeWorker:
+    # Parent-side handle without a process behind it; the test plays the worker over the event queue
+    def __init__(self, worker_id, alive=True):
+        self.worker_id = worker_id
+        self.job_queue = queue.Queue()
+        self.control_queue = queue.Queue()
+        self.process = FakeProcess(alive)
+        self.ready = False
+        self.job_id = None
+        self.start_failures = 0
+        self.restart_at = None
+        self.given_up = False
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not met in time")
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def make_scheduler(monkeypatch):
+    schedulers = []
+
+    def make(num_workers=2, alive=True, start=True):
+        statuses = []
+        sched = JobScheduler(num_workers=num_workers, on_status=lambda job_id, status: statuses.append((job_id, status)))
+        sched.spawned = []
+
+        def spawn(worker_id):
+            worker = FakeWorker(worker_id, alive)
+            sched.spawned.append(worker)
+            return worker
+
+        monkeypatch.setattr(sched, "_spawn", spawn)
+        sched.event_queue = queue.Queue()
+        sched.statuses = statuses
+        if start:
+            sched.start()
+            schedulers.append(sched)
+        else:
+            sched.workers = [spawn(i) for i in range(num_workers)]
+        return sched
+
+    yield make
+    for sched in schedulers:
+        sched.running = False
+        sched.listener.join(timeout=5)
+
+
+def test_jobs_are_dispatched_fifo_to_ready_idle_workers(make_scheduler):
+    sched = make_scheduler()
+    jobs = [sched.submit(f"{name}.mp4", job_id=name, output_folder=name) for name in "abc"]
+    assert [sched.status(job_id)["queue_position"] for job_id in jobs] == [0, 1, 2]
+
+    sched.event_queue.put(("ready", 1, None, {}))
+    wait_until(lambda: sched.status("a")["state"] == "running")
+    assert sched.workers[1].job_queue.get_nowait() == ("a", "a.mp4", {"output_folder": "a"})
+    sched.event_queue.put(("ready", 0, None, {}))
+    wait_until(lambda: sched.status("b")["state"] == "running")
+    assert sched.status("c")["queue_position"] == 0
+
+    sched.event_queue.put(("result", 1, "a", {"frame": "frame_0.jpg"}))
+    sched.event_queue.put(("status", 1, "a", {"state": "done"}))
+    wait_until(lambda: sched.status("c")["state"] == "running")
+    assert sched.status("c")["worker"] == 1
+    assert sched.status("a")["frames_processed"] == 1
+    assert ("a", {"state": "done"}) in sched.statuses
+
+
+def test_cancel_queued_and_running_jobs(make_scheduler):
+    sched = make_scheduler(num_workers=1)
+    sched.event_queue.put(("ready", 0, None, {}))
+    wait_until(lambda: sched.workers[0].ready)
+    sched.submit("a.mp4", job_id="a")
+    sched.submit("b.mp4", job_id="b")
+
+    assert sched.cancel("b")
+    assert sched.status("b")["state"] == "cancelled" and ("b", {"state": "cancelled"}) in sched.statuses
+    assert sched.cancel("a")
+    assert sched.workers[0].control_queue.get_nowait() == ("cancel", "a")
+    assert sched.status("a")["state"] == "running" and sched.status("a")["cancel_requested"]
+
+    sched.event_queue.put(("status", 0, "a", {"state": "cancelled"}))
+    wait_until(lambda: sched.status("a")["state"] == "cancelled")
+    assert not sched.cancel("a") and not sched.cancel("unknown")
+
+
+def test_workers_that_die_while_starting_are_restarted_with_backoff(make_scheduler, monkeypatch):
+    monkeypatch.setattr(scheduler_module, "RESTART_DELAY", 1.0)
+    monkeypatch.setattr(scheduler_module, "MAX_START_FAILURES", 4)
+    sched = make_scheduler(num_workers=1, alive=False, start=False)
+    sched.worker_error = "no weights"
+    sched.submit("a.mp4", job_id="a")
+
+    delays = []
+    for _ in range(3):
+        sched._check_workers()  # Notices the death and schedules the restart
+        worker = sched.workers[0]
+        delays.append(round(worker.restart_at - time.monotonic()))
+        worker.restart_at = 0  # Time passes
+        sched._check_workers()  # Starts the replacement, which dies again
+    assert delays == [1, 2, 4]
+    assert len(sched.spawned) == 4 and sched.status("a")["state"] == "queued"
+
+    sched._check_workers()
+    assert sched.workers[0].given_up and len(sched.spawned) == 4
+    status = sched.status("a")
+    assert status["state"] == "failed" and "no weights" in status["error"]
+    # Later jobs fail right away instead of waiting forever
+    sched.submit("b.mp4", job_id="b")
+    assert sched.status("b")["state"] == "failed"
+
+
+def test_a_worker_crash_fails_its_job_and_restarts_at_once(make_scheduler):
+    sched = make_scheduler(num_workers=1, start=False)
+    worker = sched.workers[0]
+    worker.ready = True
+    sched.submit("a.mp4", job_id="a")
+    worker.process.alive = False
+    sched._check_workers()
+    assert sched.status("a")["state"] == "failed" and sched.status("a")["error"] == "Inference worker crashed"
+    assert len(sched.spawned) == 2 and sched.workers[0].start_failures == 0
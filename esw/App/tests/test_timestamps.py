@@ -0,0 +1,64 @@
+from datetime import datetime, timedelta
+
+from timestamps import TimestampResolver, format_timestamp, parse_timestamp
+
+START = datetime(2024, 3, 12, 10, 0, 0)
+FPS = 25
+
+
+def clock(jump_at=None, jump=timedelta(hours=1), unreadable=()):
+    # read_at() of a camera whose overlay runs at the video rate, optionally jumping once
+    calls = []
+
+    def read_at(frame_index):
+        calls.append(frame_index)
+        if frame_index in unreadable:
+            return None
+        value = START + timedelta(seconds=frame_index // FPS)
+        if jump_at is not None and frame_index >= jump_at:
+            value += jump
+        return value
+
+    return read_at, calls
+
+
+def test_parse_and_format_round_trip():
+    value = parse_timestamp(" 12-03-2024   10:15:42 ")
+    assert value == datetime(2024, 3, 12, 10, 15, 42)
+    assert format_timestamp(value) == "12-03-2024 10:15:42"
+    assert parse_timestamp("32-13-2024 10:15:42") is None
+    assert parse_timestamp("") is None
+
+
+def test_steady_clock_is_interpolated_from_a_few_anchors():
+    read_at, calls = clock()
+    end = FPS * 3600 - 1
+    resolver = TimestampResolver(read_at, FPS, end_frame=end, min_span=FPS * 60)
+    for frame_index in range(0, end, FPS * 60):
+        expected = START + timedelta(seconds=frame_index // FPS)
+        assert abs((resolver.timestamp_at(frame_index) - expected).total_seconds()) <= 1.5
+    assert len(calls) <= 5
+    assert resolver.jumps == []
+
+
+def test_clock_jump_is_located_and_read_directly():
+    jump_at = FPS * 1000
+    read_at, _ = clock(jump_at=jump_at)
+    resolver = TimestampResolver(read_at, FPS, end_frame=FPS * 3600 - 1, min_span=FPS * 10)
+    assert len(resolver.build().jumps) == 1
+    a, b = resolver.jumps[0]
+    assert a < jump_at <= b and b - a <= FPS * 10
+    assert resolver.timestamp_at(jump_at - FPS) == START + timedelta(seconds=999)
+    assert resolver.timestamp_at(jump_at + FPS) == START + timedelta(hours=1, seconds=1001)
+
+
+def test_unreadable_anchor_moves_to_a_neighbour():
+    read_at, _ = clock(unreadable={0})
+    resolver = TimestampResolver(read_at, FPS, end_frame=FPS * 100)
+    assert abs((resolver.timestamp_at(FPS * 50) - START).total_seconds() - 50) <= 1
+    assert not resolver.is_anchor(0) and resolver.is_anchor(FPS)
+
+
+def test_nothing_readable():
+    resolver = TimestampResolver(lambda frame_index: None, FPS, end_frame=FPS * 100)
+    assert resolver.timestamp_at(10) is None
@@ -0,0 +1,49 @@
+import numpy as np
+
+from tracker import Tracker, iou_matrix
+
+
+def box(x, y, size=40):
+    return [x, y, x + size, y + size]
+
+
+def test_iou_matrix():
+    iou = iou_matrix(np.array([box(0, 0)]), np.array([box(0, 0), box(20, 0), box(100, 100)]))
+    assert np.allclose(iou, [[1.0, 1 / 3, 0.0]])
+
+
+def test_moving_object_is_one_track_with_new_and_cleared_events():
+    tracker = Tracker(min_hits=2, max_age=2)
+    events = []
+    for frame_index in range(6):
+        events += tracker.update(np.array([box(10 + 5 * frame_index, 20)]), frame_index)
+    assert [e["event"] for e in events] == ["new"]
+    assert events[0]["frame"] == 1 and tracker.total_objects == 1
+
+    for frame_index in range(6, 9):
+        events += tracker.update(np.zeros((0, 4)), frame_index)
+    cleared = [e for e in events if e["event"] == "cleared"]
+    assert len(cleared) == 1 and cleared[0]["track_id"] == events[0]["track_id"]
+    assert cleared[0]["first_frame"] == 0 and cleared[0]["last_frame"] == 5
+
+
+def test_separate_objects_get_separate_tracks():
+    tracker = Tracker(min_hits=1)
+    events = tracker.update(np.array([box(0, 0), box(300, 300)]), 0)
+    assert len({e["track_id"] for e in events if e["event"] == "new"}) == 2
+    assert len(tracker.active()) == 2
+
+
+def test_single_detections_are_not_objects():
+    tracker = Tracker(min_hits=2, max_age=1)
+    events = tracker.update(np.array([box(0, 0)]), 0)
+    events += tracker.update(np.zeros((0, 4)), 1) + tracker.update(np.zeros((0, 4)), 2)
+    assert events == [] and tracker.total_objects == 0
+
+
+def test_finish_clears_open_tracks():
+    tracker = Tracker(min_hits=1)
+    tracker.update(np.array([box(0, 0)]), 0)
+    events = tracker.finish(3)
+    assert [(e["event"], e["frame"]) for e in events] == [("cleared", 3)]
+    assert tracker.active() == []
@@ -0,0 +1,54 @@
+import io
+import os
+
+import pytest
+
+from uploads import ChunkedUpload, streamable_prefix
+
+
+@pytest.fixture
+def upload(tmp_path):
+    return ChunkedUpload.create("u1", str(tmp_path / "video.avi"), 10, camera="gate")
+
+
+def test_chunks_must_continue_where_the_file_ends(upload):
+    assert upload.write_chunk(io.BytesIO(b"abcd"), 0, 4) == 4
+    with pytest.raises(ValueError):
+        upload.write_chunk(io.BytesIO(b"xx"), 2, 2)
+    with pytest.raises(ValueError):
+        upload.write_chunk(io.BytesIO(b"x" * 7), 4, 7)
+    assert upload.received == 4 and not upload.complete
+
+
+def test_marker_is_removed_once_complete(upload):
+    assert os.path.exists(upload.marker_path)
+    upload.write_chunk(io.BytesIO(b"abcd"), 0, 4)
+    upload.write_chunk(io.BytesIO(b"efghij"), 4, 6)
+    assert upload.complete and not os.path.exists(upload.marker_path)
+    with open(upload.path, 'rb') as f:
+        assert f.read() == b"abcdefghij"
+
+
+def test_resume_from_metadata(upload):
+    upload.write_chunk(io.BytesIO(b"abc"), 0, 3)
+    upload.mark_job_started()
+    resumed = ChunkedUpload.load(upload.meta_path)
+    assert (resumed.upload_id, resumed.size, resumed.camera) == ("u1", 10, "gate")
+    assert resumed.received == 3 and resumed.job_started and not resumed.job_finished
+    resumed.write_chunk(io.BytesIO(b"defghij"), 3, 7)
+    resumed.mark_job_finished()
+    assert ChunkedUpload.load(upload.meta_path).info() == dict(resumed.info(), complete=True)
+    assert ChunkedUpload.load(upload.meta_path).job_finished
+
+
+def test_streamable_prefix(tmp_path):
+    avi = tmp_path / "a.avi"
+    avi.write_bytes(b"RIFF\0\0\0\0AVI LIST")
+    assert streamable_prefix(str(avi))
+    faststart = tmp_path / "fast.mp4"
+    faststart.write_bytes((16).to_bytes(4, 'big') + b"ftypisom" + b"\0" * 4 +
+                          (8).to_bytes(4, 'big') + b"moov" + (8).to_bytes(4, 'big') + b"mdat")
+    assert streamable_prefix(str(faststart))
+    data_first = tmp_path / "slow.mp4"
+    data_first.write_bytes((16).to_bytes(4, 'big') + b"ftypisom" + b"\0" * 4 + (100).to_bytes(4, 'big') + b"mdat")
+    assert not streamable_prefix(str(data_first))
@@ -0,0 +1,95 @@
+import sys
+import types
+
+import cv2
+import numpy as np
+import pytest
+
+import video_source
+from video_source import PyAVSource, VideoSource, open_video
+
+
+@pytest.fixture
+def video(tmp_path):
+    # 20 frames whose brightness is their index * 10
+    path = str(tmp_path / "clip.avi")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 10, (64, 48))
+    for i in range(20):
+        writer.write(np.full((48, 64, 3), i * 10, np.uint8))
+    writer.release()
+    return path
+
+
+def read_all(source):
+    frames = []
+    while True:
+        ret, frame = source.read()
+        if not ret:
+            break
+        frames.append(frame)
+    source.release()
+    return frames
+
+
+def test_missing_pyav_falls_back_to_ffmpeg(video, monkeypatch, capsys):
+    monkeypatch.setitem(sys.modules, "av", None)  # import av raises ImportError
+    source = open_video(video, backend='pyav')
+    assert isinstance(source, VideoSource) and source.stats.backend == 'ffmpeg'
+    assert "isn't installed" in capsys.readouterr().out
+    frames = read_all(source)
+    assert len(frames) == 20 and abs(float(frames[5].mean()) - 50) < 3
+
+
+def test_pyav_that_cannot_open_the_file_falls_back_to_ffmpeg(video, monkeypatch, capsys):
+    def broken_open(path):
+        raise OSError("invalid data")
+
+    monkeypatch.setitem(sys.modules, "av", types.SimpleNamespace(open=broken_open))
+    source = open_video(video, backend='pyav')
+    assert isinstance(source, VideoSource) and source.stats.backend == 'ffmpeg'
+    assert "invalid data" in capsys.readouterr().out
+    assert len(read_all(source)) == 20
+
+
+def test_ffmpeg_retries_without_options_it_cannot_use(video, monkeypatch):
+    opened = []
+    real = cv2.VideoCapture
+
+    def capture(path, *args):
+        opened.append(args)
+        # Pretend hardware decode isn't available for this file
+        return real(path + ".missing") if len(args) == 2 else real(path, *args)
+
+    monkeypatch.setattr(video_source.cv2, "VideoCapture", capture)
+    source = open_video(video, backend='ffmpeg', hw_accel='any', threads=2)
+    assert source.isOpened()
+    assert len(opened) == 2 and opened[1] == (cv2.CAP_FFMPEG,)
+    assert cv2.CAP_PROP_N_THREADS in opened[0][1]
+    source.release()
+
+
+def test_backends_decode_the_same_frames(video):
+    ffmpeg = read_all(open_video(video, backend='ffmpeg'))
+    opencv = read_all(open_video(video, backend='opencv'))
+    assert len(ffmpeg) == len(opencv) == 20
+    assert all(np.array_equal(a, b) for a, b in zip(ffmpeg, opencv))
+
+
+def test_scaled_frames_and_decode_stats(video):
+    source = open_video(video, backend='opencv', scale=0.5)
+    assert (source.get(cv2.CAP_PROP_FRAME_WIDTH), source.get(cv2.CAP_PROP_FRAME_HEIGHT)) == (32, 24)
+    source.grab()
+    source.grab()
+    ret, frame = source.retrieve()
+    assert ret and frame.shape == (24, 32, 3)
+    report = source.stats.report()
+    assert (report["backend"], report["frames_decoded"], report["frames_delivered"]) == ('opencv', 2, 1)
+    source.release()
+
+
+def test_pyav_source_matches_opencv(video):
+    pytest.importorskip("av")
+    pyav = PyAVSource(video)
+    assert pyav.get(cv2.CAP_PROP_FPS) == 10
+    assert [float(f.mean()) for f in read_all(pyav)] == pytest.approx(
+        [float(f.mean()) for f in read_all(open_video(video, backend='opencv'))], abs=3)
@@ -0,0 +1,40 @@
+import cv2
+import numpy as np
+
+from writers import ImageWriter, LabelWriter, format_yolo_labels
+
+
+def test_close_flushes_every_queued_image(tmp_path):
+    writer = ImageWriter(num_threads=2, max_pending=4)
+    image = np.random.default_rng(0).integers(0, 255, (240, 320, 3), dtype=np.uint8)
+    paths = [writer.write(str(tmp_path / f"frame_{i}.png"), image) for i in range(40)]
+    writer.close()
+    assert all(cv2.imread(path) is not None for path in paths)
+    assert all(not thread.is_alive() for thread in writer.threads)
+
+
+def test_image_format_and_on_done(tmp_path):
+    done = []
+    with ImageWriter(image_format='.jpg', jpeg_quality=80) as writer:
+        path = writer.write(str(tmp_path / "frame.png"), np.zeros((8, 8, 3), np.uint8), on_done=lambda: done.append(1))
+    assert path == str(tmp_path / "frame.jpg") and cv2.imread(path) is not None
+    assert done == [1]
+
+
+def test_failed_writes_still_call_on_done(tmp_path):
+    done = []
+    with ImageWriter() as writer:
+        writer.write(str(tmp_path / "missing" / "frame.jpg"), np.zeros((8, 8, 3), np.uint8),
+                     on_done=lambda: done.append(1))
+    assert done == [1]
+
+
+def test_label_writer_flushes_on_close(tmp_path):
+    boxes = np.array([[10, 20, 30, 60], [0, 0, 100, 50]], dtype=np.float32)
+    with LabelWriter() as writer:
+        for i in range(20):
+            writer.write(str(tmp_path / f"frame_{i}.txt"), boxes, 100, 100)
+    texts = [(tmp_path / f"frame_{i}.txt").read_text() for i in range(20)]
+    assert texts == [format_yolo_labels(boxes, 100, 100)] * 20
+    assert texts[0].splitlines() == ["0 0.200000 0.400000 0.200000 0.400000",
+                                     "0 0.500000 0.250000 1.000000 0.500000"]
@@ -0,0 +1,184 @@
+import bisect
+import re
+from datetime import datetime, timedelta
+
+# Camera overlay clock, e.g. 12-03-2024 10:15:42
+TIMESTAMP_FORMAT = '%d-%m-%Y %H:%M:%S'
+
+
+def parse_timestamp(text):
+    # Overlay text -> datetime, None if it isn't a valid date/time
+    if not text:
+        return None
+    try:
+        return datetime.strptime(re.sub(r'\s+', ' ', text.strip()), TIMESTAMP_FORMAT)
+    except ValueError:
+        return None
+
+
+def format_timestamp(value):
+    return value.strftime(TIMESTAMP_FORMAT) if value is not None else None
+
+
+class TimestampResolver:
+    """
+    Maps frame indices of one video to camera wall-clock time while OCRing
+    only a few anchor frames.
+
+    `read_at(frame_index)` decodes and OCRs one frame and returns a datetime
+    (or None). The resolver reads anchors at the start and end of the range
+    (and every `max_span` frames in between), then bisects each pair of
+    anchors: if the OCRed midpoint is more than `tolerance` seconds off the
+    straight line between them, both halves are refined again. Anything
+    between two consistent anchors is interpolated.
+
+    Bisection stops at `min_span` frames. A pair that still doesn't fit
+    there holds a clock jump (DST, NTP correction, recorder gap); frames
+    inside it are OCRed directly when asked for. Beyond the last anchor (a
+    growing file, or no end given) time is extrapolated for up to
+    `max_span` frames before another anchor is read.
+    """
+
+    def __init__(self, read_at, fps, start_frame=0, end_frame=None, tolerance=1.5,
+                 min_span=None, max_span=None, retry_frames=3):
+        self.read_at = read_at
+        self.fps = fps or 25.0
+        self.start_frame = start_frame
+        self.end_frame = end_frame  # Last frame of the range (inclusive), None if unknown
+        self.tolerance = tolerance
+        self.min_span = min_span or max(1, int(self.fps * 2))
+        self.max_span = max_span or max(1, int(self.fps * 1800))
+        self.retry_frames = retry_frames
+
+        self.frames = []   # Sorted frame indices of the anchors
+        self.times = {}    # frame index -> OCRed datetime
+        self.unread = set()  # Frames whose OCR failed
+        self.jumps = []    # (a, b) anchor pairs with a clock jump between them
+        self.ocr_calls = 0
+        self.built = False
+
+    def _read(self, frame_index):
+        if frame_index in self.times:
+            return self.times[frame_index]
+        if frame_index in self.unread:
+            return None
+        self.ocr_calls += 1
+        value = self.read_at(frame_index)
+        if value is None:
+            self.unread.add(frame_index)
+            return None
+        self.times[frame_index] = value
+        bisect.insort(self.frames, frame_index)
+        return value
+
+    def _anchor_near(self, frame_index, step, limit=None):
+        # OCR frame_index, moving by `step` frames on failure; returns the anchored frame or None
+        for _ in range(self.retry_frames):
+            if frame_index < self.start_frame or (limit is not None and (frame_index - limit) * step > 0):
+                break
+            if self._read(frame_index) is not None:
+                return frame_index
+            frame_index += step
+        return None
+
+    def _expected_seconds(self, a, b):
+        return (b - a) / self.fps
+
+    def _consistent(self, a, b):
+        # The clock advanced by roughly the elapsed video time between two anchors
+        elapsed = (self.times[b] - self.times[a]).total_seconds()
+        expected = self._expected_seconds(a, b)
+        return abs(elapsed - expected) <= self.tolerance + 0.05 * expected
+
+    def _in_jump(self, frame_index):
+        return any(a < frame_index < b for a, b in self.jumps)
+
+    def _interpolate(self, a, b, frame_index):
+        ta, tb = self.times[a], self.times[b]
+        return ta + (tb - ta) * ((frame_index - a) / (b - a))
+
+    def _refine(self, a, b):
+        if b - a <= self.min_span:
+            if not self._consistent(a, b):
+                self.jumps.append((a, b))
+            return
+        m = (a + b) // 2
+        m = self._anchor_near(m, max(1, int(self.fps)), limit=b - 1)
+        if m is None:
+            # Can't read the middle, trust the endpoints if they agree
+            if not self._consistent(a, b):
+                self.jumps.append((a, b))
+            return
+        residual = abs((self.times[m] - self._interpolate(a, b, m)).total_seconds())
+        if residual > self.tolerance or not self._consistent(a, b):
+            self._refine(a, m)
+            self._refine(m, b)
+
+    def build(self):
+        # Read the start/end anchors and bisect between them
+        self.built = True
+        step = max(1, int(self.fps))
+        first = self._anchor_near(self.start_frame, step, limit=self.end_frame)
+        if first is None:
+            return self
+        if self.end_frame is None:
+            return self
+        last = self._anchor_near(self.end_frame, -step, limit=first)
+        if last is None or last == first:
+            return self
+
+        anchors = [first]
+        for frame_index in range(first + self.max_span, last, self.max_span):
+            found = self._anchor_near(frame_index, step, limit=last)
+            if found is not None:
+                anchors.append(found)
+        anchors.append(last)
+        for a, b in zip(anchors, anchors[1:]):
+            self._refine(a, b)
+        return self
+
+    def _extend(self, frame_index):
+        # Past the last anchor: read a new one once the gap gets too long
+        last = self.frames[-1]
+        if frame_index - last <= self.max_span:
+            return
+        found = self._anchor_near(frame_index, -max(1, int(self.fps)), limit=last + 1)
+        if found is not None:
+            self._refine(last, found)
+
+    def timestamp_at(self, frame_index):
+        # Camera time of `frame_index` as a datetime, None if no anchor could be read
+        if not self.built:
+            self.build()
+        if frame_index in self.times:
+            return self.times[frame_index]
+        if not self.frames:
+            return None
+
+        if frame_index > self.frames[-1]:
+            self._extend(frame_index)
+        if self._in_jump(frame_index):
+            # The clock jumps somewhere near here, read this frame itself
+            value = self._read(frame_index)
+            if value is not None:
+                return value
+
+        i = bisect.bisect_right(self.frames, frame_index)
+        if 0 < i < len(self.frames):
+            a, b = self.frames[i - 1], self.frames[i]
+            if self._in_jump(frame_index):
+                # Unreadable: take the side of the jump this frame is closer to
+                near = a if frame_index - a <= b - frame_index else b
+                return self.times[near] + timedelta(seconds=(frame_index - near) / self.fps)
+            return self._interpolate(a, b, frame_index)
+
+        # Outside the anchors: extrapolate from the nearest segment, or at the nominal frame rate
+        if len(self.frames) >= 2:
+            a, b = (self.frames[0], self.frames[1]) if i == 0 else (self.frames[-2], self.frames[-1])
+            if not self._in_jump(a + 1 if i == 0 else b - 1):
+                return self._interpolate(a, b, frame_index)
+        near = self.frames[0] if i == 0 else self.frames[-1]
+        return self.times[near] + timedelta(seconds=(frame_index - near) / self.fps)
+
+    def is_anchor(self, frame_index):
+        return frame_index in self.times
@@ -0,0 +1,177 @@
+import itertools
+
+import numpy as np
+
+from overlap import intersection_matrix
+
+
+def iou_matrix(boxes_a, boxes_b):
+    # (len(a) x len(b)) IoU of two sets of xyxy boxes
+    boxes_a = np.asarray(boxes_a, dtype=np.float64).reshape(-1, 4)
+    boxes_b = np.asarray(boxes_b, dtype=np.float64).reshape(-1, 4)
+    inter = intersection_matrix(boxes_a, boxes_b)
+    area_a = (boxes_a[:, 2] - boxes_a[:, 0]) * (boxes_a[:, 3] - boxes_a[:, 1])
+    area_b = (boxes_b[:, 2] - boxes_b[:, 0]) * (boxes_b[:, 3] - boxes_b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - inter
+    return np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+
+
+def _to_z(box):
+    # xyxy -> [centre x, centre y, area, aspect ratio]
+    w, h = box[2] - box[0], box[3] - box[1]
+    return np.array([box[0] + w / 2, box[1] + h / 2, w * h, w / max(h, 1e-6)])
+
+
+def _to_box(x):
+    w = np.sqrt(max(x[2], 0) * max(x[3], 0))
+    h = x[2] / w if w > 0 else 0
+    return np.array([x[0] - w / 2, x[1] - h / 2, x[0] + w / 2, x[1] + h / 2])
+
+
+class KalmanBoxFilter:
+    """
+    Constant-velocity Kalman filter over [cx, cy, area, aspect, vx, vy, varea]
+    (the SORT box model), plain NumPy.
+    """
+
+    F = np.eye(7)
+    F[0, 4] = F[1, 5] = F[2, 6] = 1
+    H = np.eye(4, 7)
+
+    def __init__(self, box):
+        self.x = np.zeros(7)
+        self.x[:4] = _to_z(box)
+        self.P = np.diag([10, 10, 10, 10, 1e4, 1e4, 1e4]).astype(np.float64)
+        self.Q = np.diag([1, 1, 1, 1, 0.01, 0.01, 1e-4])
+        self.R = np.diag([1, 1, 10, 10]).astype(np.float64)
+
+    def predict(self):
+        if self.x[2] + self.x[6] <= 0:
+            self.x[6] = 0
+        self.x = self.F @ self.x
+        self.P = self.F @ self.P @ self.F.T + self.Q
+        return _to_box(self.x)
+
+    def update(self, box):
+        y = _to_z(box) - self.H @ self.x
+        S = self.H @ self.P @ self.H.T + self.R
+        K = self.P @ self.H.T @ np.linalg.inv(S)
+        self.x = self.x + K @ y
+        self.P = (np.eye(7) - K @ self.H) @ self.P
+
+    @property
+    def box(self):
+        return _to_box(self.x)
+
+
+class Track:
+    def __init__(self, track_id, box, frame_index):
+        self.track_id = track_id
+        self.filter = KalmanBoxFilter(box)
+        self.box = np.asarray(box, dtype=np.float64)
+        self.first_frame = self.last_frame = frame_index
+        self.hits = 1
+        self.misses = 0
+        self.confirmed = False
+
+    def info(self):
+        return {"track_id": self.track_id, "first_frame": self.first_frame, "last_frame": self.last_frame,
+                "lifetime_frames": self.last_frame - self.first_frame, "hits": self.hits,
+                "box": [round(float(v), 1) for v in self.box]}
+
+
+class Tracker:
+    """
+    SORT-style tracker for the detector's boxes.
+
+    Every update() predicts the existing tracks forward, matches them to
+    the new boxes greedily by IoU, and for boxes that don't overlap any
+    more (sparse sampling, jittery detections) by centre distance relative
+    to the box size. A track becomes an object after `min_hits` matches
+    ("new" event) and is dropped after `max_age` updates without one
+    ("cleared" event, with its lifetime). Unconfirmed tracks vanish quietly.
+    """
+
+    def __init__(self, iou_threshold=0.3, max_centre_distance=0.5, min_hits=2, max_age=3):
+        self.iou_threshold = iou_threshold
+        self.max_centre_distance = max_centre_distance
+        self.min_hits = min_hits
+        self.max_age = max_age
+        self.tracks = []
+        self.ids = itertools.count(1)
+        self.total_objects = 0
+
+    def _match(self, predicted, boxes):
+        # Greedy assignment: best IoU pairs first, then nearest centres for what's left
+        matches = []
+        if len(predicted) == 0 or len(boxes) == 0:
+            return matches
+        iou = iou_matrix(predicted, boxes)
+        centre_t = (predicted[:, :2] + predicted[:, 2:]) / 2
+        centre_d = (boxes[:, :2] + boxes[:, 2:]) / 2
+        size = np.sqrt(np.clip((predicted[:, 2] - predicted[:, 0]) * (predicted[:, 3] - predicted[:, 1]), 1, None))
+        distance = np.linalg.norm(centre_t[:, None, :] - centre_d[None, :, :], axis=2) / size[:, None]
+
+        used_t, used_d = set(), set()
+        for score, valid in ((iou, iou >= self.iou_threshold), (-distance, distance <= self.max_centre_distance)):
+            order = np.argsort(-score, axis=None)
+            for t, d in zip(*np.unravel_index(order, score.shape)):
+                if not valid[t, d] or t in used_t or d in used_d:
+                    continue
+                matches.append((t, d))
+                used_t.add(t)
+                used_d.add(d)
+        return matches
+
+    def update(self, boxes, frame_index):
+        # Feed one frame's (N, 4) xyxy boxes; returns the list of new/cleared events
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        predicted = np.array([track.filter.predict() for track in self.tracks]).reshape(-1, 4)
+        matches = self._match(predicted, boxes)
+
+        events = []
+        matched_t = {t for t, _ in matches}
+        matched_d = {d for _, d in matches}
+        for t, d in matches:
+            track = self.tracks[t]
+            track.filter.update(boxes[d])
+            track.box = boxes[d]
+            track.last_frame = frame_index
+            track.hits += 1
+            track.misses = 0
+            if not track.confirmed and track.hits >= self.min_hits:
+                track.confirmed = True
+                self.total_objects += 1
+                events.append(dict(event="new", frame=frame_index, **track.info()))
+
+        survivors = []
+        for t, track in enumerate(self.tracks):
+            if t not in matched_t:
+                track.misses += 1
+                if track.misses > self.max_age:
+                    if track.confirmed:
+                        events.append(dict(event="cleared", frame=frame_index, **track.info()))
+                    continue
+            survivors.append(track)
+        self.tracks = survivors
+
+        for d in range(len(boxes)):
+            if d not in matched_d:
+                track = Track(next(self.ids), boxes[d], frame_index)
+                if self.min_hits <= 1:
+                    track.confirmed = True
+                    self.total_objects += 1
+                    events.append(dict(event="new", frame=frame_index, **track.info()))
+                self.tracks.append(track)
+        return events
+
+    def active(self):
+        # Confirmed tracks seen in the latest update
+        return [track for track in self.tracks if track.confirmed and track.misses == 0]
+
+    def finish(self, frame_index):
+        # End of the video: clear every remaining object
+        events = [dict(event="cleared", frame=frame_index, **track.info())
+                  for track in self.tracks if track.confirmed]
+        self.tracks = []
+        return events
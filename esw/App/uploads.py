@@ -0,0 +1,150 @@
+import json
+import os
+import struct
+import threading
+
+from frame_sampler import UPLOADING_SUFFIX
+
+COPY_CHUNK_SIZE = 1024 * 1024  # Bytes read from the request stream at a time
+MP4_SIGNATURES = (b'ftyp', b'moov', b'free', b'wide', b'skip', b'mdat')
+
+
+def copy_stream(stream, f, limit=None):
+    # Copy a request body to an open file in fixed-size chunks, returns bytes written
+    written = 0
+    while limit is None or written < limit:
+        size = COPY_CHUNK_SIZE if limit is None else min(COPY_CHUNK_SIZE, limit - written)
+        chunk = stream.read(size)
+        if not chunk:
+            break
+        f.write(chunk)
+        written += len(chunk)
+    return written
+
+
+def _mp4_index_written(f, file_size):
+    # Walk the top-level boxes: True once a complete 'moov' (the index) is on
+    # disk ahead of 'mdat', False if the media data comes first
+    offset = 0
+    while offset + 8 <= file_size:
+        f.seek(offset)
+        header = f.read(16)
+        size, box_type = struct.unpack('>I4s', header[:8])
+        if size == 1:
+            if len(header) < 16:
+                return False
+            size = struct.unpack('>Q', header[8:16])[0]
+        elif size == 0:
+            size = file_size - offset  # Box runs to the end of the file
+        if box_type == b'moov':
+            return offset + size <= file_size
+        if box_type == b'mdat' or size < 8:
+            return False
+        offset += size
+    return False
+
+
+def streamable_prefix(path):
+    """
+    True if frames can already be decoded from the part of a video written
+    so far: AVI (ffmpeg reads it sequentially without the trailing idx1)
+    and MP4/MOV written 'faststart', with the moov index ahead of the data.
+    """
+    with open(path, 'rb') as f:
+        head = f.read(12)
+        if head[:4] == b'RIFF' and head[8:12] == b'AVI ':
+            return True
+        if head[4:8] in MP4_SIGNATURES:
+            return _mp4_index_written(f, os.fstat(f.fileno()).st_size)
+    return False
+
+
+class ChunkedUpload:
+    """
+    One resumable upload written straight to its final path.
+
+    Chunks must arrive in order: a chunk for the wrong offset is refused and
+    the client resumes from `received`. While the upload is incomplete a
+    `<path>.uploading` marker sits next to the file, which tells the frame
+    sampler to wait for more data instead of stopping at the current end.
+    The upload's metadata is kept in `<path>.upload.json` so an interrupted
+    upload can be resumed after a server restart.
+    """
+
+    def __init__(self, upload_id, path, size, camera=None):
+        self.upload_id = upload_id
+        self.path = path
+        self.size = size
+        self.camera = camera
+        self.job_started = False
+        self.job_finished = False
+        self.lock = threading.Lock()
+
+    @property
+    def marker_path(self):
+        return self.path + UPLOADING_SUFFIX
+
+    @property
+    def meta_path(self):
+        return self.path + '.upload.json'
+
+    @property
+    def received(self):
+        return os.path.getsize(self.path) if os.path.exists(self.path) else 0
+
+    @property
+    def complete(self):
+        return self.received >= self.size
+
+    @classmethod
+    def create(cls, upload_id, path, size, camera=None):
+        upload = cls(upload_id, path, size, camera)
+        open(path, 'wb').close()
+        open(upload.marker_path, 'w').close()
+        upload._save()
+        return upload
+
+    @classmethod
+    def load(cls, meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+        upload = cls(meta["upload_id"], meta["path"], meta["size"], meta.get("camera"))
+        upload.job_started = meta.get("job_started", False)
+        upload.job_finished = meta.get("job_finished", False)
+        return upload
+
+    def _save(self):
+        with open(self.meta_path, 'w') as f:
+            json.dump({"upload_id": self.upload_id, "path": self.path, "size": self.size,
+                       "camera": self.camera, "job_started": self.job_started,
+                       "job_finished": self.job_finished}, f)
+
+    def mark_job_started(self):
+        self.job_started = True
+        self._save()
+
+    def mark_job_finished(self):
+        # The job ran to an end (done, failed or cancelled), nothing to re-queue after a restart
+        self.job_finished = True
+        self._save()
+
+    def write_chunk(self, stream, offset, length):
+        # Append one chunk at `offset`, returns the new received byte count.
+        # Raises ValueError if the chunk doesn't continue where the file ends.
+        with self.lock:
+            received = self.received
+            if offset != received:
+                raise ValueError(f"Expected offset {received}, got {offset}")
+            if offset + length > self.size:
+                raise ValueError("Chunk runs past the declared upload size")
+            with open(self.path, 'r+b') as f:
+                f.seek(offset)
+                written = copy_stream(stream, f, limit=length)
+            received = offset + written
+            if received >= self.size and os.path.exists(self.marker_path):
+                os.remove(self.marker_path)
+            return received
+
+    def info(self):
+        return {"upload_id": self.upload_id, "size": self.size, "received": self.received,
+                "complete": self.complete, "job_started": self.job_started, "job_finished": self.job_finished}
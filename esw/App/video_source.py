@@ -0,0 +1,293 @@
+import os
+import queue
+import threading
+import time
+
+import cv2
+
+from metrics import registry
+
+# Decode backend for every script: 'ffmpeg' (OpenCV's FFmpeg backend with threads / hardware
+# decode), 'opencv' (plain cv2.VideoCapture) or 'pyav' (PyAV in a background thread, needs `av`)
+DECODE_BACKEND = os.environ.get('DECODE_BACKEND', 'ffmpeg')
+DECODE_THREADS = int(os.environ.get('DECODE_THREADS', 0))  # 0: let FFmpeg pick
+DECODE_HW_ACCEL = os.environ.get('DECODE_HW_ACCEL', 'any')  # 'any' falls back to software decode
+# Below 1 (e.g. 0.5) frames are handed out at that fraction of their size. PyAV decodes
+# lowres-capable codecs at the smaller size; otherwise frames are resized after a full decode,
+# which only saves the work done with the frames afterwards (change gate, inference, writes)
+DECODE_SCALE = float(os.environ.get('DECODE_SCALE', 1.0))
+HW_ACCELERATION = {"none": cv2.VIDEO_ACCELERATION_NONE, "any": cv2.VIDEO_ACCELERATION_ANY}
+# Decoders that can decode at 1/2, 1/4 or 1/8 size directly (libavcodec's lowres option)
+LOWRES_CODECS = ('mjpeg', 'h261', 'h263', 'mpeg4')
+PYAV_QUEUE_SIZE = 16  # Decoded frames buffered ahead by the PyAV thread
+
+
+def _output_size(width, height, scale):
+    # Even width/height of a frame scaled by `scale`, None for full size
+    if not scale or scale >= 1 or not width or not height:
+        return None
+    return max(2, int(width * scale) // 2 * 2), max(2, int(height * scale) // 2 * 2)
+
+
+class _DecodeStats:
+    # Frames grabbed/delivered and the time callers spent waiting for them
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.grabbed = 0
+        self.delivered = 0
+        self.seconds = 0.0
+
+    def report(self):
+        fps = self.grabbed / self.seconds if self.seconds else 0.0
+        return {"backend": self.backend, "frames_decoded": self.grabbed, "frames_delivered": self.delivered,
+                "decode_seconds": round(self.seconds, 3), "decode_fps": round(fps, 1)}
+
+    def log(self):
+        if not self.grabbed:
+            return
+        report = self.report()
+        registry.set("esw_decode_fps", report["decode_fps"], backend=self.backend)
+        print(f"Decoded {report['frames_decoded']} frames ({report['frames_delivered']} delivered) "
+              f"at {report['decode_fps']} fps with {self.backend}")
+
+
+class VideoSource:
+    """
+    cv2.VideoCapture with the same interface (grab/retrieve/read/get/set/
+    release), opened with the chosen OpenCV backend and options, that can
+    hand out frames at reduced size (`scale`) and keeps decode statistics.
+    OpenCV can't decode at a lower resolution, so scaled frames are
+    resized after retrieve(); width/height report the output size.
+    """
+
+    def __init__(self, path, backend=DECODE_BACKEND, threads=DECODE_THREADS, hw_accel=DECODE_HW_ACCEL,
+                 scale=None):
+        if backend == 'ffmpeg':
+            params = [cv2.CAP_PROP_HW_ACCELERATION, HW_ACCELERATION.get(hw_accel, cv2.VIDEO_ACCELERATION_NONE)]
+            if threads:
+                params += [cv2.CAP_PROP_N_THREADS, threads]
+            self.cap = cv2.VideoCapture(path, cv2.CAP_FFMPEG, params)
+            if not self.cap.isOpened():
+                # Hardware decode or this container isn't supported, try without options
+                self.cap = cv2.VideoCapture(path, cv2.CAP_FFMPEG)
+        else:
+            self.cap = cv2.VideoCapture(path)
+        self.stats = _DecodeStats(backend)
+        self.size = _output_size(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH), self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT),
+                                 scale)
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def get(self, prop):
+        if self.size is not None and prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return self.size[0]
+        if self.size is not None and prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self.size[1]
+        return self.cap.get(prop)
+
+    def set(self, prop, value):
+        # A seek decodes forward from the previous keyframe, count it as decode time
+        start = time.perf_counter()
+        ok = self.cap.set(prop, value)
+        self.stats.seconds += time.perf_counter() - start
+        return ok
+
+    def grab(self):
+        start = time.perf_counter()
+        ok = self.cap.grab()
+        self.stats.seconds += time.perf_counter() - start
+        self.stats.grabbed += ok
+        return ok
+
+    def retrieve(self):
+        start = time.perf_counter()
+        ret, frame = self.cap.retrieve()
+        if ret and self.size is not None:
+            frame = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        self.stats.seconds += time.perf_counter() - start
+        self.stats.delivered += ret
+        return ret, frame
+
+    def read(self):
+        if not self.grab():
+            return False, None
+        return self.retrieve()
+
+    def release(self):
+        self.stats.log()
+        self.cap.release()
+
+
+_END = object()
+
+
+class PyAVSource:
+    """
+    VideoCapture-like reader on PyAV: a background thread demuxes and
+    decodes (with FFmpeg frame/slice threading) into a small queue, so
+    decoding overlaps with whatever the caller does with the previous
+    frame. Frames are only converted to BGR (and scaled, in the same
+    swscale pass) when retrieve()d; decoders that support it decode at
+    1/2 or 1/4 size straight away. Seeks are frame accurate.
+    """
+
+    def __init__(self, path, threads=DECODE_THREADS, scale=None, queue_size=PYAV_QUEUE_SIZE):
+        import av
+
+        self.container = av.open(path)
+        self.stream = self.container.streams.video[0]
+        self.stream.thread_type = 'AUTO'
+        if threads:
+            self.stream.codec_context.thread_count = threads
+        context = self.stream.codec_context
+        self.fps = float(self.stream.average_rate or self.stream.guessed_rate or 0)
+        self.width, self.height = context.width, context.height
+        self.size = _output_size(self.width, self.height, scale)
+        if self.size is not None and context.name in LOWRES_CODECS:
+            lowres = 2 if scale <= 0.25 else 1 if scale <= 0.5 else 0
+            if lowres:
+                context.options = {'lowres': str(lowres)}
+        self.frame_count = self.stream.frames or (
+            int(float(self.stream.duration * self.stream.time_base) * self.fps) if self.stream.duration else 0)
+        self.start_time = self.stream.start_time or 0
+        self.queue_size = queue_size
+        self.stats = _DecodeStats('pyav')
+
+        self.position = 0  # Index of the frame the next grab() returns
+        self.current = None
+        self.thread = None
+        self._start(0, seek=False)
+
+    def _index(self, frame):
+        if frame.pts is None or not self.fps:
+            return None
+        return int(round(float((frame.pts - self.start_time) * self.stream.time_base) * self.fps))
+
+    def _start(self, target, seek=True):
+        self.queue = queue.Queue(maxsize=self.queue_size)
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._decode, args=(target, seek, self.queue, self.stop_event),
+                                       daemon=True)
+        self.thread.start()
+
+    def _stop(self):
+        self.stop_event.set()
+        self.thread.join()
+
+    def _decode(self, target, seek, frames, stop_event):
+        def put(item):
+            while not stop_event.is_set():
+                try:
+                    frames.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        try:
+            if seek and self.fps:
+                # Land on the keyframe before the target, then decode forward to it
+                pts = self.start_time + int(target / self.fps / self.stream.time_base)
+                self.container.seek(pts, stream=self.stream, backward=True)
+            counted = None
+            for frame in self.container.decode(self.stream):
+                index = self._index(frame)
+                if index is None:
+                    # No timestamps: count frames from where decoding started
+                    counted = target if counted is None else counted + 1
+                    index = counted
+                if index < target:
+                    continue
+                if not put((index, frame)):
+                    return
+        except Exception as e:
+            put(e)
+        put(_END)
+
+    def isOpened(self):
+        return self.thread is not None
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return self.frame_count
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return self.size[0] if self.size else self.width
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self.size[1] if self.size else self.height
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return self.position
+        if prop == cv2.CAP_PROP_POS_MSEC:
+            return self.position * 1000.0 / self.fps if self.fps else 0
+        return 0
+
+    def set(self, prop, value):
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            target = int(value)
+        elif prop == cv2.CAP_PROP_POS_MSEC and self.fps:
+            target = int(round(value * self.fps / 1000.0))
+        else:
+            return False
+        self._stop()
+        self._start(max(0, target))
+        self.position = max(0, target)
+        self.current = None
+        return True
+
+    def grab(self):
+        start = time.perf_counter()
+        item = self.queue.get()
+        self.stats.seconds += time.perf_counter() - start
+        if item is _END:
+            self.queue.put(_END)  # Stay at the end for later calls
+            return False
+        if isinstance(item, Exception):
+            raise item
+        index, self.current = item
+        self.position = index + 1
+        self.stats.grabbed += 1
+        return True
+
+    def retrieve(self):
+        if self.current is None:
+            return False, None
+        start = time.perf_counter()
+        width, height = self.size or (self.width, self.height)
+        frame = self.current.to_ndarray(format='bgr24', width=width, height=height)
+        self.stats.seconds += time.perf_counter() - start
+        self.stats.delivered += 1
+        return True, frame
+
+    def read(self):
+        if not self.grab():
+            return False, None
+        return self.retrieve()
+
+    def release(self):
+        if self.thread is None:
+            return
+        self._stop()
+        self.thread = None
+        self.stats.log()
+        self.container.close()
+
+
+def open_video(path, backend=DECODE_BACKEND, threads=DECODE_THREADS, hw_accel=DECODE_HW_ACCEL, scale=None):
+    """
+    Open `path` for decoding with the configured backend; use it wherever
+    cv2.VideoCapture(path) was used. `scale` (e.g. 0.5) returns smaller
+    frames. Falls back to OpenCV's FFmpeg backend if PyAV isn't installed
+    or can't open the file.
+    """
+    if backend == 'pyav':
+        try:
+            return PyAVSource(path, threads=threads, scale=scale)
+        except ImportError:
+            print("PyAV (av) isn't installed, decoding with OpenCV's FFmpeg backend")
+        except Exception as e:
+            print(f"PyAV could not open {path} ({e}), decoding with OpenCV's FFmpeg backend")
+        backend = 'ffmpeg'
+    return VideoSource(path, backend=backend, threads=threads, hw_accel=hw_accel, scale=scale)
@@ -0,0 +1,130 @@
+import logging
+import os
+import queue
+import threading
+
+import cv2
+
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+def format_yolo_labels(boxes, img_width, img_height, class_id=0):
+    # (N, 4) absolute xyxy boxes -> YOLO label lines (class x_center y_center width height)
+    lines = []
+    for x1, y1, x2, y2 in boxes:
+        x_center = (x1 + x2) / 2 / img_width
+        y_center = (y1 + y2) / 2 / img_height
+        width = (x2 - x1) / img_width
+        height = (y2 - y1) / img_height
+        lines.append(f"{class_id} {x_center:.6f} {y_center:.6f} {width:.6f} {height:.6f}\n")
+    return "".join(lines)
+
+
+class _BackgroundWriter:
+    # Bounded queue drained by a few daemon threads; write() blocks when the queue is full
+
+    stage = "write"  # Name of the stage in the metrics
+
+    def __init__(self, num_threads=1, max_pending=256):
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.threads = [threading.Thread(target=self._run, daemon=True) for _ in range(num_threads)]
+        for thread in self.threads:
+            thread.start()
+
+    def _submit(self, item):
+        registry.set("esw_queue_depth", self.queue.qsize(), queue=self.stage)
+        self.queue.put(item)
+
+    def _handle(self, item):
+        raise NotImplementedError
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is _STOP:
+                break
+            try:
+                with registry.time(self.stage):
+                    self._handle(item)
+            except Exception as e:
+                logger.error(f"Error writing {item[0]}: {str(e)}")
+
+    def close(self):
+        # Flush everything still queued, then stop the threads
+        for _ in self.threads:
+            self.queue.put(_STOP)
+        for thread in self.threads:
+            thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class LabelWriter(_BackgroundWriter):
+    """
+    Optional export sink for YOLO-format label files.
+    Formatting and file writes happen on a background thread so the
+    inference loop never waits on the filesystem.
+    """
+
+    stage = "label_write"
+
+    def write(self, path, boxes, img_width, img_height, class_id=0):
+        self._submit((path, boxes, img_width, img_height, class_id))
+
+    def _handle(self, item):
+        path, boxes, img_width, img_height, class_id = item
+        with open(path, 'w') as f:
+            f.write(format_yolo_labels(boxes, img_width, img_height, class_id))
+
+
+class ImageWriter(_BackgroundWriter):
+    """
+    Encodes and saves images on a small thread pool (cv2.imwrite releases
+    the GIL), so JPEG encoding is off the decode/inference loop.
+
+    `image_format` ('.jpg', '.png', '.webp', or None to keep each path's own
+    extension) and `jpeg_quality` (95 is cv2.imwrite's default) apply to
+    every image written. The caller must not modify an image after handing
+    it to write().
+    """
+
+    stage = "image_write"
+
+    def __init__(self, num_threads=2, max_pending=32, image_format=None, jpeg_quality=95):
+        self.image_format = image_format
+        if image_format in ('.jpg', '.jpeg', None):
+            self.params = [cv2.IMWRITE_JPEG_QUALITY, int(jpeg_quality)]
+        elif image_format == '.webp':
+            self.params = [cv2.IMWRITE_WEBP_QUALITY, int(jpeg_quality)]
+        else:
+            self.params = []
+        super().__init__(num_threads, max_pending)
+
+    def output_path(self, path):
+        # Path the image will actually be written to, after any format change
+        if self.image_format is None:
+            return path
+        return os.path.splitext(path)[0] + self.image_format
+
+    def write(self, path, image, on_done=None):
+        # on_done() is called once the image has been written (or failed), e.g. to recycle its buffer
+        path = self.output_path(path)
+        self._submit((path, image, on_done))
+        return path
+
+    def _handle(self, item):
+        path, image, on_done = item
+        try:
+            if not cv2.imwrite(path, image, self.params):
+                raise IOError("cv2.imwrite failed")
+        finally:
+            if on_done is not None:
+                on_done()
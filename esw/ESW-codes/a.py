@@ -1,8 +1,14 @@
 import cv2
 import os
+import sys
+
+# Shared frame sampler lives with the app code
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'App'))
+from frame_sampler import FrameSampler
+from video_source import open_video
 
 # Playing video from file:
-cap = cv2.VideoCapture('v4.mp4')
+cap = open_video('v4.mp4')
 
 try:
     if not os.path.exists('data'):
@@ -15,27 +21,16 @@ fps = cap.get(cv2.CAP_PROP_FPS)
 print(f"Frames per second: {fps}")
 
 # Calculate the interval to save 5 frames per second
-frame_interval = int(fps / 1)
+frame_interval = max(1, int(fps / 1))
 
-currentFrame = 0
 savedFrame = 0
 
-while True:
-    # Capture frame-by-frame
-    ret, frame = cap.read()
-
-    if not ret:
-        break  # Exit the loop if no frame is captured
-
-    # Save every 'frame_interval' frame
-    if currentFrame % frame_interval == 0:
-        name = './data/frame' + str(savedFrame) + '.jpg'
-        print('Creating...' + name)
-        cv2.imwrite(name, frame)
-        savedFrame += 1
-
-    # Increment the frame counter
-    currentFrame += 1
+# Only the frames we save get decoded
+for currentFrame, frame in FrameSampler(cap, frame_interval):
+    name = './data/frame' + str(savedFrame) + '.jpg'
+    print('Creating...' + name)
+    cv2.imwrite(name, frame)
+    savedFrame += 1
 
 # When everything is done, release the capture
 cap.release()
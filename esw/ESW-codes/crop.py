@@ -1,7 +1,13 @@
 import os
+import sys
 from PIL import Image
 import pytesseract
 import re
+import numpy as np
+
+# OCR cache shared with App/OCR.py
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'App'))
+from ocr_cache import OcrCache, crop_key, MISS
 
 # Path to the folder containing the images
 input_folder = '/home/chaitu/Desktop/ESW pics/data'
@@ -14,22 +20,39 @@ if not os.path.exists(output_folder):
 # Custom configuration for OCR
 custom_config = '--psm 12'
 
+# Timestamp overlay of full frames, same region as App/OCR.py
+TIMESTAMP_BOUNDING_BOX = (70, 1160, 545, 120)
+# App/OCR.py cache versions whose timestamps are trusted, e.g. {'easyocr': '1.7.1|0123456789-: '}
+cache_also_read = {}
+cache = OcrCache('tesseract', f"{pytesseract.get_tesseract_version()}|{custom_config}", also_read=cache_also_read)
+
+def timestamp_region(img):
+    # Pixels the cache key is computed from: the overlay of a full frame, or the whole (pre-cropped) image
+    pixels = np.array(img.convert('RGB'))[:, :, ::-1]
+    x, y, w, h = TIMESTAMP_BOUNDING_BOX
+    if pixels.shape[0] >= y + h and pixels.shape[1] >= x + w:
+        return pixels[y:y+h, x:x+w]
+    return pixels
+
 # Loop through all files in the input folder
 for filename in os.listdir(input_folder):
     if filename.endswith('.jpg') or filename.endswith('.png'):  # Adjust as needed for different formats
         image_path = os.path.join(input_folder, filename)
         img = Image.open(image_path)
 
-        # Extract text from the image
-        extracted_text = pytesseract.image_to_string(img, config=custom_config)
+        key = crop_key(timestamp_region(img))
+        timestamp = cache.get(key)
+        if timestamp is MISS:
+            # Extract text from the image
+            extracted_text = pytesseract.image_to_string(img, config=custom_config)
 
-        # Use a regular expression to find a timestamp in the format dd-mm-yyyy hh:mm:ss
-        match = re.search(r"\d{2}-\d{2}-\d{4} \d{2}:\d{2}:\d{2}", extracted_text)
+            # Use a regular expression to find a timestamp in the format dd-mm-yyyy hh:mm:ss
+            match = re.search(r"\d{2}-\d{2}-\d{4} \d{2}:\d{2}:\d{2}", extracted_text)
+            timestamp = match.group(0) if match else None
+            cache.put(key, timestamp)
 
         # Check if a match is found
-        if match:
-            # Extract the timestamp
-            timestamp = match.group(0)
+        if timestamp:
             
             # Format the timestamp to replace spaces and colons with valid filename characters
             formatted_timestamp = timestamp.replace(":", "-").replace(" ", "_")
@@ -45,3 +68,4 @@ for filename in os.listdir(input_folder):
         else:
             print(f"No valid timestamp found in the image: {filename}")
 
+cache.close()
@@ -1,7 +1,13 @@
+import os
+import sys
 import cv2
 import mediapipe as mp
 import numpy as np
 
+# Shared video decoding lives with the app code
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'App'))
+from video_source import open_video
+
 # Initialize MediaPipe Pose
 mp_pose = mp.solutions.pose
 mp_drawing = mp.solutions.drawing_utils
@@ -42,7 +48,8 @@ def detect_object_in_hand(landmarks, object_bbox, frame_shape):
 
 def main():
     video_path = 'v.mp4'
-    cap = cv2.VideoCapture(video_path)
+    # Every frame is shown, so decoding runs ahead on its own threads
+    cap = open_video(video_path)
     
     lower_color = np.array([0, 100, 100])  # Example: Red color in HSV
     upper_color = np.array([10, 255, 255])
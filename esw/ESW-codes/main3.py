@@ -1,7 +1,15 @@
+import os
+import sys
 import cv2
 import numpy as np
 from datetime import datetime
 
+# Shared background image writer lives with the app code
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'App'))
+from writers import ImageWriter
+from change_gate import ChangeGate
+from video_source import open_video
+
 def count_objects(frame, min_area=100):
     # Convert frame to grayscale
     gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
@@ -24,9 +32,9 @@ def count_objects(frame, min_area=100):
     
     return len(large_contours), closed_edges, large_contours
 
-def process_video(video_path, output_folder, diff_threshold=30, min_area=100):
+def process_video(video_path, output_folder, diff_threshold=30, min_area=100, skip_unchanged=False):
     # Open the video file
-    cap = cv2.VideoCapture(video_path)
+    cap = open_video(video_path)
     
     # Get video properties
     frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
@@ -43,11 +51,22 @@ def process_video(video_path, output_folder, diff_threshold=30, min_area=100):
         return
     
     prev_object_count, _, _ = count_objects(prev_frame, min_area=min_area)
+
+    # PNG encoding happens on background threads instead of stalling the decode loop
+    image_writer = ImageWriter()
+    # Opt-in: don't count objects in frames where no min_area-sized region changed
+    gate = ChangeGate(min_object_area=min_area) if skip_unchanged else None
+    if gate is not None:
+        gate.needs_inference(prev_frame)
     
     for frame_index in range(1, frame_count, 5):
         ret, current_frame = cap.read()
         if not ret:
             break
+
+        if gate is not None and not gate.needs_inference(current_frame):
+            print(f"No significant change in frame {frame_index}")
+            continue
         
         # Count objects in the current frame
         current_object_count, binary_frame, large_contours = count_objects(current_frame, min_area=min_area)
@@ -75,7 +94,7 @@ def process_video(video_path, output_folder, diff_threshold=30, min_area=100):
             
             # Save the result with objects on black background
             output_path = f"{output_folder}/frame_diff_{frame_index:04d}.png"
-            cv2.imwrite(output_path, black_result_frame)
+            image_writer.write(output_path, black_result_frame)
             
             print(f"Significant change detected in frame {frame_index}: {object_count_diff} object(s) difference")
         else:
@@ -84,8 +103,9 @@ def process_video(video_path, output_folder, diff_threshold=30, min_area=100):
         # Update previous frame object count
         prev_object_count = current_object_count
     
-    # Release the video capture object
+    # Release the video capture object and wait for the last images to be written
     cap.release()
+    image_writer.close()
     print("Video processing completed")
 
 # Usage example
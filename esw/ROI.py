@@ -1,8 +1,13 @@
 import os
+import sys
 import cv2
 import numpy as np
 import matplotlib.pyplot as plt
 
+# Shared camera layouts and overlap engine live with the app code
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'App'))
+from regions import load_layout
+
 
 def load_bounding_boxes(file_path):
     """
@@ -38,44 +43,16 @@ def process_image(image_path, bounding_box_file, overlap_threshold=0.5):
         y2 = int((y_center + height / 2) * image_height)
         absolute_boxes.append((x1, y1, x2, y2))
 
-    # Divide the image into 8 segments (2x4 grid)
-    rows, cols = 12, 8
-    segment_width = image_width // cols
-    segment_height = image_height // rows
-
-    clean_segments = []
-
-    # for i in range(8,rows-2):
-    #     for j in range(1,cols-1):
-    for i in range(rows):
-        for j in range(cols):
-            x1 = j * segment_width
-            y1 = i * segment_height
-            x2 = x1 + segment_width
-            y2 = y1 + segment_height
-            segment_area = segment_width * segment_height
-
-            # Calculate intersection area with bounding boxes
-            intersection_area = 0
-            for bx1, by1, bx2, by2 in absolute_boxes:
-                intersect_x1 = max(x1, bx1)
-                intersect_y1 = max(y1, by1)
-                intersect_x2 = min(x2, bx2)
-                intersect_y2 = min(y2, by2)
-
-                if intersect_x1 < intersect_x2 and intersect_y1 < intersect_y2:
-                    intersection_area += (intersect_x2 - intersect_x1) * (intersect_y2 - intersect_y1)
-
-            # Determine if the segment is clean or dirty
-            if intersection_area / segment_area > overlap_threshold:
-                clean_segments.append(False)
-                color = (0, 0, 255)  # Red for dirty
-            else:
-                clean_segments.append(True)
-                color = (0, 255, 0)  # Green for clean
-
-            # Draw the segment rectangle on the image
-            cv2.rectangle(image, (x1, y1), (x2, y2), color, 2)
+    # Every cell of the 12x8 grid (see App/cameras/all-12x8.json) and the boxes' overlap with it
+    cells, dirty = load_layout('all-12x8').dirty(absolute_boxes, image_width, image_height, overlap_threshold)
+    # Determine if each segment is clean or dirty
+    clean_segments = [not is_dirty for is_dirty in dirty.tolist()]
+
+    for (x1, y1, x2, y2), is_dirty in zip(cells.tolist(), dirty):
+        color = (0, 0, 255) if is_dirty else (0, 255, 0)  # Red for dirty, green for clean
+
+        # Draw the segment rectangle on the image
+        cv2.rectangle(image, (x1, y1), (x2, y2), color, 2)
 
     # Display the final image
     plt.figure(figsize=(10, 5))
@@ -101,8 +78,7 @@ for image_file in os.listdir(image_folder):
         image_path = os.path.join(image_folder, image_file)
         
         # Find corresponding bounding box file
-        boundin
-g_box_file = os.path.join(bounding_box_folder, os.path.splitext(image_file)[0] + ".txt")
+        bounding_box_file = os.path.join(bounding_box_folder, os.path.splitext(image_file)[0] + ".txt")
         if os.path.exists(bounding_box_file):
             print(f"Processing image: {image_path}")
             clean_segments = process_image(image_path, bounding_box_file, overlap_threshold)
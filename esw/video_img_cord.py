@@ -1,17 +1,32 @@
-from inference_sdk import InferenceHTTPClient
 import cv2
-import tempfile
 import os
+import sys
+
+# Inference backends and the frame sampler live with the app code
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'App'))
+from inference_backends import FallbackBackend, HttpBackend, RoboflowBackend, LOCAL_INFERENCE_URL
+from frame_sampler import FrameSampler
+from video_source import open_video
+
+# "local": App/inference_server.py serving best1.pt, falling back to the hosted model when it isn't running
+# "roboflow": the hosted model only
+INFERENCE_BACKEND = os.environ.get("INFERENCE_BACKEND", "local")
+MAX_IN_FLIGHT = 4  # Frames being inferred at the same time
+
+
+def roboflow_backend():
+    return RoboflowBackend(model_id="final-final-3/1", api_key="u3NpMO9V1kTHv2REIkTi", max_in_flight=MAX_IN_FLIGHT)
+
 
 # Initialize the client
-CLIENT = InferenceHTTPClient(
-    api_url="https://detect.roboflow.com",
-    api_key="u3NpMO9V1kTHv2REIkTi"
-)
+if INFERENCE_BACKEND == "roboflow":
+    BACKEND = roboflow_backend()
+else:
+    BACKEND = FallbackBackend(HttpBackend(LOCAL_INFERENCE_URL, max_in_flight=MAX_IN_FLIGHT), roboflow_backend)
 
 # Initialize the video capture
 video_path = "hello.mp4"
-cap = cv2.VideoCapture(video_path)  # Load video file
+cap = open_video(video_path)  # Load video file
 
 # Get video properties
 fps = int(cap.get(cv2.CAP_PROP_FPS))
@@ -30,27 +45,12 @@ os.makedirs(coord_dir, exist_ok=True)
 confidence_threshold = 0.4
 
 # Calculate frame skip rate for 3 FPS (process 1 frame for every (fps // 3) frames)
-frame_skip_rate = fps // 3
-
-frame_idx = 0
-while cap.isOpened():
-    ret, frame = cap.read()
-    if not ret:
-        break
-    
-    # Skip frames to process 3 FPS
-    if frame_idx % frame_skip_rate != 0:
-        frame_idx += 1
-        continue
-
-    # Create a temporary file to save the frame as an image
-    with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as temp_image:
-        temp_image_path = temp_image.name
-        cv2.imwrite(temp_image_path, frame)
-
-        # Perform inference on the temporary image file
-        result = CLIENT.infer(temp_image_path, model_id="final-final-3/1")
+frame_skip_rate = max(1, fps // 3)
 
+# Only the sampled frames are decoded; up to MAX_IN_FLIGHT of them are being inferred at once.
+# Frames are JPEG-encoded in memory and results come back in frame order.
+frames = FrameSampler(cap, frame_skip_rate)
+for (frame_idx, frame), result in BACKEND.infer_many(((frame_idx, frame), frame) for frame_idx, frame in frames):
     # Define image and coordinate file paths
     image_file_path = os.path.join(image_dir, f"frame_{frame_idx}.jpg")
     coord_file_path = os.path.join(coord_dir, f"frame_{frame_idx}.txt")
@@ -83,13 +83,9 @@ while cap.isOpened():
         for bbox in bounding_boxes:
             coord_file.write(f"{bbox}\n")
 
-    # Clean up the temporary file after processing the frame
-    os.remove(temp_image_path)
-
-    frame_idx += 1
-
 # Release the video capture object
-cap.release()
+frames.cap.release()
+BACKEND.close()
 
 print(f"Images saved to: {image_dir}")
 print(f"Coordinates saved to: {coord_dir}")